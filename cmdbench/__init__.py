@@ -1,5 +1,23 @@
 from cmdbench.core import benchmark_command as benchmark_command
 from cmdbench.core import benchmark_command_generator as benchmark_command_generator
+from cmdbench.core import BenchmarkMonitor as BenchmarkMonitor
+from cmdbench.core import compare_commands as compare_commands
+from cmdbench.core import compare_commands_generator as compare_commands_generator
+from cmdbench.core import sweep_command as sweep_command
+from cmdbench.core import sweep_command_generator as sweep_command_generator
+from cmdbench.aio import benchmark_command_async as benchmark_command_async
+from cmdbench.aio import benchmark_command_async_generator as benchmark_command_async_generator
+from cmdbench.function import benchmark_function as benchmark_function
+from cmdbench.function import benchmark_function_generator as benchmark_function_generator
+from cmdbench.distributed import benchmark_command_distributed as benchmark_command_distributed
+from cmdbench.distributed import benchmark_command_distributed_generator as benchmark_command_distributed_generator
+from cmdbench.distributed import sweep_command_distributed as sweep_command_distributed
+from cmdbench.distributed import sweep_command_distributed_generator as sweep_command_distributed_generator
+from cmdbench.distributed import run_worker as run_worker
+from cmdbench.cgroup import use_supervisor_cgroup as use_supervisor_cgroup
 
 from cmdbench.utils import BenchmarkDict as BenchmarkDict
-from cmdbench.result import BenchmarkResults as BenchmarkResults
\ No newline at end of file
+from cmdbench.result import BenchmarkResults as BenchmarkResults
+from cmdbench.comparison import ComparisonResults as ComparisonResults
+from cmdbench.sweep import SweepResults as SweepResults
+from cmdbench.hooks import split_by_cache_state as split_by_cache_state
\ No newline at end of file
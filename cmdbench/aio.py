@@ -0,0 +1,321 @@
+from .utils import *
+from .result import BenchmarkResults
+from .core import raw_to_final_benchmark, validate_benchmark_options, get_command_argv, get_monitored_process, close_monitored_process, read_disk_counters, io_counter_keys, is_linux, is_macos, DEFAULT_SAMPLE_INTERVAL_MS, DEFAULT_MIN_RUNS, DEFAULT_MAX_RUNS
+from .capture import OutputSink, CAPTURE_CHUNK_SIZE
+from .process_table import ProcessTable
+import numpy as np
+import asyncio
+import weakref
+import sys
+import psutil
+import click
+
+# asyncio API: benchmarks commands from an event loop.
+#
+# Commands are started with asyncio.create_subprocess_exec and their outputs are read by tasks of the
+# loop. Instead of a monitor with collector processes per benchmark, one sampler task per event loop
+# samples every command being benchmarked in the loop, so hundreds of concurrent benchmarks cost one
+# task. Samples are taken in the loop's thread: sampling a large process tree delays the loop's
+# other tasks, and a busy loop delays the samples.
+#
+# The process is reaped by asyncio, so there are no GNU Time (or rusage) results: the CPU times and
+# disk counters are the last ones sampled, and the run time ends when the loop sees the command exit.
+
+async def benchmark_command_async(command, iterations_num = 1, raw_data = False, sample_interval_ms = DEFAULT_SAMPLE_INTERVAL_MS, sampler_backend = "auto", stdout_capture = "keep", stderr_capture = "keep", time_resolution = "ms", warmup = 0):
+    benchmark_results = BenchmarkResults()
+    async for benchmark_result in benchmark_command_async_generator(command, iterations_num, raw_data, sample_interval_ms, sampler_backend, stdout_capture, stderr_capture, time_resolution, warmup):
+        benchmark_results.add_benchmark_result(benchmark_result)
+    return benchmark_results
+
+async def benchmark_command_async_generator(command, iterations_num = 1, raw_data = False, sample_interval_ms = DEFAULT_SAMPLE_INTERVAL_MS, sampler_backend = "auto", stdout_capture = "keep", stderr_capture = "keep", time_resolution = "ms", warmup = 0):
+    validate_benchmark_options(iterations_num, sample_interval_ms, sampler_backend, "rusage", stdout_capture, stderr_capture, time_resolution, 1, None, warmup, DEFAULT_MIN_RUNS, DEFAULT_MAX_RUNS, None, "execution_time", None)
+
+    for iteration_index in range(warmup + iterations_num):
+        raw_benchmark_result = await single_benchmark_command_raw_async(command, sample_interval_ms, sampler_backend, stdout_capture, stderr_capture)
+        if iteration_index < warmup:
+            continue
+        yield BenchmarkResults([raw_benchmark_result if raw_data else raw_to_final_benchmark(raw_benchmark_result, time_resolution)])
+
+
+# Samplers of the running event loops
+_samplers = weakref.WeakKeyDictionary()
+
+def get_async_sampler():
+    loop = asyncio.get_event_loop()
+    sampler = _samplers.get(loop)
+    if sampler is None:
+        sampler = AsyncSampler(loop)
+        _samplers[loop] = sampler
+    return sampler
+
+# Samples every target of an event loop from a single task, each on its own fixed-rate schedule
+# (the same grid as SampleScheduler: deadlines at start + n * interval, overrun ones skipped).
+# The task runs while there are targets, and is started again for the next ones.
+class AsyncSampler():
+    def __init__(self, loop):
+        self._loop = loop
+        self._targets = set()
+        self._task = None
+        self._wakeup = None
+
+    def add(self, target):
+        self._targets.add(target)
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+        else:
+            # The new target gets its first sample right away
+            self._wakeup.set()
+
+    def remove(self, target):
+        self._targets.discard(target)
+
+    async def _run(self):
+        while len(self._targets) > 0:
+            now = current_nano_time()
+            for target in list(self._targets):
+                if target.next_sample_time <= now:
+                    target.sample()
+                    target.schedule_next_sample(current_nano_time())
+                    # The benchmarking task raises the error, the other targets keep being sampled
+                    if target.error is not None:
+                        self.remove(target)
+            if len(self._targets) == 0:
+                break
+
+            next_sample_time = min(target.next_sample_time for target in self._targets)
+            self._wakeup.clear()
+            timeout = max(next_sample_time - current_nano_time(), 0) / 1e9
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+# A command's process tree sampled by the AsyncSampler. Takes the samples of collect_time_series
+# and collect_fixed_data at once.
+class AsyncSampledTarget():
+    def __init__(self, pid, execution_start, sample_interval_ms, sampler_backend):
+        self.process = get_monitored_process(pid, sampler_backend)
+        self.execution_start = execution_start
+        self.interval = int(sample_interval_ms * 1e6)
+        self.next_sample_time = current_nano_time()
+        self._start_time = self.next_sample_time
+        self._ticks = 0
+
+        self.sample_nanoseconds = []
+        self.cpu_percentages = []
+        self.memory_bytes = []
+        self.disk_counters = {disk_series_key: [] for disk_series_key in DISK_SERIES_KEYS}
+        self.memory_max = 0
+        self.memory_perprocess_max = 0
+        self.cpu_times = None
+        self.disk_io_counters = None
+        self.children_table = ProcessTable()
+        # CPU time the loop's thread spent sampling the target
+        self.monitor_cpu_time = 0.0
+        self.error = None
+        self._had_permission = False
+
+    def schedule_next_sample(self, now):
+        self._ticks += 1
+        self.next_sample_time = self._start_time + self._ticks * self.interval
+        if self.interval > 0 and self.next_sample_time <= now:
+            self._ticks += (now - self.next_sample_time) // self.interval + 1
+            self.next_sample_time = self._start_time + self._ticks * self.interval
+
+    def sample(self):
+        sample_cpu_time_start = monitor_cpu_time()
+        try:
+            self._sample()
+        except Exception as error:
+            self.error = error
+        self.monitor_cpu_time += monitor_cpu_time() - sample_cpu_time_start
+
+    def _sample(self):
+        p = self.process
+        if not p.is_running():
+            return
+        try:
+            time_from_monitoring_start = current_nano_time() - self.execution_start
+
+            with p.oneshot():
+                self.cpu_times = p.cpu_times()
+                if not is_macos:
+                    self.disk_io_counters = p.io_counters()
+                cpu_percentage = p.cpu_percent()
+                memory_usage = p.memory_info().rss
+            disk_counters = tuple(getattr(self.disk_io_counters, disk_series_key, 0) for disk_series_key in DISK_SERIES_KEYS)
+            self.memory_perprocess_max = max(self.memory_perprocess_max, memory_usage)
+
+            current_children_pids = set()
+            for child in p.children(recursive = True):
+                try:
+                    with child.oneshot():
+                        child_memory_usage = child.memory_info().rss
+                        child_disk_counters = read_disk_counters(child)
+                        child_entry = self.children_table.get_entry(child)
+                        # psutil calculates children usage for us on linux. Otherwise we save the values ourselves
+                        if not is_linux:
+                            child_entry.cpu_times = child.cpu_times()
+                    child_cpu_usage = child_entry.process.cpu_percent()
+                except psutil.NoSuchProcess:
+                    # The child might end while we are measuring it
+                    continue
+
+                memory_usage += child_memory_usage
+                self.memory_perprocess_max = max(self.memory_perprocess_max, child_memory_usage)
+                cpu_percentage += child_cpu_usage
+                disk_counters = tuple(map(sum, zip(disk_counters, child_disk_counters)))
+                current_children_pids.add(child.pid)
+            self.children_table.prune(current_children_pids)
+
+            self.memory_max = max(self.memory_max, memory_usage)
+            self.sample_nanoseconds.append(time_from_monitoring_start)
+            self.cpu_percentages.append(cpu_percentage)
+            self.memory_bytes.append(memory_usage)
+            for disk_series_key, disk_counter in zip(DISK_SERIES_KEYS, disk_counters):
+                self.disk_counters[disk_series_key].append(disk_counter)
+            self._had_permission = True
+        except psutil.AccessDenied:
+            # Same reasoning as in the collect_fixed_data function
+            if not self._had_permission:
+                raise
+        except psutil.NoSuchProcess:
+            # The process might end while we are measuring resources
+            pass
+
+    def close(self):
+        close_monitored_process(self.process)
+
+
+async def read_output_async(stream, sink):
+    sink.open()
+    try:
+        while True:
+            chunk = await stream.read(CAPTURE_CHUNK_SIZE)
+            if len(chunk) == 0:
+                break
+            sink.write(chunk)
+    finally:
+        sink.close()
+
+# Async counterpart of single_benchmark_command_raw, with the same raw results except the
+# GNU Time ones (and cgroup, jobs and monitors, which it doesn't support)
+async def single_benchmark_command_raw_async(command, sample_interval_ms = DEFAULT_SAMPLE_INTERVAL_MS, sampler_backend = "auto", stdout_capture = "keep", stderr_capture = "keep"):
+    commands_list = get_command_argv(command)
+    stdout_sink = OutputSink(stdout_capture)
+    stderr_sink = OutputSink(stderr_capture)
+
+    # Taken before the await: by the time it returns, the event loop might have run other tasks while the command was running
+    execution_start = current_nano_time()
+    process = await asyncio.create_subprocess_exec(*commands_list, stdout = asyncio.subprocess.PIPE, stderr = asyncio.subprocess.PIPE)
+
+    output_readers = asyncio.gather(read_output_async(process.stdout, stdout_sink), read_output_async(process.stderr, stderr_sink))
+
+    sampler = get_async_sampler()
+    target = None
+    try:
+        target = AsyncSampledTarget(process.pid, execution_start, sample_interval_ms, sampler_backend)
+    except psutil.NoSuchProcess:
+        # The process might have already ended
+        click.secho("Warning: The process ended before cmdbench could start monitoring it.", fg = "yellow")
+    if target is not None:
+        sampler.add(target)
+
+    try:
+        exit_code = await process.wait()
+        execution_end = current_nano_time()
+        await output_readers
+    finally:
+        if target is not None:
+            sampler.remove(target)
+            target.close()
+        # When the benchmark is cancelled
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        if not output_readers.done():
+            output_readers.cancel()
+
+    if target is not None and target.error is not None:
+        raise target.error
+
+    cpu_user_time, cpu_system_time = 0, 0
+    memory_max, memory_perprocess_max = 0, 0
+    sample_nanoseconds, cpu_percentages, memory_values = [], [], []
+    monitor_total_cpu_time = 0.0
+    disk_io_counters = None
+    disk_counters = {disk_series_key: [] for disk_series_key in DISK_SERIES_KEYS}
+    if target is not None:
+        memory_max, memory_perprocess_max = target.memory_max, target.memory_perprocess_max
+        sample_nanoseconds, cpu_percentages, memory_values = target.sample_nanoseconds, target.cpu_percentages, target.memory_bytes
+        monitor_total_cpu_time = target.monitor_cpu_time
+        disk_io_counters = target.disk_io_counters
+        disk_counters = target.disk_counters
+        if target.cpu_times is not None:
+            # psutil calculates children usage for us on linux. Otherwise we sum the values we saved.
+            if is_linux:
+                children_user_cpu_time, children_system_cpu_time = target.cpu_times.children_user, target.cpu_times.children_system
+            else:
+                child_cpu_times = [entry.cpu_times for entry in target.children_table.all_entries() if entry.cpu_times is not None]
+                children_user_cpu_time = sum(cpu_times[0] for cpu_times in child_cpu_times)
+                children_system_cpu_time = sum(cpu_times[1] for cpu_times in child_cpu_times)
+            cpu_user_time = target.cpu_times.user + children_user_cpu_time
+            cpu_system_time = target.cpu_times.system + children_system_cpu_time
+
+    sample_rate = 0
+    if len(sample_nanoseconds) > 1 and sample_nanoseconds[-1] > sample_nanoseconds[0]:
+        sample_rate = float((len(sample_nanoseconds) - 1) / ((sample_nanoseconds[-1] - sample_nanoseconds[0]) / 1e9))
+
+    resource_usages = {
+        "psutil":
+        {
+            "cpu":
+            {
+                "total_time": cpu_user_time + cpu_system_time,
+                "user_time": cpu_user_time,
+                "system_time": cpu_system_time
+            },
+            "memory":
+            {
+                "max": memory_max,
+                "max_perprocess": memory_perprocess_max,
+            },
+            "process":
+            {
+                "execution_time": (execution_end - execution_start) / 1e9
+            }
+        },
+        "general":
+        {
+            "stdout_data": stdout_sink.get_output(sys.stdout.encoding),
+            "stderr_data": stderr_sink.get_output(sys.stderr.encoding),
+            "stdout_bytes": stdout_sink.bytes_count,
+            "stdout_lines": stdout_sink.lines_count,
+            "stderr_bytes": stderr_sink.bytes_count,
+            "stderr_lines": stderr_sink.lines_count,
+            "exit_code": exit_code
+        },
+        "time_series":
+        {
+            "sample_nanoseconds": np.array(sample_nanoseconds, dtype = np.int64),
+            "cpu_percentages": np.array(cpu_percentages, dtype = np.float64),
+            "memory_bytes": np.array(memory_values, dtype = np.int64)
+        },
+        "sampling":
+        {
+            "interval_ms": sample_interval_ms,
+            "sample_count": len(sample_nanoseconds),
+            "sample_rate": sample_rate,
+            "monitor_cpu_time": monitor_total_cpu_time
+        }
+    }
+
+    if not is_macos:
+        resource_usages["psutil"]["disk"] = {
+            "io_counters": {io_counter_key: getattr(disk_io_counters, io_counter_key, 0) for io_counter_key in io_counter_keys}
+        }
+        resource_usages["time_series"].update(get_disk_rates(sample_nanoseconds, disk_counters))
+
+    return resource_usages
@@ -0,0 +1,125 @@
+import collections
+import threading
+
+# Capture modes for the command's stdout and stderr:
+#   "keep"         keeps the whole output in memory (the default)
+#   "discard"      drops the output as it is read
+#   "tail:<KB>"    keeps only the last <KB> kilobytes of the output
+#   "file:<path>"  writes the output to the file at <path> (overwritten on every run)
+#   a callable     gets called with every chunk (bytes) of the output as it is read
+# In every mode, the output is read through a pipe so its bytes and lines can be counted.
+CAPTURE_MODES = ["keep", "discard", "tail:<KB>", "file:<path>"]
+
+# Maximum bytes read from the pipe at once
+CAPTURE_CHUNK_SIZE = 65536
+
+# Returns the capture mode as a (kind, argument) tuple, raises an exception if it's not valid
+def parse_capture_mode(mode):
+    if callable(mode):
+        return ("callback", mode)
+    if mode in ["keep", "discard"]:
+        return (mode, None)
+    if isinstance(mode, str):
+        kind, _, argument = mode.partition(":")
+        if kind == "tail":
+            try:
+                tail_kilobytes = float(argument)
+            except ValueError:
+                tail_kilobytes = -1
+            if tail_kilobytes > 0:
+                return (kind, int(tail_kilobytes * 1024))
+        if kind == "file" and len(argument) > 0:
+            return (kind, argument)
+    raise Exception("Unknown output capture mode %s, expected a callable or one of: %s" % (mode, ", ".join(CAPTURE_MODES)))
+
+
+# Handles the output of the command chunk by chunk in one of the capture modes, counting the bytes
+# and lines (newline characters, like wc -l) that went through it.
+class OutputSink():
+    def __init__(self, mode):
+        self._kind, self._argument = parse_capture_mode(mode)
+        self._chunks = collections.deque()
+        self._kept_bytes = 0
+        self._output_file = None
+        self.bytes_count = 0
+        self.lines_count = 0
+
+    def open(self):
+        if self._kind == "file":
+            self._output_file = open(self._argument, "wb")
+
+    def write(self, chunk):
+        self.bytes_count += len(chunk)
+        self.lines_count += chunk.count(b"\n")
+
+        if self._kind == "keep":
+            self._chunks.append(chunk)
+        elif self._kind == "tail":
+            self._keep_tail(chunk)
+        elif self._kind == "file":
+            self._output_file.write(chunk)
+        elif self._kind == "callback":
+            self._argument(chunk)
+
+    def _keep_tail(self, chunk):
+        tail_size = self._argument
+        self._chunks.append(chunk[-tail_size:])
+        self._kept_bytes += len(self._chunks[-1])
+        while self._kept_bytes - len(self._chunks[0]) >= tail_size:
+            self._kept_bytes -= len(self._chunks.popleft())
+
+    def close(self):
+        if self._output_file is not None:
+            self._output_file.close()
+            self._output_file = None
+
+    # The output kept in memory (decoded), None if the mode doesn't keep it
+    def get_output(self, encoding):
+        if self._kind not in ["keep", "tail"]:
+            return None
+        data = b"".join(self._chunks)
+        if self._kind == "tail":
+            data = data[-self._argument:]
+        return data.decode(encoding, errors = "replace")
+
+
+# Reads a pipe of the command until it closes, on a thread of its own so the command never blocks
+# on a full pipe.
+class OutputCapture():
+    def __init__(self, pipe, mode):
+        self._pipe = pipe
+        self._sink = OutputSink(mode)
+        self._error = None
+        self._thread = threading.Thread(target = self._read, daemon = True)
+        self._thread.start()
+
+    @property
+    def bytes_count(self):
+        return self._sink.bytes_count
+
+    @property
+    def lines_count(self):
+        return self._sink.lines_count
+
+    def _read(self):
+        try:
+            self._sink.open()
+            while True:
+                chunk = self._pipe.read1(CAPTURE_CHUNK_SIZE)
+                if len(chunk) == 0:
+                    break
+                self._sink.write(chunk)
+        except Exception as error:
+            # Raised from join, in the benchmarking thread
+            self._error = error
+        finally:
+            self._sink.close()
+            self._pipe.close()
+
+    # Waits for the command to close the pipe.
+    # Returns the output kept in memory (decoded) or None if the mode doesn't keep it.
+    def join(self, encoding):
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._sink.get_output(encoding)
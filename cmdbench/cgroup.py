@@ -0,0 +1,316 @@
+import secrets
+import atexit
+import psutil
+import click
+import errno
+import time
+import os
+
+# cgroup v2 accounting (linux only).
+#
+# The benchmarked command is started inside a transient leaf cgroup created under the cgroup
+# cmdbench runs in (it moves itself there between fork and exec). The kernel then accounts every process of the command, including the ones
+# living shorter than a sampling interval, and reports exact aggregates:
+#   - cpu.stat: user and system CPU time of all processes that ever ran in the cgroup
+#   - memory.peak: highest memory usage of the cgroup (linux >= 5.19)
+#   - io.stat: bytes and operations per block device
+# memory.current (the cgroup's usage right now) replaces the RSS sum in the time series.
+#
+# Creating the leaf requires the cgroup to be delegated to the user running cmdbench (e.g. with
+# "systemd-run --user --scope -p Delegate=yes ...") with the memory controller enabled.
+#
+# The kernel only enables controllers for the children of a cgroup without processes of its own
+# (except the root cgroup). When cmdbench was started in a cgroup with processes, use_supervisor_cgroup
+# (which the CLI calls for --cgroup) moves cmdbench and its processes to a leaf of their own,
+# cmdbench-supervisor, next to the benchmark cgroups. It's never done implicitly: it moves the whole
+# python process. At exit, they move back and the leaf is removed.
+
+class CgroupError(Exception):
+    pass
+
+# Controllers the benchmark cgroups need: memory, and io for the disk stats when it is available
+CGROUP_CONTROLLERS = ["memory", "io"]
+
+SUPERVISOR_CGROUP_NAME = "cmdbench-supervisor"
+
+def find_cgroup2_mount():
+    try:
+        with open("/proc/self/mountinfo") as mountinfo_file:
+            for line in mountinfo_file:
+                fields = line.split()
+                # Optional fields end with a "-" followed by the filesystem type
+                separator_index = fields.index("-")
+                if fields[separator_index + 1] == "cgroup2":
+                    return fields[4]
+    except OSError:
+        pass
+    return None
+
+def get_own_cgroup():
+    try:
+        with open("/proc/self/cgroup") as cgroup_file:
+            for line in cgroup_file:
+                if line.startswith("0::"):
+                    return line[3:].strip()
+    except OSError:
+        pass
+    return None
+
+# Parses files made of "key value" lines, like cpu.stat
+def parse_flat_keyed(data):
+    values = {}
+    for line in data.splitlines():
+        tokens = line.split()
+        if len(tokens) == 2:
+            values[tokens[0]] = int(tokens[1])
+    return values
+
+# Sums io.stat's "<major>:<minor> rbytes=.. wbytes=.. rios=.. wios=.." lines over all devices
+def parse_io_stat(data):
+    totals = {"rbytes": 0, "wbytes": 0, "rios": 0, "wios": 0}
+    for line in data.splitlines():
+        for token in line.split()[1:]:
+            key, _, value = token.partition("=")
+            if key in totals:
+                totals[key] += int(value)
+    return totals
+
+def read_cgroup_pids(cgroup_path):
+    with open(os.path.join(cgroup_path, "cgroup.procs")) as procs_file:
+        return [int(pid) for pid in procs_file.read().split()]
+
+def move_process(pid, cgroup_path):
+    try:
+        with open(os.path.join(cgroup_path, "cgroup.procs"), "w") as procs_file:
+            procs_file.write(str(pid))
+    except ProcessLookupError:
+        pass
+
+def get_own_cgroup_path():
+    cgroup_mount = find_cgroup2_mount()
+    if cgroup_mount is None:
+        raise CgroupError("no cgroup v2 hierarchy is mounted")
+    own_cgroup = get_own_cgroup()
+    if own_cgroup is None:
+        raise CgroupError("cmdbench is not running in a cgroup v2 hierarchy")
+    return os.path.join(cgroup_mount, own_cgroup.lstrip("/"))
+
+# The cgroup the benchmark cgroups are created in: the one cmdbench runs in, or the parent of its
+# supervisor leaf. Returns its path and whether it is the root cgroup.
+def get_parent_cgroup():
+    own_path = get_own_cgroup_path()
+    if os.path.basename(own_path) == SUPERVISOR_CGROUP_NAME:
+        return os.path.dirname(own_path), False
+    return own_path, get_own_cgroup() == "/"
+
+# Controllers the benchmark cgroups need that the parent has, but doesn't enable for its children yet
+def get_missing_controllers(parent_path):
+    try:
+        with open(os.path.join(parent_path, "cgroup.controllers")) as controllers_file:
+            available_controllers = controllers_file.read().split()
+        with open(os.path.join(parent_path, "cgroup.subtree_control")) as subtree_control_file:
+            enabled_controllers = subtree_control_file.read().split()
+    except OSError:
+        return []
+    return [controller for controller in CGROUP_CONTROLLERS if controller in available_controllers and controller not in enabled_controllers]
+
+# Raises a CgroupError telling why benchmark cgroups can't be used, without changing anything
+def check_benchmark_cgroup_support():
+    parent_path, is_root = get_parent_cgroup()
+    try:
+        with open(os.path.join(parent_path, "cgroup.controllers")) as controllers_file:
+            available_controllers = controllers_file.read().split()
+    except OSError as error:
+        raise CgroupError("can not read the controllers of %s (%s)" % (parent_path, error.strerror))
+    if "memory" not in available_controllers:
+        raise CgroupError("the memory controller is not enabled in %s" % parent_path)
+    if not os.access(parent_path, os.W_OK):
+        raise CgroupError("can not create a cgroup in %s (%s)" % (parent_path, os.strerror(errno.EACCES)))
+    # Moving a process needs write access to the destination and to the common ancestor
+    if not os.access(os.path.join(parent_path, "cgroup.procs"), os.W_OK):
+        raise CgroupError("processes can not be moved to cgroups in %s" % parent_path)
+
+    if len(get_missing_controllers(parent_path)) > 0:
+        if not os.access(os.path.join(parent_path, "cgroup.subtree_control"), os.W_OK):
+            raise CgroupError("can not enable controllers in %s (%s)" % (parent_path, os.strerror(errno.EACCES)))
+        check_no_internal_processes(parent_path, is_root)
+
+def check_no_internal_processes(parent_path, is_root):
+    pids = read_cgroup_pids(parent_path)
+    if not is_root and len(pids) > 0:
+        raise CgroupError("processes are in %s (%s), controllers can only be enabled for cgroups without processes; "
+            "cmdbench.use_supervisor_cgroup() (done by cmdbench --cgroup) moves cmdbench out of it" % (parent_path, ", ".join(map(str, pids))))
+
+# Moves cmdbench and its processes (e.g. its monitor's workers) out of the cgroup it runs in, to its
+# supervisor leaf, when that's what keeps the controllers from being enabled for the benchmark cgroups.
+# At exit, they move back and the leaf is removed. Returns whether cmdbench runs in the supervisor leaf.
+def use_supervisor_cgroup():
+    try:
+        own_path = get_own_cgroup_path()
+    except CgroupError:
+        # Without a cgroup v2 hierarchy, there's nothing to move out of
+        return False
+    if os.path.basename(own_path) == SUPERVISOR_CGROUP_NAME:
+        return True
+    parent_path, is_root = get_parent_cgroup()
+    if is_root or len(get_missing_controllers(parent_path)) == 0:
+        return False
+
+    supervisor_path = os.path.join(parent_path, SUPERVISOR_CGROUP_NAME)
+
+    try:
+        os.mkdir(supervisor_path)
+    except FileExistsError:
+        pass
+    except OSError as error:
+        raise CgroupError("can not create a cgroup in %s (%s)" % (parent_path, error.strerror))
+    atexit.register(leave_supervisor_cgroup, parent_path, supervisor_path)
+
+    try:
+        own_pids = [os.getpid()] + [child.pid for child in psutil.Process().children(recursive = True)]
+    except psutil.Error:
+        own_pids = [os.getpid()]
+    parent_pids = read_cgroup_pids(parent_path)
+    for pid in own_pids:
+        if pid not in parent_pids:
+            continue
+        try:
+            move_process(pid, supervisor_path)
+        except OSError as error:
+            raise CgroupError("can not move cmdbench to %s (%s)" % (supervisor_path, error.strerror))
+
+    other_pids = read_cgroup_pids(parent_path)
+    if len(other_pids) > 0:
+        raise CgroupError("processes other than cmdbench's are in %s (%s), controllers can only be enabled for cgroups without processes" % (parent_path, ", ".join(map(str, other_pids))))
+    return True
+
+# Undoes use_supervisor_cgroup: the processes can only move back once the parent enables no controllers
+# for its children, so the ones cmdbench enabled are disabled first
+def leave_supervisor_cgroup(parent_path, supervisor_path):
+    try:
+        for controller in _enabled_controllers.pop(parent_path, []):
+            with open(os.path.join(parent_path, "cgroup.subtree_control"), "w") as subtree_control_file:
+                subtree_control_file.write("-" + controller)
+        for pid in read_cgroup_pids(supervisor_path):
+            move_process(pid, parent_path)
+        os.rmdir(supervisor_path)
+    except FileNotFoundError:
+        pass
+    except OSError as error:
+        click.secho("Warning: the cgroup %s could not be removed (%s)." % (supervisor_path, error.strerror), fg = "yellow")
+
+# Controllers cmdbench enabled, per parent cgroup
+_enabled_controllers = {}
+
+
+class BenchmarkCgroup():
+    def __init__(self):
+        parent_path, is_root = get_parent_cgroup()
+        self._enable_controllers(parent_path, is_root)
+
+        self.path = os.path.join(parent_path, "cmdbench-%s-%s" % (os.getpid(), secrets.token_hex(3)))
+        try:
+            os.mkdir(self.path)
+        except OSError as error:
+            raise CgroupError("can not create a cgroup in %s (%s)" % (parent_path, error.strerror))
+
+        self._procs_path = os.path.join(self.path, "cgroup.procs")
+        self.controllers = self._read("cgroup.controllers").split()
+        # Moving a process needs write access to the destination and to the common ancestor
+        can_move_processes = os.access(self._procs_path, os.W_OK) and os.access(os.path.join(parent_path, "cgroup.procs"), os.W_OK)
+        if "memory" not in self.controllers or not can_move_processes:
+            self.remove()
+            if not can_move_processes:
+                raise CgroupError("processes can not be moved to cgroups in %s" % parent_path)
+            raise CgroupError("the memory controller is not enabled in %s" % parent_path)
+
+    # Makes the memory and io controllers available to the cgroups we create, if they aren't yet.
+    # Controllers the parent doesn't have are left out (a missing memory controller is checked by the caller).
+    @staticmethod
+    def _enable_controllers(parent_path, is_root):
+        missing_controllers = get_missing_controllers(parent_path)
+        if len(missing_controllers) == 0:
+            return
+        check_no_internal_processes(parent_path, is_root)
+
+        for controller in missing_controllers:
+            try:
+                with open(os.path.join(parent_path, "cgroup.subtree_control"), "w") as subtree_control_file:
+                    subtree_control_file.write("+" + controller)
+            except OSError as error:
+                raise CgroupError("can not enable the %s controller in %s (%s)" % (controller, parent_path, error.strerror))
+            _enabled_controllers.setdefault(parent_path, []).append(controller)
+
+    def _read(self, name):
+        with open(os.path.join(self.path, name)) as cgroup_file:
+            return cgroup_file.read()
+
+    # Moves the calling process into the cgroup.
+    # Used as the target command's preexec_fn, so it runs in the child right before exec: it only
+    # makes system calls, on a path prepared beforehand.
+    def add_current_process(self):
+        procs_fd = os.open(self._procs_path, os.O_WRONLY)
+        try:
+            os.write(procs_fd, b"0")
+        finally:
+            os.close(procs_fd)
+
+    # Has the kernel enforce the limit: the command gets OOM killed instead of going over it.
+    # Swap is disabled as well (when the swap controller allows it), so going over doesn't swap it out instead.
+    def set_memory_limit(self, memory_limit):
+        with open(os.path.join(self.path, "memory.max"), "w") as memory_max_file:
+            memory_max_file.write(str(int(memory_limit)))
+        try:
+            with open(os.path.join(self.path, "memory.swap.max"), "w") as swap_max_file:
+                swap_max_file.write("0")
+        except OSError:
+            pass
+
+    # Processes the kernel killed for going over memory.max
+    def read_oom_kills(self):
+        return parse_flat_keyed(self._read("memory.events")).get("oom_kill", 0)
+
+    def read_cpu_time(self):
+        return parse_flat_keyed(self._read("cpu.stat"))["usage_usec"] / 1e6
+
+    def read_pids(self):
+        return read_cgroup_pids(self.path)
+
+    def read_stats(self):
+        cpu_stat = parse_flat_keyed(self._read("cpu.stat"))
+        stats = {
+            "cpu_user_time": cpu_stat["user_usec"] / 1e6,
+            "cpu_system_time": cpu_stat["system_usec"] / 1e6,
+            "memory_peak": None,
+            "io": None
+        }
+        # memory.peak is only available since linux 5.19
+        if os.path.exists(os.path.join(self.path, "memory.peak")):
+            stats["memory_peak"] = int(self._read("memory.peak"))
+        if "io" in self.controllers:
+            stats["io"] = parse_io_stat(self._read("io.stat"))
+        return stats
+
+    # The cgroup can only be removed once all of its processes are gone
+    def remove(self, attempts = 10):
+        for _ in range(attempts):
+            try:
+                os.rmdir(self.path)
+                return True
+            except FileNotFoundError:
+                return True
+            except OSError:
+                time.sleep(0.01)
+        return False
+
+
+# Reads a single number file of a cgroup (e.g. memory.current) through a file descriptor kept open
+class CgroupCounter():
+    def __init__(self, cgroup_path, name):
+        self._fd = os.open(os.path.join(cgroup_path, name), os.O_RDONLY)
+
+    def read(self):
+        return int(os.pread(self._fd, 64, 0))
+
+    def close(self):
+        os.close(self._fd)
@@ -1,10 +1,18 @@
 from cmdbench.result import BenchmarkResults
-from cmdbench.utils import BenchmarkDict
-from cmdbench.core import benchmark_command_generator
+from cmdbench.utils import BenchmarkDict, TIME_RESOLUTIONS
+from cmdbench.core import benchmark_command_generator, compare_commands_generator, sweep_command_generator, DEFAULT_SAMPLE_INTERVAL_MS, SAMPLER_BACKENDS, TIME_SOURCES, DEFAULT_MIN_RUNS, DEFAULT_MAX_RUNS, RSE_METRICS, DEFAULT_SHELL, MEMORY_ACCOUNTINGS, DEFAULT_PSS_SAMPLE_EVERY, format_command
 from cmdbench.keys_dict import key_readables
+from cmdbench.capture import CAPTURE_MODES, parse_capture_mode
+from cmdbench.comparison import ComparisonResults, COMPARISON_ORDERS
+from cmdbench.sweep import SweepResults, get_scan_values, format_parameter_value
+from cmdbench.hooks import IterationHooks, CACHE_STATES, split_by_cache_state
+from cmdbench.limits import LIMIT_SIGNALS, DEFAULT_LIMIT_GRACE_PERIOD, parse_memory_size
+from cmdbench.distributed import benchmark_command_distributed_generator, sweep_command_distributed_generator, run_worker, WORKER_OPTIONS, AUTHKEY_ENVIRONMENT_VARIABLE
+from cmdbench.cgroup import use_supervisor_cgroup, CgroupError
 from tqdm import tqdm
 import numbers
 import numpy as np
+import signal
 import click
 import json
 import sys
@@ -16,8 +24,60 @@ else:
 
 PRINTING_PRECISION = 3
 
+# Processes in the tables of --per-process, and the characters of their command lines shown
+TOP_PROCESSES_COUNT = 5
+COMMAND_LINE_WIDTH = 60
+
+# Accepts a fraction (0.01) or a percentage (1%)
+def parse_target_rse(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        if value.endswith("%"):
+            return float(value[:-1]) / 100
+        return float(value)
+    except ValueError:
+        raise click.BadParameter("%s is not a fraction (0.01) or a percentage (1%%)" % value)
+
+def parse_memory_limit(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_memory_size(value)
+    except Exception as e:
+        raise click.BadParameter(str(e))
+
+def validate_capture_mode(ctx, param, value):
+    try:
+        parse_capture_mode(value)
+    except Exception as e:
+        raise click.BadParameter(str(e))
+    return value
+
 __version__ = version("cmdbench")
+
+# "cmdbench [options] <command>" runs the "run" command: it is used unless the first argument names
+# another command. After a leading "--", the arguments are a command to benchmark even if its first word
+# is a command's name (cmdbench -- compare a b benchmarks ./compare).
+class DefaultCommandGroup(click.Group):
+    default_command = "run"
+
+    def parse_args(self, ctx, args):
+        is_subcommand = len(args) > 0 and args[0] in self.commands
+        if not is_subcommand and (len(args) == 0 or args[0] not in ["--help", "--version"]):
+            args.insert(0, self.default_command)
+        return super().parse_args(ctx, args)
+
+@click.group(cls = DefaultCommandGroup)
 @click.version_option(__version__)
+def cli():
+    """Benchmarks the CPU, memory and disk usage of commands.
+
+       cmdbench [options] <command> benchmarks a command (see cmdbench run --help), cmdbench [options] -- <command>
+       also when its first word is compare, worker or run,
+       cmdbench compare [options] <command> <command>... compares commands (see cmdbench compare --help),
+       cmdbench worker --listen <address> runs the iterations of other machines (see cmdbench worker --help)."""
+    pass
 
 @click.option("--print-averages", "-a", default = False, is_flag = True, show_default=True,
     help="Prints averages of each type of resources (over all iterations).")
@@ -39,15 +99,94 @@ __version__ = version("cmdbench")
 
 @click.option("--iterations", "-i", default = 1, type = click.IntRange(1), show_default=True,
     help="Number of iterations to get benchmarking results for the target command.")
+@click.option("--warmup", default = 0, type = click.IntRange(0), show_default=True,
+    help="Number of runs before the measured ones, whose results are discarded.")
+@click.option("--target-rse", default = None, callback = parse_target_rse,
+    help="Adaptive mode: runs until the relative standard error of the mean of --rse-metric reaches this target (e.g. 1%), instead of --iterations times.")
+@click.option("--rse-metric", default = "execution_time", type = click.Choice(RSE_METRICS), show_default=True,
+    help="Result whose precision the adaptive mode watches.")
+@click.option("--time-budget", default = None, type = click.FloatRange(0),
+    help="Adaptive mode: stops running after this many seconds (--min-runs are still done).")
+@click.option("--min-runs", default = DEFAULT_MIN_RUNS, type = click.IntRange(1), show_default=True,
+    help="Minimum number of measured runs in adaptive mode.")
+@click.option("--max-runs", default = DEFAULT_MAX_RUNS, type = click.IntRange(1), show_default=True,
+    help="Maximum number of measured runs in adaptive mode.")
+@click.option("--jobs", default = 1, type = click.IntRange(1), show_default=True,
+    help="Number of iterations to run at the same time. On linux, every job is pinned to cores of its own.")
+@click.option("--sample-interval-ms", "-I", default = DEFAULT_SAMPLE_INTERVAL_MS, type = click.FloatRange(0), show_default=True,
+    help="Milliseconds between two samples of the target command's resource usage. 0 samples as fast as possible.")
+@click.option("--sampler-backend", default = "auto", type = click.Choice(SAMPLER_BACKENDS), show_default=True,
+    help="How the target command's process tree is read. procfs reads /proc directly (linux only), auto uses it when available.")
+@click.option("--time-source", default = "rusage", type = click.Choice(TIME_SOURCES), show_default=True,
+    help="Linux only. rusage reads the command's resource usage with wait4, gnu_time wraps the command with /usr/bin/time -v.")
+@click.option("--cgroup", default = False, is_flag = True, show_default=True,
+    help="Runs the command in its own cgroup (linux, cgroup v2 delegation needed) for exact CPU, peak memory and disk totals.")
+
+@click.option("--time-resolution", default = "ms", type = click.Choice(list(TIME_RESOLUTIONS)), show_default=True,
+    help="Unit of the time series timestamps.")
+@click.option("--stdout-capture", default = "keep", callback = validate_capture_mode, show_default=True,
+    help="What is done with the command's stdout: %s. Its size and line count are recorded in every mode." % ", ".join(CAPTURE_MODES))
+@click.option("--stderr-capture", default = "keep", callback = validate_capture_mode, show_default=True,
+    help="What is done with the command's stderr, same modes as --stdout-capture.")
+
+@click.option("--cold", default = False, is_flag = True, show_default=True,
+    help="Same as --cache cold.")
+@click.option("--cache", default = None, type = click.Choice(CACHE_STATES),
+    help="Page cache state every iteration starts in: cold evicts the --cache-input files (or drops the whole page cache as root), warm reads them first, both alternates cold and warm iterations.")
+@click.option("--cache-input", default = None, multiple = True,
+    help="File, directory or glob (** for any subdirectories) the command reads. Can be given several times.")
+@click.option("--prepare", default = None,
+    help="Shell command run before every iteration, outside of the measurement.")
+@click.option("--cleanup", default = None,
+    help="Shell command run after every iteration, outside of the measurement.")
+
+@click.option("--shell", default = False, is_flag = True, show_default=True,
+    help="Runs the command in a shell (for pipes, redirections, variables...). The runtime, CPU time and memory of the shell alone, measured on an empty command, are subtracted from the results.")
+@click.option("--shell-path", default = DEFAULT_SHELL, show_default=True,
+    help="Shell used by --shell.")
+
+@click.option("--timeout", default = None, type = click.FloatRange(0, min_open = True),
+    help="Stops an iteration running longer than this many seconds. The results collected until then are kept and marked as terminated by a limit.")
+@click.option("--memory-limit", default = None, callback = parse_memory_limit,
+    help="Stops an iteration using more memory than this (bytes, or e.g. 512M or 2G). Enforced by the kernel with --cgroup.")
+@click.option("--cpu-limit", default = None, type = click.FloatRange(0, min_open = True),
+    help="Stops an iteration whose processes used more than this many seconds of CPU time.")
+@click.option("--limit-signal", default = "SIGTERM", type = click.Choice(LIMIT_SIGNALS), show_default=True,
+    help="Signal stopping an iteration over a limit. SIGTERM is followed by a SIGKILL after --limit-grace-period.")
+@click.option("--limit-grace-period", default = DEFAULT_LIMIT_GRACE_PERIOD, type = click.FloatRange(0), show_default=True,
+    help="Seconds an iteration has to exit after a SIGTERM before it gets a SIGKILL.")
+
+@click.option("--per-process", default = False, is_flag = True, show_default=True,
+    help="Also records every process of the command's process tree (pid, parent, command line, start and exit) and its own CPU and memory usage at every sample. The processes using the most memory and CPU time are printed.")
+@click.option("--memory-accounting", default = "rss", type = click.Choice(MEMORY_ACCOUNTINGS), show_default=True,
+    help="How the peak memory of the process tree is measured. rss sums the resident memory of its processes, counting shared pages once per process. pss (linux only) splits shared pages between the processes sharing them; the RSS peak is still reported.")
+@click.option("--pss-sample-every", default = DEFAULT_PSS_SAMPLE_EVERY, type = click.IntRange(1), show_default=True,
+    help="With --memory-accounting pss, the PSS of the processes is read again every this many samples (reading it is costly for large processes).")
+@click.option("--sample-activity", default = False, is_flag = True, show_default=True,
+    help="Also samples the context switches, page faults, threads and open file descriptors of the process tree into the time series.")
+@click.option("--counters", default = False, is_flag = True, show_default=True,
+    help="Also counts the instructions, cycles, cache misses and branch misses of the process tree with perf_event_open (linux only), along with the task clock, page faults and CPU migrations. Without a PMU (as in most virtual machines), only the latter are counted.")
+
+@click.option("--worker", default = None, multiple = True, metavar = "ADDRESS",
+    help="Runs the iterations on a worker (see cmdbench worker) listening on ADDRESS (host:port or unix:<path>) instead of locally. Repeat it to spread the iterations over several workers.")
+@click.option("--authkey", default = None, envvar = AUTHKEY_ENVIRONMENT_VARIABLE,
+    help="Key shared with the workers (or the %s environment variable)." % AUTHKEY_ENVIRONMENT_VARIABLE)
+
+@click.option("--parameter-scan", default = None, type = (str, float, float), metavar = "NAME START END",
+    help="Benchmarks the command for every number from START to END (included), replacing {NAME} in the command with it.")
+@click.option("--parameter-step-size", default = 1, type = float, show_default=True,
+    help="Step between the numbers of --parameter-scan.")
+@click.option("--parameter-list", default = None, type = (str, str), metavar = "NAME VALUES",
+    help="Benchmarks the command for every value of the comma separated VALUES (e.g. 1k,10k,100k), replacing {NAME} in the command with it.")
 
 @click.argument("command", required = True, type = click.UNPROCESSED, nargs = -1)
 
 
-@click.command(context_settings=dict(
+@cli.command("run", context_settings=dict(
     allow_extra_args = True,
     allow_interspersed_args = False
 ))
-def benchmark(command, iterations, **kwargs):
+def benchmark(command, iterations, warmup, target_rse, rse_metric, time_budget, min_runs, max_runs, jobs, sample_interval_ms, sampler_backend, time_source, cgroup, time_resolution, stdout_capture, stderr_capture, shell, shell_path, cold, cache, cache_input, prepare, cleanup, timeout, memory_limit, cpu_limit, limit_signal, limit_grace_period, per_process, memory_accounting, pss_sample_every, sample_activity, counters, worker, authkey, parameter_scan, parameter_step_size, parameter_list, **kwargs):
     """Performs CPU, memory and disk usage benchmarking on the target command.
        Note: Make sure you enter your command after entering the options.
        
@@ -59,17 +198,75 @@ def benchmark(command, iterations, **kwargs):
        Linux: cmdbench -i 5 "python -c \\"import time; time.sleep(2)\\""
        
        Windows: cmdbench -i 5 "python -c ""import time; time.sleep(2)""\"
+
+       A command given as several arguments after -- is run with these arguments as they are,
+       without splitting or quoting them again: cmdbench -i 5 -- python -c "import time; time.sleep(2)"
+
+       With --shell, the command runs in a shell: cmdbench --shell "sort data.txt | uniq -c"
        
-       If no printing options are specified, statistics will be printed for more than 1 iterations, and the first iteration for only 1 iteration."""
+       If no printing options are specified, statistics will be printed for more than 1 iterations, and the first iteration for only 1 iteration.
+
+       With --parameter-scan or --parameter-list, the command is benchmarked for every value of the parameter
+       and a table of the results per value is printed, e.g. cmdbench --parameter-scan threads 1 8 "./tool -t {threads}".
+       --save-plot then saves the runtime, memory and disk scaling plots. Values run concurrently with --jobs.
+
+       With --worker, the iterations run on the given workers: cmdbench --worker host1:7000 --worker host2:7000 -i 20 ./tool input"""
 
     np.set_printoptions(threshold=15)
 
+    if cold and cache not in [None, "cold"]:
+        raise click.UsageError("--cold can not be used with --cache %s" % cache)
+    cache = "cold" if cold else cache
+    try:
+        IterationHooks(cache, cache_input, prepare, cleanup)
+    except Exception as e:
+        raise click.UsageError(str(e))
+
+    benchmark_options = dict(sample_interval_ms = sample_interval_ms, sampler_backend = sampler_backend, cgroup = cgroup, time_source = time_source, stdout_capture = stdout_capture, stderr_capture = stderr_capture, time_resolution = time_resolution, jobs = jobs,
+        warmup = warmup, min_runs = min_runs, max_runs = max_runs, target_rse = target_rse, rse_metric = rse_metric, time_budget = time_budget,
+        cache = cache, cache_inputs = cache_input, prepare = prepare, cleanup = cleanup,
+        timeout = timeout, memory_limit = memory_limit, cpu_limit = cpu_limit, limit_signal = limit_signal, limit_grace_period = limit_grace_period,
+        shell = shell_path if shell else False, per_process = per_process, memory_accounting = memory_accounting, pss_sample_every = pss_sample_every, sample_activity = sample_activity, counters = counters)
+    if cgroup and jobs > 1:
+        raise click.UsageError("--cgroup can not be used with --jobs")
+    if cgroup and len(worker) == 0:
+        leave_own_cgroup()
+    # A single argument is a command line, several ones are the command's argv
+    command = command[0] if len(command) == 1 else list(command)
+    # In adaptive mode, the number of runs is only known once they are done
+    adaptive = target_rse is not None or time_budget is not None
+
+    # Workers take the options iterations run with, the others are the local scheduler's
+    workers = list(worker)
+    if len(workers) > 0:
+        if jobs > 1 or adaptive:
+            raise click.UsageError("--worker can not be used with --jobs, --target-rse or --time-budget")
+        benchmark_options = {key: value for key, value in benchmark_options.items() if key in WORKER_OPTIONS or key in ["time_resolution", "warmup"]}
+        benchmark_options["authkey"] = authkey
+
+    if parameter_scan is not None and parameter_list is not None:
+        raise click.UsageError("Only one of --parameter-scan and --parameter-list can be used")
+    if parameter_scan is not None or parameter_list is not None:
+        if parameter_scan is not None:
+            parameter_name, start, end = parameter_scan
+            try:
+                parameter_values = get_scan_values(start, end, parameter_step_size)
+            except Exception as e:
+                raise click.BadParameter(str(e), param_hint = "--parameter-step-size")
+        else:
+            parameter_name, values = parameter_list
+            parameter_values = [value.strip() for value in values.split(",") if len(value.strip()) > 0]
+        sweep(command, parameter_name, parameter_values, iterations, benchmark_options, max_runs if adaptive else iterations, kwargs, workers)
+        return
+
     click.echo("Benchmarking started..")
     benchmark_results = BenchmarkResults()
-    benchmark_generator = benchmark_command_generator(" ".join(command), iterations)
-    t = tqdm(range(iterations))
-    for i in t:
-        benchmark_result = next(benchmark_generator)
+    if len(workers) > 0:
+        benchmark_generator = benchmark_command_distributed_generator(command, workers, iterations, **benchmark_options)
+    else:
+        benchmark_generator = benchmark_command_generator(command, iterations, **benchmark_options)
+    t = tqdm(benchmark_generator, total = max_runs if adaptive else iterations)
+    for benchmark_result in t:
         benchmark_results.add_benchmark_result(benchmark_result)
         last_runtime = benchmark_result.get_first_iteration().process.execution_time
         last_runtime = round(last_runtime, PRINTING_PRECISION)
@@ -77,6 +274,7 @@ def benchmark(command, iterations, **kwargs):
         t.refresh()
     click.echo("Benchmarking done.")
     click.echo()
+    warn_terminated_iterations(benchmark_results)
 
     option_keys = ["print_statistics", "print_averages", "print_values", "print_first_iteration", "print_all_iterations"]
 
@@ -87,17 +285,27 @@ def benchmark(command, iterations, **kwargs):
             printing_any = True
             break
     if not printing_any:
-        if iterations > 1:
+        if len(benchmark_results.iterations) > 1:
             kwargs["print_statistics"] = True
         else:
             kwargs["print_first_iteration"] = True
     
-    if kwargs["print_statistics"]:
+    # Cold and warm iterations are reported separately
+    results_per_cache_state = split_by_cache_state(benchmark_results)
+    if len(results_per_cache_state) > 1:
+        if kwargs["print_statistics"]:
+            for cache_state, cache_state_results in results_per_cache_state.items():
+                print_benchmark_dict(cache_state_results.get_statistics(), "Statistics (%s cache)" % cache_state)
+        print_cache_states_table(results_per_cache_state)
+    elif kwargs["print_statistics"]:
         print_benchmark_dict(benchmark_results.get_statistics(), "Statistics")
 
     if kwargs["print_averages"]:
         print_benchmark_dict(benchmark_results.get_averages(), "Averages")
 
+    if per_process:
+        print_top_processes(benchmark_results)
+
     if kwargs["print_values"]:
         print_benchmark_dict(benchmark_results.get_values_per_attribute(), "Values")
 
@@ -128,11 +336,222 @@ def benchmark(command, iterations, **kwargs):
 
     click.echo("Done.")
 
+# Results of iterations stopped by a limit only cover their run until the stop
+def warn_terminated_iterations(benchmark_results):
+    terminated_iterations_num = sum(1 for iteration in benchmark_results.iterations if iteration.get("limits", {}).get("terminated_by_limit"))
+    if terminated_iterations_num > 0:
+        click.secho("Warning: %s of %s iterations were stopped by a limit, their results are partial." % (terminated_iterations_num, len(benchmark_results.iterations)), fg = "yellow")
+        click.echo()
+
+# Benchmarks the command for every value of the parameter and prints a table of the results per value
+def sweep(command, parameter_name, parameter_values, iterations, benchmark_options, max_runs_per_value, print_options, workers = None):
+    click.echo("Benchmarking started..")
+    try:
+        sweep_results = SweepResults(command, parameter_name, parameter_values)
+        if workers:
+            sweep_generator = sweep_command_distributed_generator(command, parameter_name, parameter_values, workers, iterations, **benchmark_options)
+        else:
+            sweep_generator = sweep_command_generator(command, parameter_name, parameter_values, iterations, **benchmark_options)
+        t = tqdm(sweep_generator, total = max_runs_per_value * len(parameter_values))
+        for point_index, benchmark_result in t:
+            sweep_results.benchmark_results[point_index].add_benchmark_result(benchmark_result)
+            t.set_description("%s = %s" % (parameter_name, format_parameter_value(parameter_values[point_index])))
+    except Exception as e:
+        raise click.UsageError(str(e))
+    click.echo("Benchmarking done.")
+    click.echo()
+    warn_terminated_iterations(BenchmarkResults([iteration for benchmark_results in sweep_results.benchmark_results for iteration in benchmark_results.iterations]))
+
+    if print_options["print_statistics"]:
+        for command, benchmark_results in zip(sweep_results.commands, sweep_results.benchmark_results):
+            print_benchmark_dict(benchmark_results.get_statistics(), format_command(command))
+    print_sweep_table(sweep_results)
+
+    if print_options["save_plot"] is not None:
+        save_plot_width, save_plot_height = print_options["save_plot_size"]
+        fig = sweep_results.get_scaling_plot(save_plot_width, save_plot_height)
+        if fig:
+            fig.savefig(print_options["save_plot"])
+            click.echo("Plot saved.")
+        else:
+            click.echo("No results to plot.")
+
+    if print_options["save_json"] is not None:
+        json.dump({
+            "parameter_name": parameter_name,
+            "parameter_values": parameter_values,
+            "commands": sweep_results.commands,
+            "iterations": [benchmark_results.iterations for benchmark_results in sweep_results.benchmark_results]
+        }, print_options["save_json"], cls=NumpyEncoder)
+
+    click.echo("Done.")
+
+# Mean ± standard deviation of a BenchmarkStats
+def format_stats(stats, divisor = 1):
+    if stats is None or stats.mean is None:
+        return "-"
+    if stats.stdev == 0:
+        return "%s" % round(stats.mean / divisor, PRINTING_PRECISION)
+    return "%s ± %s" % (round(stats.mean / divisor, PRINTING_PRECISION), round(stats.stdev / divisor, PRINTING_PRECISION))
+
+def print_table(title, header, rows):
+    widths = [max(len(cells[column]) for cells in [header] + rows) for column in range(len(header))]
+    click.secho("====> %s <====" % title + "\n", fg = "green", bold = True)
+    click.secho("  ".join(cell.rjust(width) for cell, width in zip(header, widths)), fg = "cyan")
+    for cells in rows:
+        click.echo("  ".join(cell.rjust(width) for cell, width in zip(cells, widths)))
+    click.echo()
+
+# Processes of the first iteration using the most memory, and the most CPU time
+def print_top_processes(benchmark_results):
+    header = ["PID", "PPID", "Start (s)", "Exit (s)", "CPU time (s)", "Peak memory (MB)", "Command"]
+    for sort_by, title in [("memory_max", "memory"), ("cpu_time", "CPU time")]:
+        rows = []
+        for process in benchmark_results.get_top_processes(TOP_PROCESSES_COUNT, sort_by):
+            rows.append([
+                str(process.pid), str(process.ppid), str(round(process.start_time, PRINTING_PRECISION)), str(round(process.exit_time, PRINTING_PRECISION)),
+                str(round(process.cpu_time, PRINTING_PRECISION)), str(round(process.memory_max / 1024 ** 2, PRINTING_PRECISION)), shorten_command_line(process.cmdline)
+            ])
+        print_table("Top processes by %s (first iteration)" % title, header, rows)
+
+def shorten_command_line(command_line):
+    command_line = " ".join(command_line.split())
+    return command_line if len(command_line) <= COMMAND_LINE_WIDTH else command_line[:COMMAND_LINE_WIDTH - 3] + "..."
+
+# Results of the cold and warm cache iterations side by side
+def print_cache_states_table(results_per_cache_state):
+    cache_states = list(results_per_cache_state.keys())
+    statistics = [results_per_cache_state[cache_state].get_statistics() for cache_state in cache_states]
+    metrics = [
+        ("Runs", None, None),
+        ("Runtime (s)", ["process", "execution_time"], 1),
+        ("CPU time (s)", ["cpu", "total_time"], 1),
+        ("Peak memory (MB)", ["memory", "max"], 1024 ** 2),
+        ("Disk read (MB)", ["disk", "read_bytes"], 1024 ** 2),
+        ("Disk read chars (MB)", ["disk", "read_chars"], 1024 ** 2)
+    ]
+    rows = []
+    for metric_name, key_path, divisor in metrics:
+        if key_path is None:
+            rows.append([metric_name] + [str(len(results_per_cache_state[cache_state].iterations)) for cache_state in cache_states])
+            continue
+        cells = [metric_name]
+        for cache_state_statistics in statistics:
+            stats = cache_state_statistics
+            for key in key_path:
+                stats = stats[key] if key in stats else None
+                if stats is None:
+                    break
+            cells.append(format_stats(stats, divisor))
+        rows.append(cells)
+    print_table("Cold and warm cache", [""] + [str(cache_state) for cache_state in cache_states], rows)
+
+def print_sweep_table(sweep_results):
+    header = [sweep_results.parameter_name, "Runs", "Runtime (s)", "Peak memory (MB)", "Disk read (MB)", "Disk write (MB)"]
+    rows = []
+    for row in sweep_results.get_table():
+        rows.append([
+            format_parameter_value(row.value), str(row.runs), format_stats(row.execution_time),
+            format_stats(row.memory, 1024 ** 2), format_stats(row.disk_read_bytes, 1024 ** 2), format_stats(row.disk_write_bytes, 1024 ** 2)
+        ])
+    print_table("Results per %s" % sweep_results.parameter_name, header, rows)
+
+@cli.command("compare")
+@click.option("--save-json", "-j", default = None, type = click.File('w'),
+    help="File address to save the collected data and the comparison as JSON.")
+@click.option("--iterations", "-i", default = 10, type = click.IntRange(2), show_default=True,
+    help="Number of iterations of each command.")
+@click.option("--warmup", default = 0, type = click.IntRange(0), show_default=True,
+    help="Number of runs of each command before its measured ones, whose results are discarded.")
+@click.option("--order", default = "interleave", type = click.Choice(COMPARISON_ORDERS), show_default=True,
+    help="Order of the runs. interleave and random spread drifts of the machine evenly over the commands.")
+@click.option("--seed", default = None, type = int,
+    help="Seed of the random run order and of the bootstrap confidence intervals.")
+@click.option("--confidence-level", default = 0.95, type = click.FloatRange(0, 1), show_default=True,
+    help="Confidence level of the intervals of the ratios.")
+@click.option("--sample-interval-ms", "-I", default = DEFAULT_SAMPLE_INTERVAL_MS, type = click.FloatRange(0), show_default=True,
+    help="Milliseconds between two samples of the commands' resource usage.")
+@click.option("--sampler-backend", default = "auto", type = click.Choice(SAMPLER_BACKENDS), show_default=True,
+    help="How the commands' process trees are read.")
+@click.option("--time-source", default = "rusage", type = click.Choice(TIME_SOURCES), show_default=True,
+    help="Linux only. rusage reads the commands' resource usage with wait4, gnu_time wraps them with /usr/bin/time -v.")
+@click.option("--cgroup", default = False, is_flag = True, show_default=True,
+    help="Runs the commands in their own cgroup (linux, cgroup v2 delegation needed).")
+@click.argument("commands", required = True, nargs = -1)
+def compare(commands, save_json, iterations, warmup, order, seed, confidence_level, **options):
+    """Benchmarks commands against the first one (the baseline), alternating their runs.
+
+       For each command, reports the ratio (command / baseline) of the mean runtime, CPU time and peak memory
+       with bootstrap confidence intervals, the speedup, and the p-values of Welch's t-test and the Mann-Whitney U test.
+
+       Example: cmdbench compare -i 20 "./tool-v1 input" "./tool-v2 input"
+       """
+    if len(commands) < 2:
+        raise click.UsageError("At least two commands are needed for a comparison")
+    if options["cgroup"]:
+        leave_own_cgroup()
+
+    click.echo("Benchmarking started..")
+    benchmark_results = [BenchmarkResults() for _ in commands]
+    comparison_generator = compare_commands_generator(list(commands), iterations, order, seed, warmup = warmup, **options)
+    for command_index, benchmark_result in tqdm(comparison_generator, total = iterations * len(commands)):
+        benchmark_results[command_index].add_benchmark_result(benchmark_result)
+    click.echo("Benchmarking done.")
+    click.echo()
+
+    comparison_results = ComparisonResults(list(commands), benchmark_results, confidence_level, seed)
+    comparison = comparison_results.get_comparison()
+
+    for command, command_benchmark_results in zip(commands, benchmark_results):
+        statistics = command_benchmark_results.get_statistics()
+        print_benchmark_dict(BenchmarkDict.from_dict({key: statistics[key] for key in ["process", "cpu", "memory"]}), command)
+    for command_comparison in comparison.comparisons:
+        title = "%s vs %s" % (command_comparison.command, comparison.baseline)
+        print_benchmark_dict(BenchmarkDict.from_dict({key: value for key, value in command_comparison.items() if key != "command"}), title, title_fg_color = "magenta")
+
+    if save_json is not None:
+        json.dump({
+            "commands": list(commands),
+            "comparison": comparison,
+            "iterations": [command_benchmark_results.iterations for command_benchmark_results in benchmark_results]
+        }, save_json, cls=NumpyEncoder)
+
+    click.echo("Done.")
+
+@cli.command("worker")
+@click.option("--listen", "-l", required = True, metavar = "ADDRESS",
+    help="host:port (port 0 picks a free port) or unix:<path> to listen on. Use 0.0.0.0:<port> to accept other machines.")
+@click.option("--authkey", default = None, envvar = AUTHKEY_ENVIRONMENT_VARIABLE,
+    help="Key coordinators need to connect (or the %s environment variable)." % AUTHKEY_ENVIRONMENT_VARIABLE)
+def worker(listen, authkey):
+    """Runs the iterations coordinators (cmdbench run --worker <address>) send, until interrupted.
+
+       Anyone with the key can run commands as this worker's user: only listen on trusted networks.
+
+       Example: CMDBENCH_AUTHKEY=secret cmdbench worker --listen 0.0.0.0:7000
+       """
+    # A terminated worker stops like an interrupted one, closing its monitor's processes
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        run_worker(listen, authkey, supervisor_cgroup = True)
+    except KeyboardInterrupt:
+        click.echo("Worker stopped.")
+    except Exception as e:
+        raise click.UsageError(str(e))
+
+# The CLI opts in to moving cmdbench to a supervisor cgroup, without which controllers can't be
+# enabled for the benchmark cgroups when cmdbench was started in a cgroup of its own (see cgroup.py)
+def leave_own_cgroup():
+    try:
+        use_supervisor_cgroup()
+    except CgroupError as e:
+        click.secho("Warning: cmdbench could not move to a cgroup of its own (%s)." % e, fg = "yellow")
+
 def print_benchmark_dict(bdict, title, title_fg_color = "green", indentation = 0):
     click.secho(" " * indentation + "====> %s <====" % title + "\n", fg = title_fg_color, bold = True)
     print_benchmark_dict_to_readable(bdict, indentation)
 
-key_print_order = ["process", "cpu", "memory", "disk", "time_series"]
+key_print_order = ["process", "cpu", "memory", "disk", "time_series", "sampling", "parallel"]
 def print_benchmark_dict_to_readable(bdict, indentation = 0):
     
     remaining_keys = list(bdict.keys())
@@ -192,4 +611,4 @@ class NumpyEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 if __name__ == "__main__":
-    benchmark(prog_name='cmdbench')
\ No newline at end of file
+    cli(prog_name='cmdbench')
\ No newline at end of file
@@ -0,0 +1,135 @@
+from .utils import *
+from .result import BenchmarkResults
+from scipy import stats
+import numpy as np
+import random
+
+# Orders the commands' runs can be done in:
+#   "interleave"  one run of each command after the other (A B C A B C ...)
+#   "random"      every round runs each command once, in a random order (A C B B A C ...)
+#   "sequential"  all runs of a command, then all runs of the next one (A A B B C C)
+# Interleaved and random orders spread slow drifts of the machine (thermal throttling,
+# background load, caches) evenly over the commands instead of biasing one of them.
+COMPARISON_ORDERS = ["interleave", "random", "sequential"]
+
+# Results compared between the commands: name and path in the final benchmark results
+COMPARISON_METRICS = {
+    "execution_time": ["process", "execution_time"],
+    "cpu_time": ["cpu", "total_time"],
+    "memory": ["memory", "max"]
+}
+
+# Bootstrap resamples used for the confidence intervals of the ratios
+BOOTSTRAP_RESAMPLES = 10000
+
+# Indices of the commands in the order their runs are done
+def get_run_order(commands_num, iterations_num, order, seed = None):
+    if order not in COMPARISON_ORDERS:
+        raise Exception("Unknown run order %s, expected one of: %s" % (order, ", ".join(COMPARISON_ORDERS)))
+    if order == "sequential":
+        return [command_index for command_index in range(commands_num) for _ in range(iterations_num)]
+
+    order_random = random.Random(seed)
+    run_order = []
+    for _ in range(iterations_num):
+        run_round = list(range(commands_num))
+        if order == "random":
+            order_random.shuffle(run_round)
+        run_order += run_round
+    return run_order
+
+
+# Results of compare_commands: the full BenchmarkResults of every command (time series included)
+# and how each command compares to the first one (the baseline).
+class ComparisonResults():
+    def __init__(self, commands, benchmark_results, confidence_level = 0.95, seed = None):
+        self.commands = commands
+        self.benchmark_results = benchmark_results
+        self.confidence_level = confidence_level
+        self._random = np.random.default_rng(seed)
+
+    def get_benchmark_results(self, command_index):
+        return self.benchmark_results[command_index]
+
+    # For every command, compared to the baseline and for every metric:
+    #   - mean (with its baseline_mean)
+    #   - ratio of the means (command / baseline) and its bootstrap confidence interval
+    #   - speedup (baseline / command, for execution and CPU time) and its confidence interval
+    #   - p-values of Welch's t-test and of the Mann-Whitney U test (None with less than 2 runs)
+    def get_comparison(self):
+        baseline_values = self._get_metric_values(0)
+        comparisons = []
+        for command_index, command in enumerate(self.commands):
+            if command_index == 0:
+                continue
+            command_values = self._get_metric_values(command_index)
+            comparison = {"command": command}
+            for metric in COMPARISON_METRICS.keys():
+                comparison[metric] = self._compare_values(baseline_values[metric], command_values[metric], metric != "memory")
+            comparisons.append(comparison)
+
+        return BenchmarkDict.from_dict({
+            "baseline": self.commands[0],
+            "confidence_level": self.confidence_level,
+            "comparisons": comparisons
+        })
+
+    def _get_metric_values(self, command_index):
+        metric_values = {}
+        for metric, key_path in COMPARISON_METRICS.items():
+            values = []
+            for iteration in self.benchmark_results[command_index].iterations:
+                value = iteration
+                for key in key_path:
+                    value = value[key]
+                values.append(value)
+            metric_values[metric] = np.array(values, dtype = np.float64)
+        return metric_values
+
+    def _compare_values(self, baseline_values, values, is_time):
+        ratio_ci_low, ratio_ci_high = self._bootstrap_ratio_interval(baseline_values, values)
+        ratio = _ratio(np.mean(values), np.mean(baseline_values))
+        comparison = {
+            "baseline_mean": float(np.mean(baseline_values)),
+            "mean": float(np.mean(values)),
+            "ratio": ratio,
+            "ratio_ci_low": ratio_ci_low,
+            "ratio_ci_high": ratio_ci_high,
+            "welch_p_value": None,
+            "mann_whitney_p_value": None
+        }
+        if is_time:
+            comparison["speedup"] = _ratio(1, ratio)
+            comparison["speedup_ci_low"] = _ratio(1, ratio_ci_high)
+            comparison["speedup_ci_high"] = _ratio(1, ratio_ci_low)
+
+        if len(baseline_values) >= 2 and len(values) >= 2:
+            comparison["welch_p_value"] = _p_value(stats.ttest_ind(values, baseline_values, equal_var = False))
+            # Fails when all values of both sides are the same
+            try:
+                comparison["mann_whitney_p_value"] = _p_value(stats.mannwhitneyu(values, baseline_values, alternative = "two-sided"))
+            except ValueError:
+                comparison["mann_whitney_p_value"] = 1.0
+        return comparison
+
+    # Percentile bootstrap of the ratio of the means, resampling both sides independently
+    def _bootstrap_ratio_interval(self, baseline_values, values):
+        baseline_means = self._random.choice(baseline_values, (BOOTSTRAP_RESAMPLES, len(baseline_values))).mean(axis = 1)
+        means = self._random.choice(values, (BOOTSTRAP_RESAMPLES, len(values))).mean(axis = 1)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            ratios = means / baseline_means
+        ratios = ratios[np.isfinite(ratios)]
+        if len(ratios) == 0:
+            return None, None
+        tail = (1 - self.confidence_level) / 2 * 100
+        return float(np.percentile(ratios, tail)), float(np.percentile(ratios, 100 - tail))
+
+def _ratio(numerator, denominator):
+    if numerator is None or denominator is None or denominator == 0:
+        return None
+    return float(numerator / denominator)
+
+# The tests give nan when neither side varies
+def _p_value(test_result):
+    p_value = float(test_result.pvalue)
+    return None if np.isnan(p_value) else p_value
@@ -1,14 +1,28 @@
 from .utils import *
 from .result import *
-from collections import deque
+from .shared import SharedBenchmarkState, SampleRing, shared_memory_available
+from .procfs import ProcfsProcess, procfs_available, read_cores_busy_time, read_proportional_memory, read_activity
+from .process_table import ProcessTable
+from .cgroup import BenchmarkCgroup, CgroupCounter, CgroupError, check_benchmark_cgroup_support
+from .capture import OutputCapture, parse_capture_mode
+from .parallel import split_cores, format_cores, run_parallel_iterations
+from .comparison import ComparisonResults, get_run_order
+from .sweep import SweepResults, get_sweep_commands
+from .hooks import IterationHooks
+from .processes import ProcessRecords, process_sample_columns, new_raw_processes, raw_to_final_processes
+from .perf import PerfCounters, PerfCounterError
+from .limits import ResourceLimits, LimitWatchdog, DEFAULT_LIMIT_GRACE_PERIOD, read_process_tree_cpu_time, signal_process_tree, signal_process_group, signal_cgroup
 import multiprocessing
 import threading
+import math
 import numpy as np
 import sys
 import os
 import subprocess
 import psutil
 import tempfile
+import shutil
+import time
 import shlex
 import click
 from sys import platform as _platform
@@ -18,27 +32,348 @@ is_macos = _platform == "darwin"
 is_unix = is_linux or is_macos
 is_win = os.name == "nt"
 
-def benchmark_command(command, iterations_num = 1, raw_data = False):
-    if iterations_num <= 0:
-        raise Exception("The number of iterations to run the command should be >= 1")
+if is_unix:
+    import resource
+
+# Where the linux-only "gnu_time" results come from:
+# "rusage" spawns the command directly and reads its resource usage with os.wait4,
+# "gnu_time" wraps the command with /usr/bin/time -v (needs GNU time installed).
+TIME_SOURCES = ["rusage", "gnu_time"]
+
+# Shell running the commands in shell mode (shell = True)
+DEFAULT_SHELL = "cmd.exe" if is_win else "/bin/sh"
+
+# Runs of an empty command measuring the time and memory the shell adds to the commands in shell mode
+SHELL_OVERHEAD_RUNS = 20
+
+# Time between two consecutive samples taken by the collectors
+DEFAULT_SAMPLE_INTERVAL_MS = 10
+
+# Bounds (in seconds) of the delay between two checks for the command started by GNU Time
+GNU_TIME_CHILDREN_POLL_DELAY_MIN = 0.0001
+GNU_TIME_CHILDREN_POLL_DELAY_MAX = 0.002
+
+# Sent by a monitor worker once its collector holds the process it was asked to watch
+ATTACHED = "attached"
+
+# How the memory of a process tree is accounted for:
+# "rss" sums the resident memory of its processes, counting the pages they share once per process,
+# "pss" (linux only) sums their proportional memory, pages shared with n processes counting for 1/n
+MEMORY_ACCOUNTINGS = ["rss", "pss"]
+
+# With "pss" accounting, samples reading the PSS of every process again (see ProportionalMemorySampler)
+DEFAULT_PSS_SAMPLE_EVERY = 10
+
+# Bounds on the number of measured runs in adaptive mode (with a target_rse or a time_budget)
+DEFAULT_MIN_RUNS = 3
+DEFAULT_MAX_RUNS = 100
 
-    raw_benchmark_results = []
-    for _ in range(iterations_num):
-        raw_benchmark_result = single_benchmark_command_raw(command)
-        raw_benchmark_results.append(raw_benchmark_result)
+# Results whose precision the adaptive mode can watch: execution time or peak memory
+RSE_METRICS = ["execution_time", "memory"]
+
+# How the collectors read the target process tree:
+# "psutil" works everywhere, "procfs" reads /proc directly (linux only, much cheaper for large trees)
+# and "auto" picks procfs when it is available.
+SAMPLER_BACKENDS = ["auto", "psutil", "procfs"]
+
+def benchmark_command(command, iterations_num = 1, raw_data = False, sample_interval_ms = DEFAULT_SAMPLE_INTERVAL_MS, sampler_backend = "auto", cgroup = False, time_source = "rusage", stdout_capture = "keep", stderr_capture = "keep", time_resolution = "ms", jobs = 1, warmup = 0, min_runs = DEFAULT_MIN_RUNS, max_runs = DEFAULT_MAX_RUNS, target_rse = None, rse_metric = "execution_time", time_budget = None, monitor = None, cache = None, cache_inputs = None, prepare = None, cleanup = None, timeout = None, memory_limit = None, cpu_limit = None, limit_signal = "SIGTERM", limit_grace_period = DEFAULT_LIMIT_GRACE_PERIOD, shell = False, per_process = False, memory_accounting = "rss", pss_sample_every = DEFAULT_PSS_SAMPLE_EVERY, sample_activity = False, counters = False):
+    validate_benchmark_options(iterations_num, sample_interval_ms, sampler_backend, time_source, stdout_capture, stderr_capture, time_resolution, jobs, monitor, warmup, min_runs, max_runs, target_rse, rse_metric, time_budget, cgroup)
+    validate_memory_accounting(memory_accounting, pss_sample_every)
+
+    hooks = IterationHooks(cache, cache_inputs, prepare, cleanup)
+    limits = ResourceLimits(timeout, memory_limit, cpu_limit, limit_signal, limit_grace_period)
+
+    raw_benchmark_results = list(benchmark_measured_iterations(command, iterations_num, sample_interval_ms, sampler_backend, cgroup, time_source, stdout_capture, stderr_capture, jobs, monitor, warmup, min_runs, max_runs, target_rse, rse_metric, time_budget, hooks, limits, per_process, memory_accounting, pss_sample_every, sample_activity, counters, shell))
     
-    final_benchmark_results = list(map(lambda raw_benchmark_result: raw_benchmark_result if raw_data else raw_to_final_benchmark(raw_benchmark_result), raw_benchmark_results))
+    final_benchmark_results = list(map(lambda raw_benchmark_result: raw_benchmark_result if raw_data else raw_to_final_benchmark(raw_benchmark_result, time_resolution), raw_benchmark_results))
 
     return BenchmarkResults(final_benchmark_results)
 
-def benchmark_command_generator(command, iterations_num = 1, raw_data = False):
+def benchmark_command_generator(command, iterations_num = 1, raw_data = False, sample_interval_ms = DEFAULT_SAMPLE_INTERVAL_MS, sampler_backend = "auto", cgroup = False, time_source = "rusage", stdout_capture = "keep", stderr_capture = "keep", time_resolution = "ms", jobs = 1, warmup = 0, min_runs = DEFAULT_MIN_RUNS, max_runs = DEFAULT_MAX_RUNS, target_rse = None, rse_metric = "execution_time", time_budget = None, monitor = None, cache = None, cache_inputs = None, prepare = None, cleanup = None, timeout = None, memory_limit = None, cpu_limit = None, limit_signal = "SIGTERM", limit_grace_period = DEFAULT_LIMIT_GRACE_PERIOD, shell = False, per_process = False, memory_accounting = "rss", pss_sample_every = DEFAULT_PSS_SAMPLE_EVERY, sample_activity = False, counters = False):
+    validate_benchmark_options(iterations_num, sample_interval_ms, sampler_backend, time_source, stdout_capture, stderr_capture, time_resolution, jobs, monitor, warmup, min_runs, max_runs, target_rse, rse_metric, time_budget, cgroup)
+    validate_memory_accounting(memory_accounting, pss_sample_every)
+
+    hooks = IterationHooks(cache, cache_inputs, prepare, cleanup)
+    limits = ResourceLimits(timeout, memory_limit, cpu_limit, limit_signal, limit_grace_period)
+
+    for raw_benchmark_result in benchmark_measured_iterations(command, iterations_num, sample_interval_ms, sampler_backend, cgroup, time_source, stdout_capture, stderr_capture, jobs, monitor, warmup, min_runs, max_runs, target_rse, rse_metric, time_budget, hooks, limits, per_process, memory_accounting, pss_sample_every, sample_activity, counters, shell):
+        final_benchmark_result = raw_benchmark_result if raw_data else raw_to_final_benchmark(raw_benchmark_result, time_resolution)
+        yield BenchmarkResults([final_benchmark_result])
+
+# Benchmarks commands against the first one (the baseline), alternating their runs in the given order.
+# Takes the same options as benchmark_command, except the ones running iterations concurrently or adaptively.
+# Returns a ComparisonResults with every command's BenchmarkResults.
+def compare_commands(commands, iterations_num = 10, order = "interleave", confidence_level = 0.95, seed = None, **options):
+    if not 0 < confidence_level < 1:
+        raise Exception("The confidence level should be between 0 and 1")
+    benchmark_results = [BenchmarkResults() for _ in commands]
+    for command_index, benchmark_result in compare_commands_generator(commands, iterations_num, order, seed, **options):
+        benchmark_results[command_index].add_benchmark_result(benchmark_result)
+    return ComparisonResults(commands, benchmark_results, confidence_level, seed)
+
+# Yields the index of the command and its BenchmarkResults after each run
+def compare_commands_generator(commands, iterations_num = 10, order = "interleave", seed = None, **options):
+    if len(commands) < 2:
+        raise Exception("At least two commands are needed for a comparison")
+    for option in ["raw_data", "jobs", "target_rse", "time_budget", "monitor"]:
+        if option in options:
+            raise Exception("The %s option can not be used when comparing commands" % option)
+    run_order = get_run_order(len(commands), iterations_num, order, seed)
+
+    # Generators run one iteration at a time, so all commands can share the monitor
+    with BenchmarkMonitor() as monitor:
+        command_generators = [benchmark_command_generator(command, iterations_num, monitor = monitor, **options) for command in commands]
+        try:
+            for command_index in run_order:
+                yield command_index, next(command_generators[command_index])
+        finally:
+            for command_generator in command_generators:
+                command_generator.close()
+
+# Benchmarks the command for every value of a parameter, "{<parameter_name>}" in the command being replaced by the value.
+# Takes the same options as benchmark_command. With jobs > 1, the runs of all values are spread over the jobs,
+# so values are benchmarked concurrently (the adaptive mode can then not be used).
+# Returns a SweepResults with the BenchmarkResults of every value.
+def sweep_command(command, parameter_name, parameter_values, iterations_num = 1, **options):
+    sweep_results = SweepResults(command, parameter_name, parameter_values)
+    for point_index, benchmark_result in sweep_command_generator(command, parameter_name, parameter_values, iterations_num, **options):
+        sweep_results.benchmark_results[point_index].add_benchmark_result(benchmark_result)
+    return sweep_results
+
+# Yields the index of the parameter value and its BenchmarkResults after each run
+def sweep_command_generator(command, parameter_name, parameter_values, iterations_num = 1, raw_data = False, sample_interval_ms = DEFAULT_SAMPLE_INTERVAL_MS, sampler_backend = "auto", cgroup = False, time_source = "rusage", stdout_capture = "keep", stderr_capture = "keep", time_resolution = "ms", jobs = 1, warmup = 0, min_runs = DEFAULT_MIN_RUNS, max_runs = DEFAULT_MAX_RUNS, target_rse = None, rse_metric = "execution_time", time_budget = None, monitor = None, cache = None, cache_inputs = None, prepare = None, cleanup = None, timeout = None, memory_limit = None, cpu_limit = None, limit_signal = "SIGTERM", limit_grace_period = DEFAULT_LIMIT_GRACE_PERIOD, shell = False, per_process = False, memory_accounting = "rss", pss_sample_every = DEFAULT_PSS_SAMPLE_EVERY, sample_activity = False, counters = False):
+    validate_benchmark_options(iterations_num, sample_interval_ms, sampler_backend, time_source, stdout_capture, stderr_capture, time_resolution, jobs, monitor, warmup, min_runs, max_runs, target_rse, rse_metric, time_budget, cgroup)
+    validate_memory_accounting(memory_accounting, pss_sample_every)
+    if jobs > 1 and (target_rse is not None or time_budget is not None):
+        raise Exception("The adaptive mode can not be used when the values of a sweep are benchmarked as concurrent jobs")
+    point_commands = get_sweep_commands(command, parameter_name, parameter_values)
+    hooks = IterationHooks(cache, cache_inputs, prepare, cleanup)
+    limits = ResourceLimits(timeout, memory_limit, cpu_limit, limit_signal, limit_grace_period)
+    to_final_benchmark = lambda raw_benchmark_result: BenchmarkResults([raw_benchmark_result if raw_data else raw_to_final_benchmark(raw_benchmark_result, time_resolution)])
+
+    # Values are benchmarked one after the other, by the same monitor
+    if jobs == 1:
+        own_monitor = monitor is None
+        if own_monitor:
+            monitor = BenchmarkMonitor()
+        try:
+            # The shell is the same for all values
+            shell_overhead = measure_shell_overhead(shell, sample_interval_ms, sampler_backend, cgroup, time_source, monitor) if shell else None
+            for point_index, point_command in enumerate(point_commands):
+                for raw_benchmark_result in benchmark_measured_iterations(point_command, iterations_num, sample_interval_ms, sampler_backend, cgroup, time_source, stdout_capture, stderr_capture, 1, monitor, warmup, min_runs, max_runs, target_rse, rse_metric, time_budget, hooks, limits, per_process, memory_accounting, pss_sample_every, sample_activity, counters, shell, shell_overhead):
+                    yield point_index, to_final_benchmark(raw_benchmark_result)
+        finally:
+            if own_monitor:
+                monitor.close()
+        return
+
+    # Every value's warmup and measured runs, in order. Jobs take the next run when they are done with one,
+    # so the jobs work on neighboring values at the same time.
+    runs = [(point_index, run_index < warmup) for point_index in range(len(point_commands)) for run_index in range(warmup + iterations_num)]
+    cgroup = cgroup and check_cgroup_support()
+    run_options = (sample_interval_ms, sampler_backend, cgroup, time_source, stdout_capture, stderr_capture, limits, per_process, memory_accounting, pss_sample_every, sample_activity, counters)
+    runs_per_point = warmup + iterations_num
+    shell_overhead = None
+    if shell:
+        shell_overhead = measure_shell_overhead(shell, sample_interval_ms, sampler_backend, cgroup, time_source)
+        point_commands = [get_shell_argv(point_command, shell) for point_command in point_commands]
+    raw_iterations = benchmark_parallel_raw_iterations(lambda run_index: point_commands[runs[run_index][0]], len(runs), run_options, jobs, hooks, lambda run_index: run_index % runs_per_point, shell_overhead)
+    try:
+        for run_index, raw_benchmark_result in raw_iterations:
+            point_index, is_warmup = runs[run_index]
+            if not is_warmup:
+                yield point_index, to_final_benchmark(raw_benchmark_result)
+    finally:
+        raw_iterations.close()
+
+def validate_benchmark_options(iterations_num, sample_interval_ms, sampler_backend, time_source, stdout_capture, stderr_capture, time_resolution, jobs, monitor, warmup, min_runs, max_runs, target_rse, rse_metric, time_budget, cgroup = False):
     if iterations_num <= 0:
         raise Exception("The number of iterations to run the command should be >= 1")
+    if sample_interval_ms < 0:
+        raise Exception("The sampling interval should be >= 0 milliseconds")
+    validate_sampler_backend(sampler_backend)
+    if time_source not in TIME_SOURCES:
+        raise Exception("Unknown time source %s, expected one of: %s" % (time_source, ", ".join(TIME_SOURCES)))
+    parse_capture_mode(stdout_capture)
+    parse_capture_mode(stderr_capture)
+    if time_resolution not in TIME_RESOLUTIONS:
+        raise Exception("Unknown time resolution %s, expected one of: %s" % (time_resolution, ", ".join(TIME_RESOLUTIONS)))
+    if jobs < 1:
+        raise Exception("The number of jobs should be >= 1")
+    if jobs > 1 and monitor is not None:
+        raise Exception("A monitor can not be shared by concurrent jobs, every job starts its own")
+    if jobs > 1 and cgroup:
+        raise Exception("cgroup accounting can not be used with concurrent jobs: commands join their cgroup before exec, which isn't safe with the jobs' threads")
+    if warmup < 0:
+        raise Exception("The number of warmup runs should be >= 0")
+    if min_runs < 1 or max_runs < min_runs:
+        raise Exception("The number of runs should be 1 <= min_runs <= max_runs")
+    if target_rse is not None and target_rse <= 0:
+        raise Exception("The target relative standard error should be > 0")
+    if rse_metric not in RSE_METRICS:
+        raise Exception("Unknown relative standard error metric %s, expected one of: %s" % (rse_metric, ", ".join(RSE_METRICS)))
+    if time_budget is not None and time_budget < 0:
+        raise Exception("The time budget should be >= 0 seconds")
+
+def validate_memory_accounting(memory_accounting, pss_sample_every):
+    if memory_accounting not in MEMORY_ACCOUNTINGS:
+        raise Exception("Unknown memory accounting %s, expected one of: %s" % (memory_accounting, ", ".join(MEMORY_ACCOUNTINGS)))
+    if pss_sample_every < 1:
+        raise Exception("The number of samples between two PSS reads should be >= 1")
+
+# Runs the warmup iterations, whose results are dropped, then yields the raw results of the measured ones.
+#
+# With a target relative standard error or a time budget (adaptive mode), iterations_num is not used:
+# iterations run until the relative standard error of the mean of rse_metric reaches the target
+# (after min_runs runs), the time budget runs out, or max_runs runs are done. min_runs is always honored.
+def benchmark_measured_iterations(command, iterations_num, sample_interval_ms, sampler_backend, cgroup, time_source, stdout_capture, stderr_capture, jobs, monitor, warmup, min_runs, max_runs, target_rse, rse_metric, time_budget, hooks, limits, per_process, memory_accounting, pss_sample_every, sample_activity, counters, shell, shell_overhead = None):
+    adaptive = target_rse is not None or time_budget is not None
+    measured_runs_num = max_runs if adaptive else iterations_num
+
+    benchmark_start = current_nano_time()
+    raw_iterations = benchmark_raw_iterations(command, warmup + measured_runs_num, sample_interval_ms, sampler_backend, cgroup, time_source, stdout_capture, stderr_capture, jobs, monitor, hooks, limits, per_process, memory_accounting, pss_sample_every, sample_activity, counters, shell, shell_overhead)
+    rse_metric_values = []
+    try:
+        for iteration_index, raw_benchmark_result in enumerate(raw_iterations):
+            if iteration_index < warmup:
+                continue
+            yield raw_benchmark_result
 
-    for _ in range(iterations_num):
-        raw_benchmark_result = single_benchmark_command_raw(command)
-        final_benchmark_result = raw_benchmark_result if raw_data else raw_to_final_benchmark(raw_benchmark_result)
-        yield BenchmarkResults([final_benchmark_result])
+            if not adaptive:
+                continue
+            rse_metric_values.append(get_rse_metric_value(raw_benchmark_result, rse_metric))
+            if len(rse_metric_values) < min_runs:
+                continue
+            if target_rse is not None and relative_standard_error(rse_metric_values) <= target_rse:
+                break
+            if time_budget is not None and (current_nano_time() - benchmark_start) / 1e9 >= time_budget:
+                break
+    finally:
+        # Stops the iterations still running in other jobs, and the monitors
+        raw_iterations.close()
+
+# Value of an iteration the adaptive mode watches the precision of
+def get_rse_metric_value(raw_benchmark_result, rse_metric):
+    final_benchmark_result = raw_to_final_benchmark(raw_benchmark_result)
+    if rse_metric == "memory":
+        return final_benchmark_result["memory"]["max"]
+    return final_benchmark_result["process"]["execution_time"]
+
+# Runs the iterations and yields their raw results as they finish
+def benchmark_raw_iterations(command, iterations_num, sample_interval_ms, sampler_backend, cgroup, time_source, stdout_capture, stderr_capture, jobs, monitor, hooks, limits, per_process, memory_accounting, pss_sample_every, sample_activity, counters, shell, shell_overhead = None):
+    cgroup = cgroup and check_cgroup_support()
+    run_options = (sample_interval_ms, sampler_backend, cgroup, time_source, stdout_capture, stderr_capture, limits, per_process, memory_accounting, pss_sample_every, sample_activity, counters)
+    if shell:
+        command = get_shell_argv(command, shell)
+
+    if jobs > 1:
+        if shell and shell_overhead is None:
+            shell_overhead = measure_shell_overhead(shell, sample_interval_ms, sampler_backend, cgroup, time_source)
+        for _, raw_benchmark_result in benchmark_parallel_raw_iterations(lambda iteration_index: command, iterations_num, run_options, jobs, hooks, shell_overhead = shell_overhead):
+            yield raw_benchmark_result
+        return
+
+    # The collectors are started once and watch every iteration
+    own_monitor = monitor is None
+    if own_monitor:
+        monitor = BenchmarkMonitor()
+
+    try:
+        if shell and shell_overhead is None:
+            shell_overhead = measure_shell_overhead(shell, sample_interval_ms, sampler_backend, cgroup, time_source, monitor)
+        for iteration_index in range(iterations_num):
+            yield run_hooked_iteration(hooks, iteration_index, command, run_options, monitor, shell_overhead)
+    finally:
+        if own_monitor:
+            monitor.close()
+
+# Runs iterations as concurrent jobs, get_command(iteration_index) giving the command of each iteration
+# and get_command_iteration(iteration_index) its index among the iterations of its command (for the hooks).
+# Yields the index and the raw results of the iterations as they finish.
+def benchmark_parallel_raw_iterations(get_command, iterations_num, run_options, jobs, hooks, get_command_iteration = lambda iteration_index: iteration_index, shell_overhead = None):
+    # Every job gets a monitor of its own, pinned with its commands to the job's cores
+    job_monitors = []
+    try:
+        for cores in split_cores(jobs):
+            job_monitors.append(BenchmarkMonitor(cores))
+        run_iteration = lambda job_index, iteration_index: run_hooked_iteration(hooks, get_command_iteration(iteration_index), get_command(iteration_index), run_options, job_monitors[job_index], shell_overhead)
+        yield from run_parallel_iterations(run_iteration, iterations_num, jobs)
+    finally:
+        for job_monitor in job_monitors:
+            job_monitor.close()
+
+# Runs an iteration between the prepare and cleanup hooks, in the cache state it should start in
+def run_hooked_iteration(hooks, iteration_index, command, run_options, monitor, shell_overhead = None):
+    cache_results = hooks.before_iteration(iteration_index)
+    try:
+        raw_benchmark_result = single_benchmark_command_raw(command, *run_options, monitor)
+    finally:
+        hooks.after_iteration()
+    if cache_results is not None:
+        raw_benchmark_result["cache"] = cache_results
+    if shell_overhead is not None:
+        raw_benchmark_result["shell"] = shell_overhead
+    return raw_benchmark_result
+
+# The argv a command runs with: a list is used as it is, a string is split the way a shell would (without running one)
+def get_command_argv(command):
+    if isinstance(command, (list, tuple)):
+        if len(command) == 0:
+            raise Exception("The command is empty")
+        return [str(argument) for argument in command]
+    return shlex.split(command)
+
+# The command as it would be typed in a shell
+def format_command(command):
+    if isinstance(command, (list, tuple)):
+        return " ".join(shlex.quote(str(argument)) for argument in command)
+    return command
+
+def get_shell_path(shell):
+    return DEFAULT_SHELL if shell is True else shell
+
+# The argv running the command (a string, or an argv that gets quoted) in the shell
+def get_shell_argv(command, shell):
+    return [get_shell_path(shell), "/C" if is_win else "-c", format_command(command)]
+
+# Resident memory of the shell blocked in a builtin (reading its stdin). It is what the shell adds to the
+# memory of pipelines and compound commands, which it stays in memory for (simple commands replace it).
+def measure_shell_memory(shell):
+    shell_process = psutil.Popen(get_shell_argv("set /p _=" if is_win else "read _", shell), stdin = subprocess.PIPE, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    try:
+        wait_start = current_nano_time()
+        while shell_process.status() != psutil.STATUS_SLEEPING and current_nano_time() - wait_start < 1e9:
+            time.sleep(0.001)
+        return shell_process.memory_info().rss
+    except psutil.NoSuchProcess:
+        return 0
+    finally:
+        shell_process.stdin.close()
+        shell_process.wait()
+
+# Mean runtime and CPU time of the shell running an empty command, like hyperfine does, and its memory.
+# The final results of commands run in shell mode have them subtracted.
+def measure_shell_overhead(shell, sample_interval_ms, sampler_backend, cgroup, time_source, monitor = None):
+    own_monitor = monitor is None
+    if own_monitor:
+        monitor = BenchmarkMonitor()
+    try:
+        overhead_results = []
+        for _ in range(SHELL_OVERHEAD_RUNS):
+            raw_benchmark_result = single_benchmark_command_raw(get_shell_argv("", shell), sample_interval_ms, sampler_backend, cgroup, time_source, "discard", "discard", None, False, "rss", DEFAULT_PSS_SAMPLE_EVERY, False, False, monitor)
+            overhead_results.append(raw_to_final_benchmark(raw_benchmark_result))
+    finally:
+        if own_monitor:
+            monitor.close()
+
+    return {
+        "path": get_shell_path(shell),
+        "overhead_runs": SHELL_OVERHEAD_RUNS,
+        "overhead_execution_time": float(np.mean([result["process"]["execution_time"] for result in overhead_results])),
+        "overhead_user_time": float(np.mean([result["cpu"]["user_time"] for result in overhead_results])),
+        "overhead_system_time": float(np.mean([result["cpu"]["system_time"] for result in overhead_results])),
+        "overhead_memory": measure_shell_memory(shell)
+    }
 
 # Uses benchmark_command_raw and raw_to_final_benchmark to get, compile and format 
 # the most accurate info from /user/bin/time and psutil library 
@@ -46,11 +381,12 @@ def benchmark_command_generator(command, iterations_num = 1, raw_data = False):
 # For reasoning of choosing the right tool (either GNU time or psutil) for each
 # resource (CPU, memory and disk usage) refer to the ipython notebook in the repository
 
-def raw_to_final_benchmark(benchmark_raw_dict):
+def raw_to_final_benchmark(benchmark_raw_dict, time_resolution = "ms"):
 
     process_stdout_data = benchmark_raw_dict["general"]["stdout_data"]
     process_stderr_data = benchmark_raw_dict["general"]["stderr_data"]
-    process_execution_time = benchmark_raw_dict["gnu_time"]["process"]["execution_time"] if is_linux else benchmark_raw_dict["psutil"]["process"]["execution_time"]
+    # Runs of the async API have no GNU Time (or rusage) results
+    process_execution_time = benchmark_raw_dict["gnu_time"]["process"]["execution_time"] if "gnu_time" in benchmark_raw_dict else benchmark_raw_dict["psutil"]["process"]["execution_time"]
 
     cpu_user_time = benchmark_raw_dict["psutil"]["cpu"]["user_time"]
     cpu_system_time = benchmark_raw_dict["psutil"]["cpu"]["system_time"]
@@ -58,26 +394,77 @@ def raw_to_final_benchmark(benchmark_raw_dict):
 
     memory_max = benchmark_raw_dict["psutil"]["memory"]["max"]
     memory_max_perprocess = benchmark_raw_dict["psutil"]["memory"]["max_perprocess"]
-
-    time_series_sample_milliseconds = benchmark_raw_dict["time_series"]["sample_milliseconds"]
+    # Peak of the summed RSS, whatever the memory accounting
+    memory_max_rss = memory_max
+
+    # cgroup accounting covers every process of the command, even the ones that lived
+    # shorter than a sampling interval, and memory spikes between samples
+    cgroup_results = benchmark_raw_dict.get("cgroup")
+    if cgroup_results is not None:
+        cpu_user_time = cgroup_results["cpu"]["user_time"]
+        cpu_system_time = cgroup_results["cpu"]["system_time"]
+        cpu_total_time = cgroup_results["cpu"]["total_time"]
+        memory_max = cgroup_results["memory"]["max"]
+
+    # In shell mode, what the shell alone uses is not the command's
+    shell_results = benchmark_raw_dict.get("shell")
+    if shell_results is not None:
+        process_execution_time = max(process_execution_time - shell_results["overhead_execution_time"], 0.0)
+        cpu_user_time = max(cpu_user_time - shell_results["overhead_user_time"], 0.0)
+        cpu_system_time = max(cpu_system_time - shell_results["overhead_system_time"], 0.0)
+        cpu_total_time = cpu_user_time + cpu_system_time
+        memory_max = max(memory_max - shell_results["overhead_memory"], 0)
+        memory_max_rss = max(memory_max_rss - shell_results["overhead_memory"], 0)
+
+    # With PSS accounting, shared pages are split between the processes sharing them instead of counted by each.
+    # The shell's overhead is an RSS: in shell mode, the PSS peak includes the shell's (small) share.
+    memory_max_pss = benchmark_raw_dict["psutil"]["memory"].get("max_pss")
+    memory_max_uss = benchmark_raw_dict["psutil"]["memory"].get("max_uss")
+    if memory_max_pss is not None:
+        memory_max = memory_max_pss
+
+    # Timestamps are recorded in nanoseconds and reported in the requested unit
+    time_series_time_key, _ = TIME_RESOLUTIONS[time_resolution]
+    time_series_sample_times = convert_sample_nanoseconds(benchmark_raw_dict["time_series"]["sample_nanoseconds"], time_resolution)
     time_series_cpu_percentages = benchmark_raw_dict["time_series"]["cpu_percentages"]
     time_series_memory_bytes = benchmark_raw_dict["time_series"]["memory_bytes"]
 
     exit_code = benchmark_raw_dict["general"]["exit_code"]
+    output_counts = {key: benchmark_raw_dict["general"][key] for key in ["stdout_bytes", "stdout_lines", "stderr_bytes", "stderr_lines"]}
 
-
+    sampling_results = benchmark_raw_dict["sampling"]
 
     benchmark_results = {
-        "process": { "stdout_data": process_stdout_data, "stderr_data": process_stderr_data, "execution_time": process_execution_time, "exit_code": exit_code },
+        "process": { "stdout_data": process_stdout_data, "stderr_data": process_stderr_data, **output_counts, "execution_time": process_execution_time, "exit_code": exit_code },
         "cpu": { "user_time": cpu_user_time, "system_time": cpu_system_time, "total_time": cpu_total_time },
         "memory": { "max": memory_max, "max_perprocess": memory_max_perprocess },
         "time_series":
         {
-            "sample_milliseconds": time_series_sample_milliseconds,
+            time_series_time_key: time_series_sample_times,
             "cpu_percentages": time_series_cpu_percentages,
             "memory_bytes": time_series_memory_bytes
-        }
+        },
+        "sampling": sampling_results
     }
+    if memory_max_pss is not None:
+        benchmark_results["memory"].update({ "max_rss": memory_max_rss, "max_pss": memory_max_pss, "max_uss": memory_max_uss })
+        for time_series_key in ["pss_bytes", "uss_bytes"]:
+            benchmark_results["time_series"][time_series_key] = benchmark_raw_dict["time_series"][time_series_key]
+
+    # Disk rates are not sampled on macos, the activity only with sample_activity
+    for time_series_key in [get_rate_key(counter_key) for counter_key in DISK_SERIES_KEYS + ACTIVITY_COUNTER_KEYS] + ACTIVITY_COUNT_KEYS:
+        if time_series_key in benchmark_raw_dict["time_series"]:
+            benchmark_results["time_series"][time_series_key] = benchmark_raw_dict["time_series"][time_series_key]
+
+    # Totals of the whole run, including the processes that lived shorter than a sampling interval (linux only)
+    if "gnu_time" in benchmark_raw_dict and "context_switches" in benchmark_raw_dict["gnu_time"]:
+        benchmark_results["context_switches"] = benchmark_raw_dict["gnu_time"]["context_switches"]
+        benchmark_results["page_faults"] = benchmark_raw_dict["gnu_time"]["page_faults"]
+    # Performance counters of the whole tree, with counters (the shell's work is not taken out in shell mode)
+    if "counters" in benchmark_raw_dict:
+        counters = dict(benchmark_raw_dict["counters"])
+        counters["instructions_per_cycle"] = counters["instructions"] / counters["cycles"] if counters["cycles"] != 0 else math.nan
+        benchmark_results["counters"] = counters
     # psutil io_counters() is not available on macos
     if not is_macos:
         disk_read_bytes = benchmark_raw_dict["psutil"]["disk"]["io_counters"]["read_bytes"]
@@ -99,6 +486,11 @@ def raw_to_final_benchmark(benchmark_raw_dict):
         disk_write_count = benchmark_raw_dict["psutil"]["disk"]["io_counters"]["write_count"]
         disk_total_count = disk_read_count + disk_write_count
 
+        if cgroup_results is not None and "disk" in cgroup_results:
+            disk_read_bytes = cgroup_results["disk"]["read_bytes"]
+            disk_write_bytes = cgroup_results["disk"]["write_bytes"]
+            disk_total_bytes = disk_read_bytes + disk_write_bytes
+
         disk_results = {
         "read_bytes": disk_read_bytes,
         "write_bytes": disk_write_bytes,
@@ -117,20 +509,80 @@ def raw_to_final_benchmark(benchmark_raw_dict):
 
         benchmark_results["disk"] = disk_results
 
+    # Only when iterations ran as concurrent jobs
+    if "parallel" in benchmark_raw_dict:
+        benchmark_results["parallel"] = benchmark_raw_dict["parallel"]
+
+    # Only when a python function was benchmarked
+    if "python" in benchmark_raw_dict:
+        benchmark_results["python"] = benchmark_raw_dict["python"]
+
+    # Only when iterations started in a given page cache state
+    if "cache" in benchmark_raw_dict:
+        benchmark_results["cache"] = benchmark_raw_dict["cache"]
+
+    # Only when iterations ran with resource limits
+    if "limits" in benchmark_raw_dict:
+        benchmark_results["limits"] = benchmark_raw_dict["limits"]
+
+    # Only in shell mode
+    if shell_results is not None:
+        benchmark_results["shell"] = shell_results
+
+    # Only with per-process records
+    if "processes" in benchmark_raw_dict:
+        benchmark_results["processes"] = raw_to_final_processes(benchmark_raw_dict["processes"], time_resolution)
+
+    # Only when iterations ran on workers
+    if "host" in benchmark_raw_dict:
+        benchmark_results["host"] = benchmark_raw_dict["host"]
+
     return benchmark_results
 
-def collect_fixed_data(shared_process_dict):
-    while shared_process_dict["target_process_pid"] == -1:
-        if shared_process_dict["skip_benchmarking"]:
-            return
+def validate_sampler_backend(sampler_backend):
+    if sampler_backend not in SAMPLER_BACKENDS:
+        raise Exception("Unknown sampler backend %s, expected one of: %s" % (sampler_backend, ", ".join(SAMPLER_BACKENDS)))
+    if sampler_backend == "procfs" and not procfs_available:
+        raise Exception("The procfs sampler backend is only available on linux")
+
+# Process object the collectors monitor the target through: a psutil.Process or its /proc based equivalent
+def get_monitored_process(pid, sampler_backend):
+    if sampler_backend == "procfs" or (sampler_backend == "auto" and procfs_available):
+        return ProcfsProcess(pid)
+    return psutil.Process(pid)
+
+# cgroup accounting needs a delegated cgroup v2 hierarchy. Warns and returns False when it can't be used.
+# Only reads the hierarchy: no cgroup is created, no controller is enabled and no process is moved.
+def check_cgroup_support():
+    if not is_linux:
+        click.secho("Warning: cgroup accounting is only available on linux, falling back to psutil.", fg = "yellow")
+        return False
+    try:
+        check_benchmark_cgroup_support()
+    except CgroupError as e:
+        click.secho("Warning: cgroup accounting is not available (%s), falling back to psutil." % e, fg = "yellow")
+        return False
+    return True
+
+def close_monitored_process(p):
+    if isinstance(p, ProcfsProcess):
+        p.close_tree()
+
+# Both collectors are given the target's pid by the monitor once it has been spawned,
+# and call attached() once they hold the process (or found it gone)
+def collect_fixed_data(shared_state, target_process_pid, sampler_backend, attached = None):
+    monitor_cpu_time_start = monitor_cpu_time()
 
     try:
-        p = psutil.Process(shared_process_dict["target_process_pid"])
+        p = get_monitored_process(target_process_pid, sampler_backend)
     except psutil.NoSuchProcess:
-        # The process might have already ended
-        shared_process_dict["skip_benchmarking"] = True
+        # The process might have already ended (GNU Time reaps the command itself)
+        shared_state["skip_benchmarking"] = True
         click.secho(f"Warning: The process ended before cmdbench could start monitoring it.", fg = "yellow")
         return
+    finally:
+        if attached is not None:
+            attached()
 
     # If we were able to access the process info at least once without access denied error
     had_permission = False
@@ -141,8 +593,15 @@ def collect_fixed_data(shared_process_dict):
     # Disk
     disk_io_counters = None
 
+    # The target's exit wakes the collector up right away, instead of at the next sample
+    target_pidfd = open_pidfd(target_process_pid)
+    scheduler = SampleScheduler(shared_state["sample_interval_ms"], target_pidfd)
+
     # While loop runs as long as the target command is running
-    while not shared_process_dict["skip_benchmarking"]:
+    target_exited = False
+    while not shared_state["skip_benchmarking"] and not target_exited:
+        target_exited = scheduler.wait()
+
         # retcode would be None while subprocess is running
         if not p.is_running():
             break
@@ -175,56 +634,90 @@ def collect_fixed_data(shared_process_dict):
                     
                 print("Access Denied. Root access is needed for monitoring the target command.")
                 raise access_denied_error
-                break
             except psutil.NoSuchProcess as e:
                 # The process might end while we are measuring resources
                 pass
-            except Exception as e:
-                raise e
-                break
 
-    shared_process_dict["cpu_times"] = cpu_times
-    shared_process_dict["disk_io_counters"] = disk_io_counters
+    if cpu_times is not None:
+        shared_state["has_cpu_times"] = True
+        shared_state["cpu_user_time"] = cpu_times.user
+        shared_state["cpu_system_time"] = cpu_times.system
+        if is_linux:
+            shared_state["cpu_children_user_time"] = cpu_times.children_user
+            shared_state["cpu_children_system_time"] = cpu_times.children_system
 
-def collect_time_series(shared_process_dict):
-    
-    while shared_process_dict["target_process_pid"] == -1:
-        if shared_process_dict["skip_benchmarking"]:
-            return
+    if disk_io_counters is not None:
+        for io_counter_key in io_counter_keys:
+            shared_state[io_counter_key] = getattr(disk_io_counters, io_counter_key)
+
+    close_monitored_process(p)
+    if target_pidfd is not None:
+        os.close(target_pidfd)
+
+    shared_state["fixed_data_monitor_cpu_time"] = monitor_cpu_time() - monitor_cpu_time_start
+
+# With a stop_fd, the collector takes a last sample and stops once stop_fd becomes readable
+# (used when the target is the benchmarking process itself, which doesn't exit).
+# With the per_process state field set, every process' usage goes to process_ring as well,
+# and the processes' records (see processes.ProcessRecords) are returned.
+def collect_time_series(shared_state, time_series_ring, process_ring, target_process_pid, execution_start, sampler_backend, cgroup_path = None, stop_fd = None, attached = None):
+    monitor_cpu_time_start = monitor_cpu_time()
 
     try:
-        p = psutil.Process(shared_process_dict["target_process_pid"])
+        p = get_monitored_process(target_process_pid, sampler_backend)
     except psutil.NoSuchProcess:
         # The process might have already ended
-        shared_process_dict["skip_benchmarking"] = True
+        shared_state["skip_benchmarking"] = True
         return
-    execution_start = shared_process_dict["execution_start"]
-    sample_milliseconds = shared_process_dict["sample_milliseconds"]
-    cpu_percentages = shared_process_dict["cpu_percentages"]
-    memory_values = shared_process_dict["memory_values"]
+    finally:
+        if attached is not None:
+            attached()
 
-    memory_perprocess_max = 0; shared_process_dict["memory_perprocess_max"]
+    memory_perprocess_max = 0
     memory_max = 0
 
-    # Children that we are processing
-    # Set for faster "in" operation
-    monitoring_process_children_set = set()
-    # List for actual process access
-    monitoring_process_children = []
+    # In cgroup mode the time series follows the cgroup's memory usage instead of the RSS sum
+    cgroup_memory_counter = CgroupCounter(cgroup_path, "memory.current") if cgroup_path is not None else None
+    cgroup_memory_max = 0
+
+    # Children that we are monitoring, keyed by pid
+    # On macOS and Windows, also used for the final user and system cpu time calculation
+    children_table = ProcessTable()
 
     # If we were able to access the process info at least once without access denied error
     had_permission = False
 
-    # For macOS and Windows. Will be used for final user and system cpu time calculation
-    children_cpu_times = []
+    try:
+        target_create_time = p.create_time()
+    except psutil.Error:
+        target_create_time = time.time()
+
+    process_records = None
+    if shared_state["per_process"]:
+        process_records = ProcessRecords(target_create_time)
+
+    # With PSS accounting, the PSS and USS of the tree are sampled alongside its RSS
+    pss_sampler = ProportionalMemorySampler(shared_state["pss_sample_every"]) if shared_state["pss_sample_every"] > 0 else None
+    pss_max, uss_max = 0, 0
+    pss_usage, uss_usage = 0, 0
+
+    sample_activity = shared_state["sample_activity"]
+    activity = (0, ) * len(ACTIVITY_COUNTER_KEYS + ACTIVITY_COUNT_KEYS)
+
+    # The target's exit wakes the collector up right away, instead of at the next sample
+    target_pidfd = open_pidfd(target_process_pid) if stop_fd is None else None
+    scheduler = SampleScheduler(shared_state["sample_interval_ms"], target_pidfd if stop_fd is None else stop_fd)
+
+    target_exited = False
+    while not shared_state["skip_benchmarking"] and not target_exited:
+        target_exited = scheduler.wait()
 
-    while True:
         # retcode would be None while subprocess is running
         if not p.is_running():
             break
         
         try:
-            time_from_monitoring_start = current_milli_time() - execution_start
+            time_from_monitoring_start = current_nano_time() - execution_start
 
             cpu_percentage = p.cpu_percent()
 
@@ -233,35 +726,73 @@ def collect_time_series(shared_process_dict):
             memory_usage = memory_usage_info.rss
             memory_perprocess_max = max(memory_perprocess_max, memory_usage)
 
+            # On linux, the target's counters include the ones of the children it reaped
+            disk_counters = read_disk_counters(p)
+
+            if pss_sampler is not None:
+                pss_sampler.add(p.pid, target_create_time)
+            if sample_activity:
+                activity = read_activity_counters(p)
+
+            # (process index, CPU percentage, CPU time, memory) of every process in the sample
+            if process_records is not None:
+                target_cpu_times = p.cpu_times()
+                process_rows = [(process_records.get_index(p, target_create_time), cpu_percentage, target_cpu_times.user + target_cpu_times.system, memory_usage)]
+
             current_children = p.children(recursive=True)
+            current_children_pids = set()
             for child in current_children:
-                with child.oneshot():
-                    child_memory_usage_info = child.memory_info()
-                    child_memory_usage = child_memory_usage_info.rss
-
-                    memory_usage += child_memory_usage
-
-                    memory_perprocess_max = max(memory_perprocess_max, child_memory_usage)
-                    # We need to get cpu_percentage() only for children existing for at list one iteration
-                    # Calculate CPU usage for children we have been monitoring
-                if child in monitoring_process_children_set:
-                    child_index = monitoring_process_children.index(child)
-                    target_child_process = monitoring_process_children[child_index]
-                    if not is_linux: # psutil calculates children usage for us on linux. Otherwise we save the values ourselved
-                        children_cpu_times[child_index] = target_child_process.cpu_times()
-                    child_cpu_usage = target_child_process.cpu_percent()
-                    cpu_percentage += child_cpu_usage
-                # Add children not already in our monitoring_process_children
-                else:
-                    monitoring_process_children_set.add(child)
-                    monitoring_process_children.append(child)
-                    children_cpu_times.append((0, 0, 0, 0)) # Placeholder; almost the same shape as psutil.pcputimes
+                try:
+                    with child.oneshot():
+                        child_memory_usage_info = child.memory_info()
+                        child_memory_usage = child_memory_usage_info.rss
+                        child_disk_counters = read_disk_counters(child)
+                        if sample_activity:
+                            child_activity = read_activity_counters(child)
+
+                        child_entry = children_table.get_entry(child)
+
+                        # psutil calculates children usage for us on linux. Otherwise we save the values ourselves
+                        if not is_linux:
+                            child_entry.cpu_times = child.cpu_times()
+                    # cpu_percent() measures usage since its previous call on the same object,
+                    # so it is always called on the object we first saw the child with
+                    child_cpu_usage = child_entry.process.cpu_percent()
+                    if process_records is not None:
+                        child_cpu_times = child_entry.process.cpu_times()
+                        process_rows.append((process_records.get_index(child_entry.process, child_entry.create_time), child_cpu_usage, child_cpu_times.user + child_cpu_times.system, child_memory_usage))
+                except psutil.NoSuchProcess:
+                    # The child might end while we are measuring it
+                    continue
+
+                memory_usage += child_memory_usage
+                memory_perprocess_max = max(memory_perprocess_max, child_memory_usage)
+                cpu_percentage += child_cpu_usage
+                disk_counters = tuple(map(sum, zip(disk_counters, child_disk_counters)))
+                if pss_sampler is not None:
+                    pss_sampler.add(child.pid, child_entry.create_time)
+                if sample_activity:
+                    activity = tuple(map(sum, zip(activity, child_activity)))
+                current_children_pids.add(child.pid)
+
+            # Children that exited keep their entry (and last cpu times) in the table's exited entries
+            children_table.prune(current_children_pids)
 
             memory_max = max(memory_max, memory_usage)
+            if pss_sampler is not None:
+                pss_usage, uss_usage = pss_sampler.read_sample()
+                pss_max = max(pss_max, pss_usage)
+                uss_max = max(uss_max, uss_usage)
+
+            if cgroup_memory_counter is not None:
+                memory_usage = cgroup_memory_counter.read()
+                cgroup_memory_max = max(cgroup_memory_max, memory_usage)
 
-            sample_milliseconds.append(time_from_monitoring_start)
-            cpu_percentages.append(cpu_percentage)
-            memory_values.append(memory_usage)
+            time_series_ring.append((time_from_monitoring_start, cpu_percentage, memory_usage, pss_usage, uss_usage) + disk_counters + activity)
+            if process_records is not None:
+                for process_row in process_rows:
+                    process_ring.append((time_from_monitoring_start, ) + process_row)
+                process_records.update_alive(set(process_row[0] for process_row in process_rows), time_from_monitoring_start)
 
             had_permission = True
 
@@ -285,78 +816,428 @@ def collect_time_series(shared_process_dict):
         children_user_cpu_time = 0
         children_system_cpu_time = 0
 
-        for cpu_time in children_cpu_times:
-            children_user_cpu_time += cpu_time[0]
-            children_system_cpu_time += cpu_time[1]
+        for child_entry in children_table.all_entries():
+            if child_entry.cpu_times is not None:
+                children_user_cpu_time += child_entry.cpu_times[0]
+                children_system_cpu_time += child_entry.cpu_times[1]
+
+        shared_state["children_user_cpu_time"] = children_user_cpu_time
+        shared_state["children_system_cpu_time"] = children_system_cpu_time
+
+    close_monitored_process(p)
+    if target_pidfd is not None:
+        os.close(target_pidfd)
+    if cgroup_memory_counter is not None:
+        cgroup_memory_counter.close()
+
+    shared_state["memory_max"] = memory_max
+    shared_state["pss_max"] = pss_max
+    shared_state["uss_max"] = uss_max
+    shared_state["cgroup_memory_max"] = cgroup_memory_max
+    shared_state["memory_perprocess_max"] = memory_perprocess_max
+
+    shared_state["time_series_monitor_cpu_time"] = monitor_cpu_time() - monitor_cpu_time_start
+
+    if process_records is not None:
+        return process_records.finish(current_nano_time() - execution_start)
+
+# Reads GNU Time's output file and parses it into a python dictionary
+def read_gnu_time_output(time_tmp_output_file):
+    f = open(time_tmp_output_file, "r")
+    gnu_times_lines = list(map(lambda line: line.strip(), f.readlines()))
+    gnu_times_dict = {}
+    for gnu_times_line in gnu_times_lines:
+        tokens = list(map(lambda token: token.strip(), gnu_times_line.rsplit(": ", 1)))
+        if len(tokens) < 2:
+            continue
+        key = tokens[0]
+        value = tokens[1].replace("?", "0")
+        gnu_times_dict[key] = value
+
+    # We need a conversion for elapsed time from time format to seconds
+    gnu_time_elapsed_wall_clock_key = "Elapsed (wall clock) time (h:mm:ss or m:ss)"
+    gnu_times_dict[gnu_time_elapsed_wall_clock_key] = str(get_sec(gnu_times_dict[gnu_time_elapsed_wall_clock_key]))
+    # And another conversion for cpu utilization percentage string
+    gnu_time_job_cpu_percent = "Percent of CPU this job got"
+    gnu_times_dict[gnu_time_job_cpu_percent] = float(gnu_times_dict[gnu_time_job_cpu_percent].replace("%", ""))
+
+    f.close()
+    os.remove(time_tmp_output_file)
+
+    # Convert all gnu time output's int values to int and float values to float
+    for key, value in gnu_times_dict.items():
+        if isint(value):
+            gnu_times_dict[key] = int(value)
+        elif isfloat(value):
+            gnu_times_dict[key] = float(value)
+
+    return gnu_times_dict
+
+# Builds the same dictionary GNU Time reports from the rusage os.wait4 returned for the command.
+# Like GNU Time, the rusage covers the command and all of its descendants it waited for.
+def rusage_to_gnu_time_dict(target_rusage, elapsed_time, exit_code, command):
+    cpu_time = target_rusage.ru_utime + target_rusage.ru_stime
+    return {
+        "Command being timed": "\"%s\"" % command,
+        "User time (seconds)": target_rusage.ru_utime,
+        "System time (seconds)": target_rusage.ru_stime,
+        "Percent of CPU this job got": float(round(cpu_time / elapsed_time * 100)) if elapsed_time > 0 else 0.0,
+        "Elapsed (wall clock) time (h:mm:ss or m:ss)": elapsed_time,
+        # The kernel does not fill the average sizes on linux, GNU Time reports them as 0 too
+        "Average shared text size (kbytes)": 0,
+        "Average unshared data size (kbytes)": 0,
+        "Average stack size (kbytes)": 0,
+        "Average total size (kbytes)": 0,
+        "Maximum resident set size (kbytes)": target_rusage.ru_maxrss,
+        "Average resident set size (kbytes)": 0,
+        "Major (requiring I/O) page faults": target_rusage.ru_majflt,
+        "Minor (reclaiming a frame) page faults": target_rusage.ru_minflt,
+        "Voluntary context switches": target_rusage.ru_nvcsw,
+        "Involuntary context switches": target_rusage.ru_nivcsw,
+        "Swaps": target_rusage.ru_nswap,
+        "File system inputs": target_rusage.ru_inblock,
+        "File system outputs": target_rusage.ru_oublock,
+        "Socket messages sent": target_rusage.ru_msgsnd,
+        "Socket messages received": target_rusage.ru_msgrcv,
+        "Signals delivered": target_rusage.ru_nsignals,
+        "Page size (bytes)": os.sysconf("SC_PAGE_SIZE"),
+        "Exit status": exit_code
+    }
 
-        shared_process_dict["children_user_cpu_time"] = children_user_cpu_time
-        shared_process_dict["children_system_cpu_time"] = children_system_cpu_time
+# psutil io_counters() fields, depending on the platform
+io_counter_keys = ["read_bytes", "write_bytes", "read_count", "write_count"]
+if is_linux:
+    io_counter_keys += ["read_chars", "write_chars"]
+if is_win:
+    io_counter_keys += ["other_count", "other_bytes"]
+
+# Columns of the time series samples. The disk counters are the whole tree's cumulative ones,
+# the time series gets their rates (see utils.get_counter_rates).
+time_series_columns = {
+    "sample_nanoseconds": np.int64,
+    "cpu_percentages": np.float64,
+    "memory_bytes": np.int64,
+    "pss_bytes": np.int64,
+    "uss_bytes": np.int64,
+    **{disk_series_key: np.int64 for disk_series_key in DISK_SERIES_KEYS},
+    **{activity_key: np.int64 for activity_key in ACTIVITY_COUNTER_KEYS + ACTIVITY_COUNT_KEYS}
+}
+
+# The process' DISK_SERIES_KEYS counters. Fields the platform doesn't have (e.g. read_chars outside of linux) are 0.
+# psutil io_counters() is not available on macos, and needs the same user as the process.
+def read_disk_counters(process):
+    if is_macos:
+        return (0, ) * len(DISK_SERIES_KEYS)
+    try:
+        disk_io_counters = process.io_counters()
+    except psutil.AccessDenied:
+        return (0, ) * len(DISK_SERIES_KEYS)
+    return tuple(getattr(disk_io_counters, disk_series_key, 0) for disk_series_key in DISK_SERIES_KEYS)
+
+# PSS and USS of the processes of a tree, summed for every sample.
+# Reading them makes the kernel walk the processes' page tables, so they are only read again every
+# sample_every samples: in between, a process keeps the last values read for it. A process joining
+# the tree (e.g. a fork sharing its parent's pages) changes the PSS of the others, all are read again then.
+class ProportionalMemorySampler():
+    def __init__(self, sample_every):
+        self.sample_every = sample_every
+        self._sample_index = 0
+        # (pss, uss) of the processes, keyed by pid and creation time
+        self._memory = {}
+        self._sample_keys = []
+
+    # Adds a process to the current sample
+    def add(self, pid, create_time):
+        self._sample_keys.append((pid, create_time))
+
+    # Summed (pss, uss) of the sample's processes. Processes that are not part of it left the tree.
+    def read_sample(self):
+        refresh = self._sample_index % self.sample_every == 0 or any(key not in self._memory for key in self._sample_keys)
+        self._sample_index += 1
+        sample_memory = {}
+        for key in self._sample_keys:
+            memory = self._memory.get(key)
+            if refresh:
+                try:
+                    memory = read_proportional_memory(key[0])
+                except psutil.NoSuchProcess:
+                    # The process might end while we are measuring it
+                    continue
+                except psutil.AccessDenied:
+                    # Processes of other users (e.g. setuid ones) are left out
+                    memory = (0, 0)
+            sample_memory[key] = memory
+        self._memory = sample_memory
+        self._sample_keys = []
+        return sum(memory[0] for memory in sample_memory.values()), sum(memory[1] for memory in sample_memory.values())
+
+# The process' ACTIVITY_COUNTER_KEYS and ACTIVITY_COUNT_KEYS values (see procfs.read_activity).
+# Elsewhere than on linux, psutil gives the context switches of the whole process, and page faults without
+# the ones of its reaped children (on windows, all of them count as minor faults).
+def read_activity_counters(process):
+    try:
+        if is_linux:
+            return tuple(read_activity(process.pid))
+        context_switches = process.num_ctx_switches()
+        memory_info = process.memory_info()
+        num_fds = process.num_handles() if is_win else process.num_fds()
+        return (
+            context_switches.voluntary,
+            context_switches.involuntary,
+            getattr(memory_info, "pfaults", getattr(memory_info, "num_page_faults", 0)),
+            getattr(memory_info, "pageins", 0),
+            process.num_threads(),
+            num_fds
+        )
+    except psutil.AccessDenied:
+        return (0, ) * len(ACTIVITY_COUNTER_KEYS + ACTIVITY_COUNT_KEYS)
+
+# Fields of the state shared between single_benchmark_command_raw and its collectors.
+# Initial values set the fields' types.
+def new_shared_state_fields(sample_interval_ms):
+    return {
+        "skip_benchmarking": False,
+        "sample_interval_ms": float(sample_interval_ms),
+        "per_process": False,
+        "pss_sample_every": 0,
+        "sample_activity": False,
+
+        # Written by collect_time_series
+        "memory_max": 0,
+        "pss_max": 0,
+        "uss_max": 0,
+        "memory_perprocess_max": 0,
+        "cgroup_memory_max": 0,
+        "children_user_cpu_time": 0.0,
+        "children_system_cpu_time": 0.0,
+        "time_series_monitor_cpu_time": 0.0,
+
+        # Written by collect_fixed_data
+        "has_cpu_times": False,
+        "cpu_user_time": 0.0,
+        "cpu_system_time": 0.0,
+        "cpu_children_user_time": 0.0,
+        "cpu_children_system_time": 0.0,
+        "read_bytes": 0,
+        "write_bytes": 0,
+        "read_count": 0,
+        "write_count": 0,
+        "read_chars": 0,
+        "write_chars": 0,
+        "other_count": 0,
+        "other_bytes": 0,
+        "fixed_data_monitor_cpu_time": 0.0
+    }
 
-    shared_process_dict["memory_max"] = memory_max
-    shared_process_dict["memory_perprocess_max"] = memory_perprocess_max
+# Runs a collector for every job the monitor sends it, until the monitor sends None or goes away.
+# Sends ATTACHED as soon as the collector holds the job's process (or failed before it could),
+# then (None, what the collector returned), or (error, None): errors don't end the worker.
+def run_monitor_worker(connection, collector, collector_args):
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        acknowledged = []
+        def attached():
+            connection.send(ATTACHED)
+            acknowledged.append(True)
+        try:
+            result = (None, collector(*collector_args, *job, attached = attached))
+        except Exception as error:
+            result = (error, None)
+        if len(acknowledged) == 0:
+            attached()
+        connection.send(result)
+    connection.close()
+
+# Long-lived collectors shared by consecutive benchmark runs.
+#
+# Starting the collector processes and allocating their shared memory takes longer than running
+# a short command, so the monitor starts them once and then hands them a "watch this pid" job per run
+# through a pipe. Between runs the state and the time series ring are reset instead of recreated.
+#
+#   with BenchmarkMonitor() as monitor:
+#       for _ in range(1000):
+#           benchmark_command("ls", monitor = monitor)
+class BenchmarkMonitor():
+    # With cores (linux only), the collectors and the commands they watch are pinned to these cores
+    def __init__(self, cores = None):
+        # We need a non-blocking method to capture essential info (disk usage, cpu times)
+        # and non-essential time-series info in parallel.
+        # So we use either multiprocessing or threading to achieve this
+
+        # Linux: Processes are faster than threads
+        # Windows: Both are as fast but processes take longer to start
+        # Processes need shared memory (python >= 3.8) to hand their data back
+        self.use_processes = is_unix and shared_memory_available
+
+        # State shared with the collectors (flags and the fixed data they collect)
+        # and the time series samples. Both live in shared memory when collectors are processes.
+        self.shared_state = SharedBenchmarkState(new_shared_state_fields(DEFAULT_SAMPLE_INTERVAL_MS), shared = self.use_processes)
+        self.time_series_ring = SampleRing(time_series_columns, shared = self.use_processes)
+        self.process_ring = SampleRing(process_sample_columns, shared = self.use_processes)
+
+        self.cores = cores
+        self.closed = False
+        self._workers = []
+        self._connections = []
+        # Connections of the collectors working on the current job
+        self._busy_connections = []
+
+        worker_type = multiprocessing.Process if self.use_processes else threading.Thread
+        collectors = [
+            (collect_time_series, (self.shared_state, self.time_series_ring, self.process_ring)),
+            (collect_fixed_data, (self.shared_state, ))
+        ]
+        for collector, collector_args in collectors:
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = worker_type(target = run_monitor_worker, args = (worker_connection, collector, collector_args), daemon = True)
+            worker.start()
+            if cores is not None and self.use_processes:
+                os.sched_setaffinity(worker.pid, cores)
+            self._workers.append(worker)
+            self._connections.append(connection)
+
+    # Gets the state and the sample rings ready for a new run
+    # pss_sample_every > 0 has the time series collector read the PSS and USS of the processes as well,
+    # sample_activity their context switches, page faults, threads and file descriptors
+    def prepare(self, sample_interval_ms, per_process = False, pss_sample_every = 0, sample_activity = False):
+        if self.closed:
+            raise Exception("The monitor is closed")
+
+        # An interrupted run might have left the collectors working
+        if len(self._busy_connections) > 0:
+            self.shared_state["skip_benchmarking"] = True
+            try:
+                self.wait()
+            except Exception:
+                pass
 
-    shared_process_dict["sample_milliseconds"] = sample_milliseconds
-    shared_process_dict["cpu_percentages"] = cpu_percentages
-    shared_process_dict["memory_values"] = memory_values 
+        self.shared_state.reset()
+        self.shared_state["sample_interval_ms"] = sample_interval_ms
+        self.shared_state["per_process"] = per_process
+        self.shared_state["pss_sample_every"] = pss_sample_every
+        self.shared_state["sample_activity"] = sample_activity
+        self.time_series_ring.reset()
+        self.process_ring.reset()
+
+    # Hands the target process over to the collectors, which start monitoring it right away.
+    # Returns once they hold it: until the command is reaped, its pid can't be reused, so even a
+    # command that already exited is the one they attach to.
+    def watch(self, target_process_pid, execution_start, sampler_backend, cgroup_path = None):
+        jobs = [(target_process_pid, execution_start, sampler_backend, cgroup_path), (target_process_pid, sampler_backend)]
+        for connection, job in zip(self._connections, jobs):
+            connection.send(job)
+        self._busy_connections = list(self._connections)
+        for connection in self._busy_connections:
+            try:
+                connection.recv()
+            except EOFError:
+                # The worker is gone, wait() reports it
+                pass
+
+    # Waits for the collectors to be done with the target process, raising the first error they ran into.
+    # Returns what the collectors returned (the time series collector's per-process records, if any).
+    def wait(self):
+        errors = []
+        results = []
+        for connection in self._busy_connections:
+            try:
+                error, result = connection.recv()
+            except EOFError:
+                error, result = Exception("A monitoring worker exited unexpectedly"), None
+            if error is not None:
+                errors.append(error)
+            results.append(result)
+        self._busy_connections = []
+        if len(errors) > 0:
+            raise errors[0]
+        return results
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        # Collectors still watching a process stop at their next sample
+        self.shared_state["skip_benchmarking"] = True
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except OSError:
+                # The worker is already gone
+                pass
+        for worker in self._workers:
+            worker.join(timeout = 1)
+            if self.use_processes and worker.is_alive():
+                worker.terminate()
+        for connection in self._connections:
+            connection.close()
+
+        self.time_series_ring.unlink()
+        self.time_series_ring.close()
+        self.process_ring.unlink()
+        self.process_ring.close()
+        self.shared_state.unlink()
+        self.shared_state.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 # Performs benchmarking on the command based on both /usr/bin/time and psutil library
-def single_benchmark_command_raw(command):
-    # https://docs.python.org/3/library/shlex.html#shlex.split
-    commands_list = shlex.split(command)
+def single_benchmark_command_raw(command, sample_interval_ms = DEFAULT_SAMPLE_INTERVAL_MS, sampler_backend = "auto", cgroup = False, time_source = "rusage", stdout_capture = "keep", stderr_capture = "keep", limits = None, per_process = False, memory_accounting = "rss", pss_sample_every = DEFAULT_PSS_SAMPLE_EVERY, sample_activity = False, counters = False, monitor = None):
+    # A single run gets monitored by collectors of its own
+    if monitor is None:
+        with BenchmarkMonitor() as monitor:
+            return single_benchmark_command_raw(command, sample_interval_ms, sampler_backend, cgroup, time_source, stdout_capture, stderr_capture, limits, per_process, memory_accounting, pss_sample_every, sample_activity, counters, monitor)
+
+    use_pss = memory_accounting == "pss"
+    if use_pss and not is_linux:
+        raise Exception("PSS memory accounting is only available on linux")
+    if counters and not is_linux:
+        raise Exception("Performance counters are only available on linux")
+
+    commands_list = get_command_argv(command)
 
     time_tmp_output_file = None
 
-    if is_linux:
+    # On linux, the command's resource usage is either read by the kernel's wait4 rusage
+    # when we reap the command, or reported by GNU Time wrapping the command
+    use_rusage = is_linux and time_source == "rusage"
+    use_gnu_time = is_linux and time_source == "gnu_time"
+
+    if use_gnu_time:
         # Preprocessing: Wrap the target command around the GNU Time command
         time_tmp_output_file = tempfile.mkstemp(suffix = ".temp")[1] # [1] for getting temporary filename and not the file's stream
         commands_list = ["/usr/bin/time", "-o", time_tmp_output_file, "-v"] + commands_list
 
     # START: Initialization
 
-    # CPU
-    cpu_times = None
-    
-    # Disk
-    disk_io_counters = None
+    shared_state = monitor.shared_state
+    time_series_ring = monitor.time_series_ring
+    monitor.prepare(sample_interval_ms, per_process, pss_sample_every if use_pss else 0, sample_activity)
 
-    # Time series data
-    # We don't need fast read access, we need fast insertion so we use deque
-    sample_milliseconds, cpu_percentages, memory_values = deque([]), deque([]), deque([])
-    
-    manager = multiprocessing.Manager()
-    shared_process_dict_template = {
-        "target_process_pid": -1,
-        "execution_start": -1, 
-        "sample_milliseconds": sample_milliseconds, 
-        "cpu_percentages": cpu_percentages, 
-        "memory_values": memory_values,
-        "memory_max": 0,
-        "memory_perprocess_max": 0,
-        "disk_io_counters": disk_io_counters,
-        "cpu_times": cpu_times,
-        "skip_benchmarking": False
-    }
-    try:
-        shared_process_dict = manager.dict(shared_process_dict_template)
-    except Exception as e:
-        pass
-
-    # Subprocess: For time series measurements
-
-    # We need a non-blocking method to capture essential info (disk usage, cpu times)
-    # and non-essential time-series info in parallel.
-    # So we use either multiprocessing or threading to achieve this
-
-    # Linux: Processes are faster than threads
-    # Windows: Both are as fast but processes take longer to start
-    if is_unix:
-        time_series_exec = multiprocessing.Process(target = collect_time_series, args = (shared_process_dict, ))
-        fixed_data_exec = multiprocessing.Process(target = collect_fixed_data, args = (shared_process_dict, ))
-    else:
-        time_series_exec = threading.Thread(target = collect_time_series, args = (shared_process_dict, ))
-        fixed_data_exec = threading.Thread(target = collect_fixed_data, args = (shared_process_dict, ))
-    time_series_exec.start()
-    fixed_data_exec.start()
+    # cgroup the command runs in when cgroup accounting is used
+    benchmark_cgroup = None
+    if cgroup:
+        try:
+            benchmark_cgroup = BenchmarkCgroup()
+        except CgroupError as e:
+            click.secho("Warning: cgroup accounting is not available (%s), falling back to psutil." % e, fg = "yellow")
+    cgroup_path = benchmark_cgroup.path if benchmark_cgroup is not None else None
+
+    use_limits = limits is not None and limits.enabled
+    if use_limits and limits.memory_limit is not None and benchmark_cgroup is not None:
+        benchmark_cgroup.set_memory_limit(limits.memory_limit)
+    # With limits, the command gets a process group of its own, so all of its processes can be stopped
+    # (GNU Time has to outlive the command to report on it: its command's process tree is stopped instead)
+    use_process_group = use_limits and is_unix and not use_gnu_time
 
     # p is always the target process to monitor
     p = None
@@ -364,132 +1245,232 @@ def single_benchmark_command_raw(command):
     # END: Initialization
 
     # Finally, run the command
-    # Master process could be GNU Time running target command or the target command itself
-    master_process = psutil.Popen(commands_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    execution_start = current_milli_time()
+    if use_rusage:
+        spawner_maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # The command starts in its cgroup, so none of its processes escape it: it moves itself there
+    # before exec. That's the only preexec_fn, and cgroups can't be used with the jobs' threads.
+    preexec_fn = benchmark_cgroup.add_current_process if benchmark_cgroup is not None else None
+
+    # With the executable's full path and nothing to run in the child before exec, subprocess starts the
+    # command with posix_spawn rather than fork and exec (file descriptors are not inheritable since
+    # python 3.4, so none of ours leak into it even without close_fds)
+    use_posix_spawn = is_unix and not use_process_group and preexec_fn is None
+    executable = shutil.which(commands_list[0]) if use_posix_spawn else None
+
+    # CPU time spent on the cores of a pinned command, to tell how much other processes used them
+    if monitor.cores is not None:
+        cores_busy_time_start = read_cores_busy_time(monitor.cores)
+
+    # Opened on this thread right before the command starts, which inherits them (see perf.py)
+    perf_counters = None
+    if counters:
+        perf_counters = PerfCounters()
+        try:
+            perf_counters.open()
+        except PerfCounterError as e:
+            # The iteration still gets a counters section, with all of them unavailable (NaN)
+            click.secho("Warning: performance counters are not available (%s)." % e, fg = "yellow")
+
+    # Master process could be GNU Time running target command or the target command itself.
+    # It's a plain subprocess.Popen: with rusage we reap it ourselves, and set the returncode of the
+    # object subprocess keeps track of (a psutil.Popen wrapping it would leave it looking alive).
+    # The command inherits the CPU affinity of the thread starting it: the thread is pinned to the
+    # command's cores while it does (the affinity is the thread's own, other jobs are not affected)
+    if monitor.cores is not None:
+        spawner_cores = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, monitor.cores)
+    try:
+        master_process = subprocess.Popen(commands_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            preexec_fn = preexec_fn, start_new_session = use_process_group, executable = executable, close_fds = not use_posix_spawn)
+    except BaseException:
+        if perf_counters is not None:
+            perf_counters.close()
+        raise
+    finally:
+        if monitor.cores is not None:
+            os.sched_setaffinity(0, spawner_cores)
+    execution_start = current_nano_time()
+    # Not reaped before wait4 (or wait) below, so the pid is still the command's
+    master_psutil_process = psutil.Process(master_process.pid)
+
+    # The output is read by threads while the command runs, so it never blocks on a full pipe
+    stdout_reader = OutputCapture(master_process.stdout, stdout_capture)
+    stderr_reader = OutputCapture(master_process.stderr, stderr_capture)
     
-    # Only in linux, we target command will be GNU Time's child process
-    # On other platforms, the main process will be the target process itself
-    if not is_linux:
-        p = master_process
+    # Only with GNU Time, the target command will be GNU Time's child process
+    # Otherwise, the main process will be the target process itself
+    if not use_gnu_time:
+        p = master_psutil_process
 
     # If we are using GNU Time and are on linux:
     # Wait for time to load the target process, then proceed
     # Depending on whether we are on linux or not
 
-    # Wait for /usr/bin/time to start the target command
-    while p is None and not shared_process_dict["skip_benchmarking"]:
+    # Wait for /usr/bin/time to start the target command.
+    # Its children are checked with a growing delay rather than in a busy loop competing with the
+    # starting command for CPU, and its early exit wakes us up through its pidfd.
+    master_pidfd = open_pidfd(master_process.pid) if use_gnu_time else None
+    children_poll_delay = GNU_TIME_CHILDREN_POLL_DELAY_MIN
+    while p is None and not shared_state["skip_benchmarking"]:
 
         master_process_retcode = master_process.poll()
-        if master_process_retcode != None or not master_process.is_running():
-            shared_process_dict["skip_benchmarking"] = True
+        if master_process_retcode != None or not master_psutil_process.is_running():
+            shared_state["skip_benchmarking"] = True
             break
 
-        time_children = master_process.children(recursive=False)
+        time_children = master_psutil_process.children(recursive=False)
         if len(time_children) > 0:
             p = time_children[0]
+            break
 
-    shared_process_dict["execution_start"] = execution_start
-
-    if not shared_process_dict["skip_benchmarking"]:
-        shared_process_dict["target_process_pid"] = p.pid
-        
-    # Wait for process to finish (time_series_exec and fixed_data_exec will be processing it in parallel)
-    outdata, errdata = master_process.communicate()
-    outdata, errdata = outdata.decode(sys.stdout.encoding), errdata.decode(sys.stderr.encoding)
-    
-    exection_end = current_milli_time()
+        wait_readable(master_pidfd, children_poll_delay)
+        children_poll_delay = min(children_poll_delay * 2, GNU_TIME_CHILDREN_POLL_DELAY_MAX)
+
+    if master_pidfd is not None:
+        os.close(master_pidfd)
+
+    # The pid is handed to the collectors through the monitor's pipes: they block until it arrives
+    if not shared_state["skip_benchmarking"]:
+        monitor.watch(p.pid, execution_start, sampler_backend, cgroup_path)
+
+    # Checks the limits while the command runs, on the memory samples of the collectors
+    limit_watchdog = None
+    if use_limits and p is not None:
+        if use_gnu_time:
+            signal_command = lambda signal_name: signal_process_tree(p, signal_name)
+        elif benchmark_cgroup is not None:
+            # Also reaches the processes that left the command's process group
+            signal_command = lambda signal_name: signal_cgroup(benchmark_cgroup, signal_name)
+        elif use_process_group:
+            signal_command = lambda signal_name: signal_process_group(master_process.pid, signal_name)
+        else:
+            signal_command = lambda signal_name: signal_process_tree(p, signal_name)
+        read_cpu_time = benchmark_cgroup.read_cpu_time if benchmark_cgroup is not None else lambda: read_process_tree_cpu_time(p)
+        limit_watchdog = LimitWatchdog(limits, execution_start, max(sample_interval_ms, 1) / 1000,
+            lambda: time_series_ring.get_last("memory_bytes"), read_cpu_time, signal_command)
+        limit_watchdog.start()
+
+    # Wait for process to finish (the monitor's collectors will be processing it in parallel)
+    try:
+        if use_rusage:
+            # We reap the process ourselves to get its rusage
+            _, wait_status, target_rusage = os.wait4(master_process.pid, 0)
+            exection_end = current_nano_time()
+            master_process.returncode = exit_code_from_wait_status(wait_status)
+        else:
+            master_process.wait()
+            exection_end = current_nano_time()
+    except BaseException:
+        # The command is in a process group of its own, which doesn't get the user's Ctrl+C
+        if limit_watchdog is not None:
+            limit_watchdog.kill_command()
+            limit_watchdog.stop()
+        if perf_counters is not None:
+            perf_counters.close()
+        raise
+    # The processes of the command that exited (all of them, unless some were left behind) added their counts to ours
+    perf_counters_results = None
+    if perf_counters is not None:
+        perf_counters_results = perf_counters.read()
+        perf_counters.close()
+    if limit_watchdog is not None:
+        limit_watchdog.target_exited()
+    outdata, errdata = stdout_reader.join(sys.stdout.encoding), stderr_reader.join(sys.stderr.encoding)
+
+    limit_reason = None
+    if limit_watchdog is not None:
+        limit_watchdog.stop()
+        limit_reason = limit_watchdog.limit_reason
+
+    cgroup_stats = None
+    if benchmark_cgroup is not None:
+        cgroup_stats = benchmark_cgroup.read_stats()
+        # The kernel enforces the memory limit of cgroups by itself
+        if use_limits and limits.memory_limit is not None and limit_reason is None and benchmark_cgroup.read_oom_kills() > 0:
+            limit_reason = "memory"
+        if not benchmark_cgroup.remove():
+            click.secho("Warning: processes left behind by the command keep the cgroup %s alive." % benchmark_cgroup.path, fg = "yellow")
     
     # Done with the master process, wait for the parallel (threads or processes) to finish up
-    time_series_exec.join()
-    fixed_data_exec.join()
+    collector_results = monitor.wait()
+
+    if monitor.cores is not None:
+        cores_busy_time = read_cores_busy_time(monitor.cores) - cores_busy_time_start
 
 
     # Collect data from other (threads or processes) and store them
-    cpu_times = shared_process_dict["cpu_times"]
-    disk_io_counters = shared_process_dict["disk_io_counters"]
+    memory_max = shared_state["memory_max"]
+    memory_perprocess_max = shared_state["memory_perprocess_max"]
+    cgroup_memory_max = shared_state["cgroup_memory_max"]
 
-    memory_max = shared_process_dict["memory_max"]
-    memory_perprocess_max = shared_process_dict["memory_perprocess_max"]
-    
-    sample_milliseconds = shared_process_dict["sample_milliseconds"]
-    cpu_percentages = shared_process_dict["cpu_percentages"]
-    memory_values = shared_process_dict["memory_values"]
+    time_series_arrays = time_series_ring.to_arrays()
+    sample_nanoseconds = time_series_arrays["sample_nanoseconds"]
+    cpu_percentages = time_series_arrays["cpu_percentages"]
+    memory_values = time_series_arrays["memory_bytes"]
+
+    monitor_total_cpu_time = shared_state["time_series_monitor_cpu_time"] + shared_state["fixed_data_monitor_cpu_time"]
 
     # Calculate and store proper values for cpu and disk
     cpu_user_time = 0
     cpu_system_time = 0
 
     # https://psutil.readthedocs.io/en/latest/#psutil.Process.cpu_times
-    if cpu_times is not None:
+    if shared_state["has_cpu_times"]:
         children_user_cpu_time, children_system_cpu_time = 0, 0
 
         if is_linux:
-            children_user_cpu_time = cpu_times.children_user
-            children_system_cpu_time = cpu_times.children_system
+            children_user_cpu_time = shared_state["cpu_children_user_time"]
+            children_system_cpu_time = shared_state["cpu_children_system_time"]
             
         else: # macOS and Windows where cpu_times always returns 0 for children's cpu usage
             # Then we have calculated this info ourselves in other threads (collect_time_series, specifically)
             # grab and use them
-            children_user_cpu_time = shared_process_dict["children_user_cpu_time"]
-            children_system_cpu_time = shared_process_dict["children_system_cpu_time"]
+            children_user_cpu_time = shared_state["children_user_cpu_time"]
+            children_system_cpu_time = shared_state["children_system_cpu_time"]
 
-        cpu_user_time = cpu_times.user + children_user_cpu_time
-        cpu_system_time = cpu_times.system + children_system_cpu_time
+        cpu_user_time = shared_state["cpu_user_time"] + children_user_cpu_time
+        cpu_system_time = shared_state["cpu_system_time"] + children_system_cpu_time
     
     cpu_total_time = cpu_user_time + cpu_system_time
 
-    psutil_read_bytes, psutil_write_bytes = 0, 0
-    psutil_read_count, psutil_write_count = 0, 0
-    psutil_read_chars, psutil_write_chars = 0, 0
-
-    if disk_io_counters is not None:
-        psutil_read_bytes = disk_io_counters.read_bytes
-        psutil_write_bytes = disk_io_counters.write_bytes
-        psutil_read_count = disk_io_counters.read_count
-        psutil_write_count = disk_io_counters.write_count
-        if is_linux:
-            psutil_read_chars = disk_io_counters.read_chars
-            psutil_write_chars = disk_io_counters.write_chars
-        if is_win:
-            psutil_other_count = disk_io_counters.other_count
-            psutil_other_bytes = disk_io_counters.other_bytes
-
-    # Convert deques to numpy arrays
-    sample_milliseconds = np.array(sample_milliseconds)
-    cpu_percentages = np.array(cpu_percentages)
-    memory_values = np.array(memory_values)
-
-    # Collect info from GNU Time if it's linux
-    if is_linux:
-        # Read GNU Time command's output and parse it into a python dictionary
-        f = open(time_tmp_output_file, "r")
-        gnu_times_lines = list(map(lambda line: line.strip(), f.readlines()))
-        gnu_times_dict = {}
-        for gnu_times_line in gnu_times_lines:
-            tokens = list(map(lambda token: token.strip(), gnu_times_line.rsplit(": ", 1)))
-            if len(tokens) < 2:
-                continue
-            key = tokens[0]
-            value = tokens[1].replace("?", "0")
-            gnu_times_dict[key] = value
-
-        # We need a conversion for elapsed time from time format to seconds
-        gnu_time_elapsed_wall_clock_key = "Elapsed (wall clock) time (h:mm:ss or m:ss)"
-        gnu_times_dict[gnu_time_elapsed_wall_clock_key] = str(get_sec(gnu_times_dict[gnu_time_elapsed_wall_clock_key]))
-        # And another conversion for cpu utilization percentage string
-        gnu_time_job_cpu_percent = "Percent of CPU this job got"
-        gnu_times_dict[gnu_time_job_cpu_percent] = float(gnu_times_dict[gnu_time_job_cpu_percent].replace("%", ""))
-
-        f.close()
-        os.remove(time_tmp_output_file)
-
-        # Convert all gnu time output's int values to int and float values to float
-        for key, value in gnu_times_dict.items():
-            if isint(value):
-                gnu_times_dict[key] = int(value)
-            elif isfloat(value):
-                gnu_times_dict[key] = float(value)
+    # Zeros unless the fixed data collector got to read the counters
+    psutil_read_bytes = shared_state["read_bytes"]
+    psutil_write_bytes = shared_state["write_bytes"]
+    psutil_read_count = shared_state["read_count"]
+    psutil_write_count = shared_state["write_count"]
+    psutil_read_chars = shared_state["read_chars"]
+    psutil_write_chars = shared_state["write_chars"]
+    psutil_other_count = shared_state["other_count"]
+    psutil_other_bytes = shared_state["other_bytes"]
+
+    # Rate the samples were actually taken at, which can fall below the requested rate
+    # when a single sample (walking a large process tree) takes longer than the interval
+    sample_rate = 0
+    if len(sample_nanoseconds) > 1 and sample_nanoseconds[-1] > sample_nanoseconds[0]:
+        sample_rate = float((len(sample_nanoseconds) - 1) / ((sample_nanoseconds[-1] - sample_nanoseconds[0]) / 1e9))
+
+    # Collect info from GNU Time (or the same info from rusage) if it's linux
+    if use_gnu_time:
+        gnu_times_dict = read_gnu_time_output(time_tmp_output_file)
+    elif use_rusage:
+        gnu_times_dict = rusage_to_gnu_time_dict(target_rusage, (exection_end - execution_start) / 1e9, master_process.returncode, format_command(command))
+
+        # The kernel counts the memory the command was spawned from (this process' memory) in its maxrss.
+        # Above our own peak, maxrss can only be the command's. Otherwise its real peak is unknown
+        # (but lower) and the sampled one is used instead, if there is one.
+        if target_rusage.ru_maxrss <= spawner_maxrss and memory_perprocess_max > 0:
+            gnu_times_dict["Maximum resident set size (kbytes)"] = memory_perprocess_max // 1024
+
+        # A command that exited before the collectors read it (a short one usually does) still gets
+        # its CPU time and peak memory, from the rusage of the whole tree.
+        # That peak is at most ours when the command's own one is unknown (see above).
+        if not shared_state["has_cpu_times"]:
+            cpu_user_time = target_rusage.ru_utime
+            cpu_system_time = target_rusage.ru_stime
+            cpu_total_time = cpu_user_time + cpu_system_time
+        if memory_perprocess_max == 0:
+            memory_max = memory_perprocess_max = target_rusage.ru_maxrss * 1024
     
     # GNU Time output: For reference
     
@@ -537,22 +1518,32 @@ def single_benchmark_command_raw(command):
             },
             "process":
             {
-                "execution_time": (exection_end - execution_start) / 1000 # milliseconds to seconds
+                "execution_time": (exection_end - execution_start) / 1e9 # nanoseconds to seconds
             }
         },
         "general": # Info independent from GNU Time and psutil
         {
             "stdout_data": outdata,
             "stderr_data": errdata,
+            "stdout_bytes": stdout_reader.bytes_count,
+            "stdout_lines": stdout_reader.lines_count,
+            "stderr_bytes": stderr_reader.bytes_count,
+            "stderr_lines": stderr_reader.lines_count,
             "exit_code": gnu_times_dict["Exit status"] if is_linux else master_process.returncode
         },
         "time_series":
         {
-            "sample_milliseconds": np.array(sample_milliseconds),
+            "sample_nanoseconds": sample_nanoseconds,
             "cpu_percentages": np.array(cpu_percentages),
             "memory_bytes": np.array(memory_values)
         },
-        
+        "sampling":
+        {
+            "interval_ms": sample_interval_ms,
+            "sample_count": len(sample_nanoseconds),
+            "sample_rate": sample_rate, # samples per second
+            "monitor_cpu_time": monitor_total_cpu_time # seconds
+        }
     }
 
     if not is_macos:
@@ -572,6 +1563,7 @@ def single_benchmark_command_raw(command):
             io_counters["other_bytes"] = psutil_other_bytes
 
         resource_usages["psutil"]["disk"] = { "io_counters": io_counters }
+        resource_usages["time_series"].update(get_disk_rates(sample_nanoseconds, time_series_arrays))
 
     if is_linux:
         resource_usages["gnu_time"] = {
@@ -591,11 +1583,78 @@ def single_benchmark_command_raw(command):
                 "file_system_inputs": gnu_times_dict["File system inputs"] * 512,
                 "file_system_outputs": gnu_times_dict["File system outputs"] * 512
             },
+            "context_switches":
+            {
+                "voluntary": gnu_times_dict["Voluntary context switches"],
+                "involuntary": gnu_times_dict["Involuntary context switches"]
+            },
+            "page_faults":
+            {
+                "minor": gnu_times_dict["Minor (reclaiming a frame) page faults"],
+                "major": gnu_times_dict["Major (requiring I/O) page faults"]
+            },
             "process":
             {
                 "execution_time": gnu_times_dict["Elapsed (wall clock) time (h:mm:ss or m:ss)"] # milliseconds to seconds
             }
         }
         resource_usages["gnu_time_results"] = gnu_times_dict
+
+    if cgroup_stats is not None:
+        cgroup_cpu_user_time = cgroup_stats["cpu_user_time"]
+        cgroup_cpu_system_time = cgroup_stats["cpu_system_time"]
+        resource_usages["cgroup"] = {
+            "cpu":
+            {
+                "user_time": cgroup_cpu_user_time,
+                "system_time": cgroup_cpu_system_time,
+                "total_time": cgroup_cpu_user_time + cgroup_cpu_system_time
+            },
+            "memory":
+            {
+                # memory.peak is exact; on kernels without it, the highest memory.current sample
+                "max": cgroup_stats["memory_peak"] if cgroup_stats["memory_peak"] is not None else cgroup_memory_max
+            }
+        }
+        if cgroup_stats["io"] is not None:
+            resource_usages["cgroup"]["disk"] = {
+                "read_bytes": cgroup_stats["io"]["rbytes"],
+                "write_bytes": cgroup_stats["io"]["wbytes"],
+                "read_count": cgroup_stats["io"]["rios"],
+                "write_count": cgroup_stats["io"]["wios"]
+            }
     
+    if monitor.cores is not None:
+        # The command's cores also ran its monitor; anything above that was used by other processes
+        resource_usages["parallel"] = {
+            "cores": format_cores(monitor.cores),
+            "foreign_cpu_time": max(cores_busy_time - resource_usages["gnu_time"]["cpu"]["total_time"] - monitor_total_cpu_time, 0.0)
+        }
+
+    if use_pss:
+        resource_usages["psutil"]["memory"]["max_pss"] = shared_state["pss_max"]
+        resource_usages["psutil"]["memory"]["max_uss"] = shared_state["uss_max"]
+        resource_usages["time_series"]["pss_bytes"] = time_series_arrays["pss_bytes"]
+        resource_usages["time_series"]["uss_bytes"] = time_series_arrays["uss_bytes"]
+
+    if sample_activity:
+        resource_usages["time_series"].update(get_counter_rates(sample_nanoseconds, time_series_arrays, ACTIVITY_COUNTER_KEYS))
+        for activity_count_key in ACTIVITY_COUNT_KEYS:
+            resource_usages["time_series"][activity_count_key] = time_series_arrays[activity_count_key]
+
+    if perf_counters_results is not None:
+        resource_usages["counters"] = perf_counters_results
+
+    if per_process:
+        # A command that ended before the collectors started has no records
+        process_records = collector_results[0] if len(collector_results) > 0 and collector_results[0] is not None else []
+        resource_usages["processes"] = new_raw_processes(process_records, monitor.process_ring.to_arrays())
+
+    if use_limits:
+        # Results of a command stopped by a limit are partial: they cover its run up to the stop
+        resource_usages["limits"] = {
+            "terminated_by_limit": limit_reason is not None,
+            "limit_reason": limit_reason
+        }
+
     return resource_usages
@@ -0,0 +1,317 @@
+from .utils import *
+from .result import BenchmarkResults
+from .core import BenchmarkMonitor, raw_to_final_benchmark, validate_benchmark_options, validate_memory_accounting, run_hooked_iteration, measure_shell_overhead, get_shell_argv, format_command, check_cgroup_support, DEFAULT_SAMPLE_INTERVAL_MS, DEFAULT_PSS_SAMPLE_EVERY, DEFAULT_MIN_RUNS, DEFAULT_MAX_RUNS
+from .hooks import IterationHooks, CACHE_STATES
+from .limits import ResourceLimits, DEFAULT_LIMIT_GRACE_PERIOD
+from .sweep import SweepResults, get_sweep_commands
+from .cgroup import use_supervisor_cgroup, CgroupError
+from multiprocessing.connection import Listener, Client
+import multiprocessing
+import threading
+import platform
+import socket
+import psutil
+import queue
+import click
+import os
+
+# Distributed benchmarking: worker agents running iterations for a coordinator.
+#
+# A worker (cmdbench worker, or run_worker) listens on a TCP address or a unix socket and runs the
+# iterations a coordinator sends it, one at a time, with a monitor it keeps for its whole life.
+# The coordinator (benchmark_command_distributed, sweep_command_distributed or cmdbench run --worker)
+# connects to all of its workers and hands each of them the next run as soon as it is done with one,
+# so faster machines do more of them. Raw results are sent back, get a "host" section describing the
+# machine that ran them, and are gathered into one BenchmarkResults (or SweepResults).
+#
+# Connections are authenticated with a shared key (an HMAC challenge), but jobs and results are pickled:
+# anyone with the key can run commands on the worker, so workers should only listen on trusted networks.
+
+# Environment variable the shared key is read from when it is not given
+AUTHKEY_ENVIRONMENT_VARIABLE = "CMDBENCH_AUTHKEY"
+
+# Options workers run the iterations with, and their defaults. The other options of benchmark_command
+# are either handled by the coordinator (time_resolution, warmup) or can't be used in distributed runs.
+WORKER_OPTIONS = {
+    "sample_interval_ms": DEFAULT_SAMPLE_INTERVAL_MS,
+    "sampler_backend": "auto",
+    "cgroup": False,
+    "time_source": "rusage",
+    "stdout_capture": "keep",
+    "stderr_capture": "keep",
+    "cache": None,
+    "cache_inputs": None,
+    "prepare": None,
+    "cleanup": None,
+    "timeout": None,
+    "memory_limit": None,
+    "cpu_limit": None,
+    "limit_signal": "SIGTERM",
+    "limit_grace_period": DEFAULT_LIMIT_GRACE_PERIOD,
+    "shell": False,
+    "per_process": False,
+    "memory_accounting": "rss",
+    "pss_sample_every": DEFAULT_PSS_SAMPLE_EVERY,
+    "sample_activity": False,
+    "counters": False
+}
+
+# Seconds a coordinator's thread waits for a run to be requeued (by a worker that went away) before checking if it should stop
+NEXT_RUN_POLL_INTERVAL = 0.1
+
+def get_authkey(authkey = None):
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENVIRONMENT_VARIABLE)
+    if authkey is None or len(authkey) == 0:
+        raise Exception("Workers need a shared key: give an authkey or set %s" % AUTHKEY_ENVIRONMENT_VARIABLE)
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+# "host:port" (a missing host being localhost) or a unix socket: "unix:<path>" or any path with a "/"
+def parse_worker_address(address):
+    if not isinstance(address, str):
+        return address
+    if address.startswith("unix:"):
+        return address[len("unix:"):]
+    if "/" in address:
+        return address
+    host, _, port = address.rpartition(":")
+    try:
+        return (host or "127.0.0.1", int(port))
+    except ValueError:
+        raise Exception("%s is not a worker address, expected host:port or unix:<path>" % address)
+
+def format_worker_address(address):
+    if isinstance(address, tuple):
+        return "%s:%s" % address
+    return "unix:%s" % address
+
+def get_host_info():
+    return {
+        "hostname": socket.gethostname(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "python_version": platform.python_version(),
+        "cpu_count": psutil.cpu_count(),
+        "memory_total": psutil.virtual_memory().total
+    }
+
+
+# Runs the iterations sent to a worker
+class WorkerRunner():
+    def __init__(self, supervisor_cgroup = False):
+        self.monitor = BenchmarkMonitor()
+        self.supervisor_cgroup = supervisor_cgroup
+        self.host = get_host_info()
+        self._cgroup_support = None
+        # Shell overheads are measured once per shell and sampling options
+        self._shell_overheads = {}
+
+    def run(self, command, iteration_index, options):
+        hooks = IterationHooks(options["cache"], options["cache_inputs"], options["prepare"], options["cleanup"])
+        limits = ResourceLimits(options["timeout"], options["memory_limit"], options["cpu_limit"], options["limit_signal"], options["limit_grace_period"])
+        cgroup = False
+        if options["cgroup"]:
+            if self._cgroup_support is None:
+                if self.supervisor_cgroup:
+                    try:
+                        use_supervisor_cgroup()
+                    except CgroupError as e:
+                        click.secho("Warning: the worker could not move to a cgroup of its own (%s)." % e, fg = "yellow")
+                self._cgroup_support = check_cgroup_support()
+            cgroup = self._cgroup_support
+        run_options = (options["sample_interval_ms"], options["sampler_backend"], cgroup, options["time_source"], options["stdout_capture"], options["stderr_capture"], limits, options["per_process"], options["memory_accounting"], options["pss_sample_every"], options["sample_activity"], options["counters"])
+
+        shell_overhead = None
+        if options["shell"]:
+            shell_key = (options["shell"], ) + run_options[:4]
+            if shell_key not in self._shell_overheads:
+                self._shell_overheads[shell_key] = measure_shell_overhead(*shell_key, self.monitor)
+            shell_overhead = self._shell_overheads[shell_key]
+            command = get_shell_argv(command, options["shell"])
+
+        return run_hooked_iteration(hooks, iteration_index, command, run_options, self.monitor, shell_overhead)
+
+    def close(self):
+        self.monitor.close()
+
+# Serves the coordinators connecting to the address one after the other, until interrupted.
+# Port 0 listens on a free port, printed once listening. With supervisor_cgroup, the worker moves to a cgroup
+# of its own (use_supervisor_cgroup) once a coordinator asks for cgroup accounting.
+def run_worker(address, authkey = None, supervisor_cgroup = False):
+    address = parse_worker_address(address)
+    runner = WorkerRunner(supervisor_cgroup)
+    try:
+        with Listener(address, authkey = get_authkey(authkey)) as listener:
+            click.echo("Worker listening on %s" % format_worker_address(listener.address))
+            while True:
+                try:
+                    connection = listener.accept()
+                except (multiprocessing.AuthenticationError, OSError) as error:
+                    click.secho("Warning: refused a connection (%s)." % error, fg = "yellow")
+                    continue
+                with connection:
+                    serve_coordinator(connection, runner)
+    finally:
+        runner.close()
+
+# Messages: the worker greets the coordinator with ("hello", host), then answers every ("run", command, iteration_index, options)
+# with ("result", raw results) or ("error", message), until the coordinator sends ("close", ) or goes away
+def serve_coordinator(connection, runner):
+    connection.send(("hello", runner.host))
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            return
+        if message[0] == "close":
+            return
+        _, command, iteration_index, options = message
+        try:
+            connection.send(("result", runner.run(command, iteration_index, options)))
+        except Exception as error:
+            connection.send(("error", "%s: %s" % (type(error).__name__, error)))
+
+
+# The coordinator's connection to a worker
+class WorkerConnection():
+    def __init__(self, address, authkey):
+        self.address = format_worker_address(parse_worker_address(address))
+        try:
+            self.connection = Client(parse_worker_address(address), authkey = authkey)
+        except (OSError, multiprocessing.AuthenticationError) as error:
+            raise Exception("Can not connect to the worker %s (%s)" % (self.address, error))
+        _, host = self.connection.recv()
+        self.host = dict(host, worker = self.address)
+
+    def run(self, command, iteration_index, options):
+        self.connection.send(("run", command, iteration_index, options))
+        status, payload = self.connection.recv()
+        if status == "error":
+            raise Exception("Worker %s: %s" % (self.address, payload))
+        payload["host"] = self.host
+        return payload
+
+    def close(self):
+        try:
+            self.connection.send(("close", ))
+        except OSError:
+            pass
+        self.connection.close()
+
+# Checks the options against the ones workers take, and fills in the defaults
+def get_worker_options(iterations_num, time_resolution, warmup, options):
+    for option in options.keys():
+        if option not in WORKER_OPTIONS:
+            raise Exception("The %s option can not be used in distributed runs" % option)
+    options = dict(WORKER_OPTIONS, **options)
+    validate_benchmark_options(iterations_num, options["sample_interval_ms"], options["sampler_backend"], options["time_source"], options["stdout_capture"], options["stderr_capture"], time_resolution, 1, None, warmup, DEFAULT_MIN_RUNS, DEFAULT_MAX_RUNS, None, "execution_time", None)
+    if options["cache"] is not None and options["cache"] not in CACHE_STATES:
+        raise Exception("Unknown cache state %s, expected one of: %s" % (options["cache"], ", ".join(CACHE_STATES)))
+    ResourceLimits(options["timeout"], options["memory_limit"], options["cpu_limit"], options["limit_signal"], options["limit_grace_period"])
+    validate_memory_accounting(options["memory_accounting"], options["pss_sample_every"])
+    return options
+
+# Runs every (command, iteration_index) of runs on the workers, each worker taking the next run once it is done
+# with one. Before its first run of a command, a worker does the warmup runs of it. The runs of a worker that
+# goes away are done by the others. Yields the index and the raw results of the runs as they finish.
+def run_distributed(runs, workers, authkey, options, warmup):
+    if len(workers) == 0:
+        raise Exception("At least one worker is needed")
+    authkey = get_authkey(authkey)
+
+    connections = []
+    try:
+        for worker in workers:
+            connections.append(WorkerConnection(worker, authkey))
+    except Exception:
+        for connection in connections:
+            connection.close()
+        raise
+
+    next_runs = queue.Queue()
+    for run_index in range(len(runs)):
+        next_runs.put(run_index)
+    finished_runs = queue.Queue()
+    stop = threading.Event()
+
+    def run_worker_jobs(connection):
+        warmed_up_commands = set()
+        while not stop.is_set():
+            try:
+                run_index = next_runs.get(timeout = NEXT_RUN_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            command, iteration_index = runs[run_index]
+            try:
+                if format_command(command) not in warmed_up_commands:
+                    for warmup_index in range(warmup):
+                        connection.run(command, warmup_index, options)
+                    warmed_up_commands.add(format_command(command))
+                raw_benchmark_result = connection.run(command, iteration_index, options)
+            except (EOFError, OSError) as error:
+                next_runs.put(run_index)
+                finished_runs.put(("lost", connection, error))
+                return
+            except BaseException as error:
+                finished_runs.put(("error", error))
+                return
+            finished_runs.put(("result", run_index, raw_benchmark_result))
+
+    threads = [threading.Thread(target = run_worker_jobs, args = (connection, ), daemon = True) for connection in connections]
+    for thread in threads:
+        thread.start()
+
+    try:
+        finished_runs_num = 0
+        lost_workers_num = 0
+        while finished_runs_num < len(runs):
+            finished_run = finished_runs.get()
+            if finished_run[0] == "result":
+                finished_runs_num += 1
+                yield finished_run[1], finished_run[2]
+            elif finished_run[0] == "error":
+                raise finished_run[1]
+            else:
+                _, connection, error = finished_run
+                lost_workers_num += 1
+                if lost_workers_num == len(connections):
+                    raise Exception("All workers went away, %s runs were not done" % (len(runs) - finished_runs_num))
+                click.secho("Warning: the worker %s went away (%s), its runs are given to the other workers." % (connection.address, str(error) or type(error).__name__), fg = "yellow")
+    finally:
+        # Running iterations finish, but no new ones are started
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for connection in connections:
+            connection.close()
+
+
+# Benchmarks the command on the workers (see run_worker), spreading its iterations over them.
+# Takes the options of benchmark_command the workers run the iterations with (WORKER_OPTIONS), time_resolution and warmup
+# (runs done by every worker before its measured ones). Every iteration gets a "host" section on the worker that ran it.
+def benchmark_command_distributed(command, workers, iterations_num = 1, raw_data = False, authkey = None, time_resolution = "ms", warmup = 0, **options):
+    benchmark_results = BenchmarkResults()
+    for benchmark_result in benchmark_command_distributed_generator(command, workers, iterations_num, raw_data, authkey, time_resolution, warmup, **options):
+        benchmark_results.add_benchmark_result(benchmark_result)
+    return benchmark_results
+
+def benchmark_command_distributed_generator(command, workers, iterations_num = 1, raw_data = False, authkey = None, time_resolution = "ms", warmup = 0, **options):
+    options = get_worker_options(iterations_num, time_resolution, warmup, options)
+    runs = [(command, iteration_index) for iteration_index in range(iterations_num)]
+    for _, raw_benchmark_result in run_distributed(runs, workers, authkey, options, warmup):
+        yield BenchmarkResults([raw_benchmark_result if raw_data else raw_to_final_benchmark(raw_benchmark_result, time_resolution)])
+
+# sweep_command on the workers: the runs of all values are spread over them
+def sweep_command_distributed(command, parameter_name, parameter_values, workers, iterations_num = 1, **options):
+    sweep_results = SweepResults(command, parameter_name, parameter_values)
+    for point_index, benchmark_result in sweep_command_distributed_generator(command, parameter_name, parameter_values, workers, iterations_num, **options):
+        sweep_results.benchmark_results[point_index].add_benchmark_result(benchmark_result)
+    return sweep_results
+
+# Yields the index of the parameter value and its BenchmarkResults after each run
+def sweep_command_distributed_generator(command, parameter_name, parameter_values, workers, iterations_num = 1, raw_data = False, authkey = None, time_resolution = "ms", warmup = 0, **options):
+    options = get_worker_options(iterations_num, time_resolution, warmup, options)
+    point_commands = get_sweep_commands(command, parameter_name, parameter_values)
+    runs = [(point_command, iteration_index) for point_command in point_commands for iteration_index in range(iterations_num)]
+    for run_index, raw_benchmark_result in run_distributed(runs, workers, authkey, options, warmup):
+        yield run_index // iterations_num, BenchmarkResults([raw_benchmark_result if raw_data else raw_to_final_benchmark(raw_benchmark_result, time_resolution)])
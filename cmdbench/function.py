@@ -0,0 +1,222 @@
+from .utils import *
+from .result import BenchmarkResults
+from .shared import SharedBenchmarkState, SampleRing
+from .core import collect_time_series, new_shared_state_fields, time_series_columns, raw_to_final_benchmark, validate_benchmark_options, get_monitored_process, close_monitored_process, io_counter_keys, is_macos, DEFAULT_SAMPLE_INTERVAL_MS, DEFAULT_MIN_RUNS, DEFAULT_MAX_RUNS
+import numpy as np
+import tracemalloc
+import threading
+import gc
+import os
+
+# Benchmarking python callables in the current process, without the interpreter startup of a command.
+#
+# The function is called in the calling thread while collect_time_series samples this process
+# (and the processes the function starts) from a background thread. The results have the same
+# structure as a command's, plus a "python" section:
+#   - tracemalloc_peak: highest memory allocated by python during the call, above what was allocated
+#     before it (None when tracemalloc is off, or was already tracing on python < 3.9). Tracing slows
+#     allocations down many times over, so it's measured on a second, untimed call of the function.
+#   - interpreter_rss_start and interpreter_rss_growth: resident memory of the interpreter before the
+#     call, and how much higher it got during the call
+#   - gc_collections, gc_collected and gc_pause_time: collections of the garbage collector during the
+#     call, the objects they freed and the time they paused the process for
+# Memory results are the resident memory of the whole interpreter, CPU times and disk counters are
+# the process' usage during the call: they include the sampling thread (see sampling.monitor_cpu_time).
+# A function holding the GIL keeps the sampling thread from running: its time series can have very few samples.
+
+def benchmark_function(function, *args, iterations_num = 1, raw_data = False, sample_interval_ms = DEFAULT_SAMPLE_INTERVAL_MS, sampler_backend = "auto", time_resolution = "ms", warmup = 0, trace_memory = True, **kwargs):
+    benchmark_results = BenchmarkResults()
+    for benchmark_result in benchmark_function_generator(function, *args, iterations_num = iterations_num, raw_data = raw_data, sample_interval_ms = sample_interval_ms, sampler_backend = sampler_backend, time_resolution = time_resolution, warmup = warmup, trace_memory = trace_memory, **kwargs):
+        benchmark_results.add_benchmark_result(benchmark_result)
+    return benchmark_results
+
+def benchmark_function_generator(function, *args, iterations_num = 1, raw_data = False, sample_interval_ms = DEFAULT_SAMPLE_INTERVAL_MS, sampler_backend = "auto", time_resolution = "ms", warmup = 0, trace_memory = True, **kwargs):
+    if not callable(function):
+        raise Exception("The function to benchmark should be callable")
+    validate_benchmark_options(iterations_num, sample_interval_ms, sampler_backend, "rusage", "keep", "keep", time_resolution, 1, None, warmup, DEFAULT_MIN_RUNS, DEFAULT_MAX_RUNS, None, "execution_time", None)
+
+    for iteration_index in range(warmup + iterations_num):
+        raw_benchmark_result = single_benchmark_function_raw(function, args, kwargs, sample_interval_ms, sampler_backend, trace_memory)
+        if iteration_index < warmup:
+            continue
+        yield BenchmarkResults([raw_benchmark_result if raw_data else raw_to_final_benchmark(raw_benchmark_result, time_resolution)])
+
+
+# Counts the garbage collector's runs and the time they took, through gc.callbacks
+class GarbageCollectionTracker():
+    def __init__(self):
+        self.collections = 0
+        self.collected = 0
+        self.pause_nanoseconds = 0
+        self._collection_start = None
+
+    def __call__(self, phase, info):
+        if phase == "start":
+            self._collection_start = current_nano_time()
+        elif self._collection_start is not None:
+            self.collections += 1
+            self.collected += info["collected"]
+            self.pause_nanoseconds += current_nano_time() - self._collection_start
+            self._collection_start = None
+
+def read_rss(p):
+    try:
+        return p.memory_info().rss
+    except Exception:
+        return 0
+
+# Peak memory python allocates during a call of the function, above what was allocated before it
+def trace_function_memory(function, args, kwargs):
+    # tracemalloc is only stopped afterwards if we started it
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    else:
+        # Python < 3.9 can't reset the peak of a trace started by someone else
+        return None
+    try:
+        tracemalloc_start = tracemalloc.get_traced_memory()[0]
+        function(*args, **(kwargs or {}))
+        return max(tracemalloc.get_traced_memory()[1] - tracemalloc_start, 0)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+def read_io_counters(p):
+    if is_macos:
+        return None
+    try:
+        return p.io_counters()
+    except Exception:
+        return None
+
+def single_benchmark_function_raw(function, args = (), kwargs = None, sample_interval_ms = DEFAULT_SAMPLE_INTERVAL_MS, sampler_backend = "auto", trace_memory = True):
+    own_pid = os.getpid()
+    own_process = get_monitored_process(own_pid, sampler_backend)
+
+    shared_state = SharedBenchmarkState(new_shared_state_fields(sample_interval_ms), shared = False)
+    time_series_ring = SampleRing(time_series_columns, shared = False)
+    # Written to once the function returned: wakes the sampling thread up for its last sample
+    stop_read_fd, stop_write_fd = os.pipe()
+    sampler_errors = []
+
+    def run_sampler(execution_start):
+        try:
+            collect_time_series(shared_state, time_series_ring, None, own_pid, execution_start, sampler_backend, stop_fd = stop_read_fd)
+        except Exception as error:
+            sampler_errors.append(error)
+
+    gc_tracker = GarbageCollectionTracker()
+    gc.callbacks.append(gc_tracker)
+
+    io_counters_start = read_io_counters(own_process)
+    rss_start = read_rss(own_process)
+    times_start = os.times()
+
+    execution_start = current_nano_time()
+    sampler = threading.Thread(target = run_sampler, args = (execution_start, ), daemon = True)
+    sampler.start()
+
+    call_start = current_nano_time()
+    try:
+        function(*args, **(kwargs or {}))
+    finally:
+        call_end = current_nano_time()
+        times_end = os.times()
+        io_counters_end = read_io_counters(own_process)
+        rss_end = read_rss(own_process)
+
+        gc.callbacks.remove(gc_tracker)
+
+        os.write(stop_write_fd, b"\0")
+        sampler.join()
+        os.close(stop_read_fd)
+        os.close(stop_write_fd)
+        close_monitored_process(own_process)
+
+    if len(sampler_errors) > 0:
+        raise sampler_errors[0]
+
+    # Out of the measured call: tracing allocations would have slowed it down
+    tracemalloc_peak = trace_function_memory(function, args, kwargs) if trace_memory else None
+
+    time_series_arrays = time_series_ring.to_arrays()
+    sample_nanoseconds = time_series_arrays["sample_nanoseconds"]
+
+    sample_rate = 0
+    if len(sample_nanoseconds) > 1 and sample_nanoseconds[-1] > sample_nanoseconds[0]:
+        sample_rate = float((len(sample_nanoseconds) - 1) / ((sample_nanoseconds[-1] - sample_nanoseconds[0]) / 1e9))
+
+    # Includes the processes the function started and waited for
+    cpu_user_time = (times_end.user - times_start.user) + (times_end.children_user - times_start.children_user)
+    cpu_system_time = (times_end.system - times_start.system) + (times_end.children_system - times_start.children_system)
+
+    resource_usages = {
+        "psutil":
+        {
+            "cpu":
+            {
+                "total_time": cpu_user_time + cpu_system_time,
+                "user_time": cpu_user_time,
+                "system_time": cpu_system_time
+            },
+            "memory":
+            {
+                "max": shared_state["memory_max"],
+                "max_perprocess": shared_state["memory_perprocess_max"],
+            },
+            "process":
+            {
+                "execution_time": (call_end - call_start) / 1e9
+            }
+        },
+        "general":
+        {
+            # A function has no output of its own
+            "stdout_data": None,
+            "stderr_data": None,
+            "stdout_bytes": 0,
+            "stdout_lines": 0,
+            "stderr_bytes": 0,
+            "stderr_lines": 0,
+            # Exceptions of the function are raised
+            "exit_code": 0
+        },
+        "time_series":
+        {
+            "sample_nanoseconds": sample_nanoseconds,
+            "cpu_percentages": time_series_arrays["cpu_percentages"],
+            "memory_bytes": time_series_arrays["memory_bytes"]
+        },
+        "sampling":
+        {
+            "interval_ms": sample_interval_ms,
+            "sample_count": len(sample_nanoseconds),
+            "sample_rate": sample_rate,
+            "monitor_cpu_time": shared_state["time_series_monitor_cpu_time"]
+        },
+        "python":
+        {
+            "tracemalloc_peak": tracemalloc_peak,
+            "interpreter_rss_start": rss_start,
+            "interpreter_rss_growth": max(shared_state["memory_max"], rss_end) - rss_start,
+            "gc_collections": gc_tracker.collections,
+            "gc_collected": gc_tracker.collected,
+            "gc_pause_time": gc_tracker.pause_nanoseconds / 1e9
+        }
+    }
+
+    if not is_macos:
+        resource_usages["psutil"]["disk"] = {
+            "io_counters": {
+                io_counter_key: getattr(io_counters_end, io_counter_key, 0) - getattr(io_counters_start, io_counter_key, 0)
+                for io_counter_key in io_counter_keys
+            }
+        }
+        # The process' counters didn't start at 0: the rates start from where they were before the call
+        disk_counters_start = {disk_series_key: getattr(io_counters_start, disk_series_key, 0) for disk_series_key in DISK_SERIES_KEYS}
+        resource_usages["time_series"].update(get_disk_rates(sample_nanoseconds, time_series_arrays, disk_counters_start))
+
+    return resource_usages
@@ -0,0 +1,143 @@
+from .result import BenchmarkResults
+import subprocess
+import click
+import glob
+import os
+
+# Work done around every iteration, outside of its measured window:
+#   - prepare: a shell command (or a callable) run before the iteration, e.g. to generate its inputs
+#   - cache: the state of the page cache the iteration starts in
+#       "cold"  the inputs are evicted from the page cache, so the command reads them from the disk
+#       "warm"  the inputs are read into the page cache, so the command reads them from memory
+#       "both"  alternates cold and warm iterations (starting with a cold one)
+#     The inputs are the files matching the cache_inputs globs (directories include their files).
+#     Without inputs, a cold iteration drops the whole page cache (root only) and a warm one starts
+#     with whatever the previous iteration left in the cache. A cold iteration whose inputs match no
+#     files fails rather than dropping the whole page cache.
+#   - cleanup: a shell command (or a callable) run after the iteration
+# Iterations run with a cache state get a "cache" section with their state and the number of files
+# evicted or read, so cold and warm results can be told apart.
+
+CACHE_STATES = ["cold", "warm", "both"]
+
+DROP_CACHES_PATH = "/proc/sys/vm/drop_caches"
+
+# Size of the reads warming up the inputs
+WARM_READ_SIZE = 1024 * 1024
+
+fadvise_available = hasattr(os, "posix_fadvise")
+
+def can_drop_caches():
+    return os.access(DROP_CACHES_PATH, os.W_OK)
+
+# Files matching the globs, in the order they were matched. Patterns can use "**" to match directories recursively.
+def find_cache_inputs(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive = True)
+        if len(matches) == 0:
+            click.secho("Warning: no files match the cache input %s." % pattern, fg = "yellow")
+        for match in sorted(matches):
+            if os.path.isdir(match):
+                for directory, _, file_names in os.walk(match):
+                    paths.extend(os.path.join(directory, file_name) for file_name in sorted(file_names))
+            elif os.path.isfile(match):
+                paths.append(match)
+    return list(dict.fromkeys(paths))
+
+# Removes the file's pages from the page cache. Dirty pages can not be dropped, they are written out first.
+def evict_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        try:
+            os.fdatasync(fd)
+        except OSError:
+            # Some filesystems don't support syncing a file opened for reading
+            pass
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+# Drops the whole page cache (needs root)
+def drop_caches():
+    os.sync()
+    with open(DROP_CACHES_PATH, "w") as drop_caches_file:
+        # 1: page cache only, dentries and inodes are kept
+        drop_caches_file.write("1")
+
+def warm_file(path):
+    with open(path, "rb", buffering = 0) as warmed_file:
+        while len(warmed_file.read(WARM_READ_SIZE)) > 0:
+            pass
+
+# Runs a hook: a shell command, which has to succeed, or a callable
+def run_hook(hook, name):
+    if callable(hook):
+        hook()
+        return
+    hook_process = subprocess.run(hook, shell = True, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+    if hook_process.returncode != 0:
+        output = hook_process.stdout.decode(errors = "replace").strip()
+        raise Exception("The %s command failed with exit code %s%s" % (name, hook_process.returncode, (": " + output) if len(output) > 0 else ""))
+
+
+class IterationHooks():
+    def __init__(self, cache = None, cache_inputs = None, prepare = None, cleanup = None):
+        if cache is not None and cache not in CACHE_STATES:
+            raise Exception("Unknown cache state %s, expected one of: %s" % (cache, ", ".join(CACHE_STATES)))
+        self.cache = cache
+        self.cache_inputs = list(cache_inputs) if cache_inputs is not None else []
+        self.prepare = prepare
+        self.cleanup = cleanup
+
+        if cache in ["cold", "both"]:
+            if len(self.cache_inputs) == 0 and not can_drop_caches():
+                raise Exception("A cold cache needs cache inputs to evict, or root access to drop the whole page cache")
+            if len(self.cache_inputs) > 0 and not fadvise_available:
+                raise Exception("Evicting files from the page cache is not supported on this platform")
+
+    # Cache state of the iteration at the given index (warmup runs included)
+    def get_cache_state(self, iteration_index):
+        if self.cache == "both":
+            return "cold" if iteration_index % 2 == 0 else "warm"
+        return self.cache
+
+    # Runs the prepare hook and gets the page cache ready.
+    # Returns the iteration's "cache" section, None without a cache state.
+    def before_iteration(self, iteration_index):
+        if self.prepare is not None:
+            run_hook(self.prepare, "prepare")
+
+        cache_state = self.get_cache_state(iteration_index)
+        if cache_state is None:
+            return None
+
+        # Inputs are found again for every iteration: the prepare hook might have created them
+        paths = find_cache_inputs(self.cache_inputs)
+        if cache_state == "cold":
+            # The whole page cache is only dropped when no inputs were given, not when the given ones are missing
+            if len(self.cache_inputs) == 0:
+                drop_caches()
+            elif len(paths) == 0:
+                raise Exception("No files match the cache inputs to evict: %s" % ", ".join(self.cache_inputs))
+            else:
+                for path in paths:
+                    evict_file(path)
+        elif cache_state == "warm":
+            for path in paths:
+                warm_file(path)
+
+        return {"state": cache_state, "files": len(paths)}
+
+    def after_iteration(self):
+        if self.cleanup is not None:
+            run_hook(self.cleanup, "cleanup")
+
+
+# Splits the results by the cache state of their iterations, e.g. {"cold": BenchmarkResults, "warm": BenchmarkResults}
+def split_by_cache_state(benchmark_results):
+    results_per_state = {}
+    for iteration in benchmark_results.iterations:
+        cache_state = iteration["cache"]["state"] if "cache" in iteration else None
+        results_per_state.setdefault(cache_state, BenchmarkResults()).iterations.append(iteration)
+    return results_per_state
@@ -1,6 +1,10 @@
 key_readables = {
     "stdout_data": ["stdout"],
     "stderr_data": ["stderr"],
+    "stdout_bytes": ["stdout size", "bytes"],
+    "stdout_lines": ["stdout lines"],
+    "stderr_bytes": ["stderr size", "bytes"],
+    "stderr_lines": ["stderr lines"],
     "execution_time": ["runtime", "second(s)"],
     "exit_code": ["exit code"],
     
@@ -12,6 +16,9 @@ key_readables = {
     "memory": ["memory", "bytes"],
     "max": ["maximum"],
     "max_perprocess": ["maximum per process"],
+    "max_rss": ["maximum RSS sum"],
+    "max_pss": ["maximum PSS sum"],
+    "max_uss": ["maximum USS sum"],
 
     "disk": ["disk"],
     "read_bytes": ["read (bytes)"],
@@ -24,6 +31,108 @@ key_readables = {
 
     "time_series": ["time series"],
     "sample_milliseconds": ["sampling milliseconds"],
+    "sample_seconds": ["sampling seconds"],
+    "sample_microseconds": ["sampling microseconds"],
+    "sample_nanoseconds": ["sampling nanoseconds"],
     "cpu_percentages": ["CPU (percentages)"],
-    "memory_bytes": ["memory (bytes)"]
+    "memory_bytes": ["memory (bytes)"],
+    "pss_bytes": ["PSS (bytes)"],
+    "uss_bytes": ["USS (bytes)"],
+    "voluntary_context_switches_per_second": ["voluntary context switches (per second)"],
+    "involuntary_context_switches_per_second": ["involuntary context switches (per second)"],
+    "minor_faults_per_second": ["minor page faults (per second)"],
+    "major_faults_per_second": ["major page faults (per second)"],
+    "num_threads": ["threads"],
+    "num_fds": ["open file descriptors"],
+
+    "context_switches": ["context switches"],
+    "voluntary": ["voluntary"],
+    "involuntary": ["involuntary"],
+    "page_faults": ["page faults"],
+    "minor": ["minor (reclaiming a frame)"],
+    "major": ["major (requiring I/O)"],
+    "read_bytes_per_second": ["read (bytes per second)"],
+    "write_bytes_per_second": ["write (bytes per second)"],
+    "read_chars_per_second": ["read (chars per second)"],
+    "write_chars_per_second": ["write (chars per second)"],
+
+    "counters": ["performance counters"],
+    "instructions": ["instructions"],
+    "cycles": ["cycles"],
+    "cache_misses": ["cache misses"],
+    "branch_misses": ["branch misses"],
+    "task_clock": ["task clock", "second(s)"],
+    "cpu_migrations": ["CPU migrations"],
+    "events": ["events"],
+    "scope": ["counted in"],
+    "instructions_per_cycle": ["instructions per cycle"],
+
+    "sampling": ["sampling"],
+    "interval_ms": ["requested interval", "millisecond(s)"],
+    "sample_count": ["number of samples"],
+    "sample_rate": ["achieved sample rate", "samples per second"],
+    "monitor_cpu_time": ["monitor CPU time", "second(s)"],
+
+    "parallel": ["parallel jobs"],
+    "job": ["job"],
+    "cores": ["cores"],
+    "concurrent_iterations": ["concurrent iterations"],
+    "foreign_cpu_time": ["CPU time of other processes on the cores", "second(s)"],
+    "interference": ["interference"],
+
+    "cache": ["page cache"],
+    "state": ["state"],
+    "files": ["input files"],
+
+    "limits": ["resource limits"],
+    "terminated_by_limit": ["terminated by a limit"],
+    "limit_reason": ["limit exceeded"],
+
+    "shell": ["shell"],
+    "path": ["path"],
+    "overhead_runs": ["runs of an empty command"],
+    "overhead_execution_time": ["runtime subtracted", "second(s)"],
+    "overhead_user_time": ["user time subtracted", "second(s)"],
+    "overhead_system_time": ["system time subtracted", "second(s)"],
+    "overhead_memory": ["memory subtracted", "bytes"],
+
+    "processes": ["processes"],
+    "pid": ["pid"],
+    "ppid": ["parent pid"],
+    "cmdline": ["command line"],
+    "start_time": ["start time", "second(s)"],
+    "exit_time": ["exit time", "second(s)"],
+    "memory_max": ["peak memory", "bytes"],
+    "samples": ["samples"],
+    "process_index": ["process index"],
+    "cpu_times": ["CPU time (seconds)"],
+
+    "host": ["host"],
+    "worker": ["worker"],
+    "hostname": ["hostname"],
+    "platform": ["platform"],
+    "machine": ["machine"],
+    "python_version": ["Python version"],
+    "cpu_count": ["logical CPUs"],
+    "memory_total": ["total memory", "bytes"],
+
+    "python": ["Python"],
+    "tracemalloc_peak": ["peak memory allocated by Python", "bytes"],
+    "interpreter_rss_start": ["interpreter memory before the call", "bytes"],
+    "interpreter_rss_growth": ["interpreter memory growth during the call", "bytes"],
+    "gc_collections": ["garbage collections"],
+    "gc_collected": ["objects freed by garbage collections"],
+    "gc_pause_time": ["garbage collection pauses", "second(s)"],
+
+    "cpu_time": ["CPU time", "seconds"],
+    "baseline_mean": ["baseline mean"],
+    "mean": ["mean"],
+    "ratio": ["ratio to the baseline"],
+    "ratio_ci_low": ["ratio confidence interval low"],
+    "ratio_ci_high": ["ratio confidence interval high"],
+    "speedup": ["speedup"],
+    "speedup_ci_low": ["speedup confidence interval low"],
+    "speedup_ci_high": ["speedup confidence interval high"],
+    "welch_p_value": ["Welch's t-test p-value"],
+    "mann_whitney_p_value": ["Mann-Whitney U test p-value"]
 }
\ No newline at end of file
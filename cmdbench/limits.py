@@ -0,0 +1,175 @@
+from .utils import *
+import threading
+import signal
+import psutil
+import os
+
+# Per-iteration resource limits, for commands that might run away (e.g. on a pathological input):
+#   - timeout: wall clock time, in seconds
+#   - memory_limit: memory, in bytes, checked against the time series' memory samples (the RSS of the
+#     whole process tree, or the cgroup's memory usage). With cgroup accounting the kernel enforces it
+#     as well (memory.max, without swap), so a spike between two samples gets the command OOM killed.
+#   - cpu_limit: CPU time of all the command's processes, in seconds
+# A command going over a limit is sent limit_signal: "SIGTERM" gives it limit_grace_period seconds
+# to exit before it gets a SIGKILL, "SIGKILL" kills it right away. Whatever was collected until then
+# (time series, counters, output) is kept, and the iteration gets a "limits" section telling whether
+# a limit stopped it (terminated_by_limit) and which one (limit_reason).
+
+LIMIT_SIGNALS = ["SIGTERM", "SIGKILL"]
+
+DEFAULT_LIMIT_GRACE_PERIOD = 2
+
+# Seconds between two checks of the CPU time, which walks the whole process tree without cgroups
+CPU_LIMIT_CHECK_INTERVAL = 0.1
+
+# Multipliers of the suffixes memory sizes can have (1K = 1024 bytes)
+MEMORY_SIZE_SUFFIXES = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+# Reads a memory size in bytes, like 1048576, 512M or 2G
+def parse_memory_size(value):
+    value = str(value).strip()
+    multiplier = MEMORY_SIZE_SUFFIXES.get(value[-1:].lower())
+    if multiplier is not None:
+        value = value[:-1]
+    try:
+        return int(float(value) * (multiplier or 1))
+    except ValueError:
+        raise Exception("%s is not a memory size (e.g. 1048576, 512M or 2G)" % value)
+
+class ResourceLimits():
+    def __init__(self, timeout = None, memory_limit = None, cpu_limit = None, limit_signal = "SIGTERM", limit_grace_period = DEFAULT_LIMIT_GRACE_PERIOD):
+        if timeout is not None and timeout <= 0:
+            raise Exception("The timeout should be > 0 seconds")
+        if memory_limit is not None and memory_limit <= 0:
+            raise Exception("The memory limit should be > 0 bytes")
+        if cpu_limit is not None and cpu_limit <= 0:
+            raise Exception("The CPU time limit should be > 0 seconds")
+        if limit_signal not in LIMIT_SIGNALS:
+            raise Exception("Unknown limit signal %s, expected one of: %s" % (limit_signal, ", ".join(LIMIT_SIGNALS)))
+        if limit_grace_period < 0:
+            raise Exception("The grace period of the limits should be >= 0 seconds")
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.limit_signal = limit_signal
+        self.limit_grace_period = limit_grace_period
+
+    @property
+    def enabled(self):
+        return self.timeout is not None or self.memory_limit is not None or self.cpu_limit is not None
+
+
+# CPU time of the process and its descendants, the ones it already reaped included
+def read_process_tree_cpu_time(process):
+    cpu_time = 0.0
+    try:
+        processes = [process] + process.children(recursive = True)
+    except psutil.Error:
+        return cpu_time
+    for tree_process in processes:
+        try:
+            cpu_times = tree_process.cpu_times()
+        except psutil.Error:
+            continue
+        cpu_time += cpu_times.user + cpu_times.system + getattr(cpu_times, "children_user", 0) + getattr(cpu_times, "children_system", 0)
+    return cpu_time
+
+def signal_process_tree(process, signal_name):
+    try:
+        processes = [process] + process.children(recursive = True)
+    except psutil.Error:
+        return
+    for tree_process in processes:
+        try:
+            # terminate and kill also work on windows, which has no SIGKILL
+            if signal_name == "SIGKILL":
+                tree_process.kill()
+            else:
+                tree_process.terminate()
+        except psutil.Error:
+            pass
+
+def signal_process_group(process_group, signal_name):
+    try:
+        os.killpg(process_group, getattr(signal, signal_name))
+    except ProcessLookupError:
+        pass
+
+def signal_cgroup(benchmark_cgroup, signal_name):
+    for pid in benchmark_cgroup.read_pids():
+        try:
+            os.kill(pid, getattr(signal, signal_name))
+        except ProcessLookupError:
+            pass
+
+
+# Watches a running command and stops it when it goes over one of its limits.
+#
+# read_memory and read_cpu_time give the command's current memory (None before the first sample)
+# and CPU time, signal_command(signal_name) signals all of its processes.
+# The benchmarking thread calls target_exited once it reaped the command, which ends the checks,
+# and stop once it is done reading the command's output, which ends a pending grace period.
+class LimitWatchdog(threading.Thread):
+    def __init__(self, limits, execution_start, check_interval, read_memory, read_cpu_time, signal_command):
+        super().__init__(daemon = True)
+        self.limits = limits
+        self.execution_start = execution_start
+        self.check_interval = check_interval
+        self.read_memory = read_memory
+        self.read_cpu_time = read_cpu_time
+        self.signal_command = signal_command
+        # The limit the command went over, None while it is within its limits
+        self.limit_reason = None
+        self._target_exited = threading.Event()
+        self._stopped = threading.Event()
+        self._signal_lock = threading.Lock()
+
+    def run(self):
+        next_cpu_check = 0
+        while not self._target_exited.is_set():
+            now = current_nano_time()
+            elapsed_time = (now - self.execution_start) / 1e9
+
+            limit_reason = None
+            if self.limits.timeout is not None and elapsed_time >= self.limits.timeout:
+                limit_reason = "timeout"
+            elif self.limits.memory_limit is not None and (self.read_memory() or 0) > self.limits.memory_limit:
+                limit_reason = "memory"
+            elif self.limits.cpu_limit is not None and now >= next_cpu_check:
+                next_cpu_check = now + CPU_LIMIT_CHECK_INTERVAL * 1e9
+                if self.read_cpu_time() > self.limits.cpu_limit:
+                    limit_reason = "cpu"
+
+            if limit_reason is not None:
+                self.limit_reason = limit_reason
+                self._stop_command()
+                return
+
+            wait_time = self.check_interval
+            if self.limits.timeout is not None:
+                wait_time = min(wait_time, self.limits.timeout - elapsed_time)
+            self._target_exited.wait(max(wait_time, 0))
+
+    def _stop_command(self):
+        self._signal(self.limits.limit_signal)
+        if self.limits.limit_signal != "SIGKILL" and not self._stopped.wait(self.limits.limit_grace_period):
+            self._signal("SIGKILL")
+
+    def _signal(self, signal_name):
+        # Once stopped, the processes (and their pids) might not be the command's anymore
+        with self._signal_lock:
+            if not self._stopped.is_set():
+                self.signal_command(signal_name)
+
+    # Kills the command right away, e.g. when the benchmark is interrupted
+    def kill_command(self):
+        self._signal("SIGKILL")
+
+    def target_exited(self):
+        self._target_exited.set()
+
+    def stop(self):
+        self._target_exited.set()
+        with self._signal_lock:
+            self._stopped.set()
+        self.join()
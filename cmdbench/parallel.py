@@ -0,0 +1,127 @@
+import threading
+import queue
+import click
+import os
+from .procfs import clock_ticks
+
+# Running iterations concurrently ("jobs").
+#
+# Each job runs its share of the iterations one after another with a monitor of its own. On linux,
+# a job's commands and monitoring workers are pinned to a set of cores no other job uses, so
+# concurrent iterations only compete for what the cores share (caches, memory bandwidth, disks).
+# Every iteration records its job, its cores, how many iterations ran next to it and the CPU time
+# other processes spent on its cores, and is flagged when it was likely disturbed.
+
+affinity_available = hasattr(os, "sched_setaffinity")
+
+# CPU time (in seconds) other processes may use on an iteration's cores, per second of the iteration,
+# before the iteration is flagged for interference. On top of it, the kernel's CPU time accounting
+# is only precise to a couple of clock ticks.
+INTERFERENCE_CPU_THRESHOLD = 0.05
+
+# Splits the cores we are allowed to run on into `jobs` disjoint sets of neighboring cores.
+# None for every job when processes can not be pinned to cores on this platform, or there are not enough cores.
+def split_cores(jobs):
+    if not affinity_available:
+        return [None] * jobs
+
+    cores = sorted(os.sched_getaffinity(0))
+    if jobs > len(cores):
+        click.secho("Warning: %s jobs can not get disjoint cores on %s cores, running them without pinning." % (jobs, len(cores)), fg = "yellow")
+        return [None] * jobs
+
+    cores_per_job, extra_cores = divmod(len(cores), jobs)
+    core_sets = []
+    start = 0
+    for job_index in range(jobs):
+        end = start + cores_per_job + (1 if job_index < extra_cores else 0)
+        core_sets.append(cores[start:end])
+        start = end
+    return core_sets
+
+# Formats core numbers like the kernel's cpu lists, e.g. [0, 1, 2, 3, 8] -> "0-3,8"
+def format_cores(cores):
+    ranges = []
+    for core in sorted(cores):
+        if len(ranges) > 0 and ranges[-1][1] == core - 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ",".join(str(first) if first == last else "%s-%s" % (first, last) for first, last in ranges)
+
+
+# Runs run_iteration(job_index, iteration_index) for every iteration, on one thread per job.
+# Yields the index and the raw results of the iterations as they finish, with their "parallel" section completed.
+# The commands and the monitors are processes, so the threads mostly wait on them.
+def run_parallel_iterations(run_iteration, iterations_num, jobs):
+    next_iterations = queue.Queue()
+    for iteration_index in range(iterations_num):
+        next_iterations.put(iteration_index)
+
+    finished_iterations = queue.Queue()
+    stop = threading.Event()
+
+    # Iterations running right now, and the iterations that ran concurrently with each of them
+    running_lock = threading.Lock()
+    running_iterations = set()
+    concurrent_iterations = {}
+
+    def run_job(job_index):
+        while not stop.is_set():
+            try:
+                iteration_index = next_iterations.get_nowait()
+            except queue.Empty:
+                break
+
+            with running_lock:
+                concurrent_iterations[iteration_index] = set(running_iterations)
+                for running_iteration in running_iterations:
+                    concurrent_iterations[running_iteration].add(iteration_index)
+                running_iterations.add(iteration_index)
+
+            try:
+                raw_benchmark_result = run_iteration(job_index, iteration_index)
+            except BaseException as error:
+                stop.set()
+                finished_iterations.put(error)
+                break
+            finally:
+                with running_lock:
+                    running_iterations.discard(iteration_index)
+
+            with running_lock:
+                concurrent_iterations_num = len(concurrent_iterations.pop(iteration_index))
+
+            parallel_results = raw_benchmark_result.setdefault("parallel", {})
+            parallel_results.setdefault("cores", None)
+            parallel_results["job"] = job_index
+            parallel_results["concurrent_iterations"] = concurrent_iterations_num
+            # Without pinning, concurrent iterations share all cores
+            foreign_cpu_time = parallel_results.get("foreign_cpu_time")
+            if foreign_cpu_time is None:
+                parallel_results["interference"] = concurrent_iterations_num > 0
+            else:
+                execution_time = raw_benchmark_result["psutil"]["process"]["execution_time"]
+                parallel_results["interference"] = foreign_cpu_time > INTERFERENCE_CPU_THRESHOLD * execution_time + 2 / clock_ticks
+            finished_iterations.put((iteration_index, raw_benchmark_result))
+        finished_iterations.put(None)
+
+    threads = [threading.Thread(target = run_job, args = (job_index, ), daemon = True) for job_index in range(jobs)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        finished_jobs = 0
+        while finished_jobs < jobs:
+            finished_iteration = finished_iterations.get()
+            if finished_iteration is None:
+                finished_jobs += 1
+            elif isinstance(finished_iteration, BaseException):
+                raise finished_iteration
+            else:
+                yield finished_iteration
+    finally:
+        # Running iterations finish, but no new ones are started
+        stop.set()
+        for thread in threads:
+            thread.join()
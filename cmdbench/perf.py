@@ -0,0 +1,196 @@
+import platform
+import ctypes
+import math
+import struct
+import errno
+import os
+
+# Performance counters of the command's process tree, read through perf_event_open (linux only).
+#
+# The counters are opened on the thread starting the command, disabled, with inherit and enable_on_exec:
+# the command's process inherits them when it is forked, and they start counting when it execs. Every
+# process the command starts inherits them in turn, and the kernel adds the counts of the processes that
+# exited to ours, so reading them after the command was reaped gives the totals of the whole tree.
+# The thread itself never execs, its own counters stay disabled.
+#
+# Hardware events (instructions, cycles, cache misses and branch misses) need a PMU, which most virtual
+# machines don't expose. Software events (task clock, page faults and CPU migrations) are always counted.
+# Counters that could not be counted are NaN, so every iteration has the same keys and numbers.
+# With perf_event_paranoid >= 2, unprivileged users can only count what happens in user space.
+# Counters multiplexed with other events (the PMU has only so many) are scaled to the time they were enabled.
+
+class PerfCounterError(Exception):
+    pass
+
+# perf_event_open's syscall number, per architecture
+PERF_EVENT_OPEN_SYSCALLS = {
+    "x86_64": 298,
+    "i386": 336,
+    "i686": 336,
+    "aarch64": 241,
+    "armv7l": 364,
+    "ppc64le": 319,
+    "riscv64": 241,
+    "s390x": 331
+}
+
+PERF_TYPE_HARDWARE = 0
+PERF_TYPE_SOFTWARE = 1
+
+PERF_COUNT_HW_CPU_CYCLES = 0
+PERF_COUNT_HW_INSTRUCTIONS = 1
+PERF_COUNT_HW_CACHE_MISSES = 3
+PERF_COUNT_HW_BRANCH_MISSES = 5
+
+PERF_COUNT_SW_TASK_CLOCK = 1
+PERF_COUNT_SW_PAGE_FAULTS = 2
+PERF_COUNT_SW_CPU_MIGRATIONS = 4
+
+PERF_FORMAT_TOTAL_TIME_ENABLED = 1 << 0
+PERF_FORMAT_TOTAL_TIME_RUNNING = 1 << 1
+
+# Bits of perf_event_attr's flags
+PERF_ATTR_FLAG_DISABLED = 1 << 0
+PERF_ATTR_FLAG_INHERIT = 1 << 1
+PERF_ATTR_FLAG_EXCLUDE_KERNEL = 1 << 5
+PERF_ATTR_FLAG_EXCLUDE_HV = 1 << 6
+PERF_ATTR_FLAG_ENABLE_ON_EXEC = 1 << 12
+
+PERF_FLAG_FD_CLOEXEC = 1 << 3
+
+PERF_EVENT_PARANOID_PATH = "/proc/sys/kernel/perf_event_paranoid"
+
+# Events counted, by their key in the "counters" section
+HARDWARE_EVENTS = {
+    "instructions": PERF_COUNT_HW_INSTRUCTIONS,
+    "cycles": PERF_COUNT_HW_CPU_CYCLES,
+    "cache_misses": PERF_COUNT_HW_CACHE_MISSES,
+    "branch_misses": PERF_COUNT_HW_BRANCH_MISSES
+}
+SOFTWARE_EVENTS = {
+    "task_clock": PERF_COUNT_SW_TASK_CLOCK,
+    "page_faults": PERF_COUNT_SW_PAGE_FAULTS,
+    "cpu_migrations": PERF_COUNT_SW_CPU_MIGRATIONS
+}
+
+# Errors of a hardware event telling there is no PMU (or it doesn't have the event)
+NO_PMU_ERRNOS = [errno.ENOENT, errno.EOPNOTSUPP, errno.ENODEV, errno.EINVAL]
+
+# perf_event_attr up to config1 (PERF_ATTR_SIZE_VER0), the kernel zero-fills the newer fields
+class PerfEventAttr(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_uint32),
+        ("size", ctypes.c_uint32),
+        ("config", ctypes.c_uint64),
+        ("sample_period", ctypes.c_uint64),
+        ("sample_type", ctypes.c_uint64),
+        ("read_format", ctypes.c_uint64),
+        ("flags", ctypes.c_uint64),
+        ("wakeup_events", ctypes.c_uint32),
+        ("bp_type", ctypes.c_uint32),
+        ("config1", ctypes.c_uint64)
+    ]
+
+_libc = None
+
+def perf_event_open(event_type, config, exclude_kernel):
+    global _libc
+    syscall_number = PERF_EVENT_OPEN_SYSCALLS.get(platform.machine())
+    if syscall_number is None:
+        raise PerfCounterError("perf_event_open is not supported on %s" % platform.machine())
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno = True)
+        _libc.syscall.restype = ctypes.c_long
+
+    attr = PerfEventAttr()
+    attr.type = event_type
+    attr.size = ctypes.sizeof(PerfEventAttr)
+    attr.config = config
+    attr.read_format = PERF_FORMAT_TOTAL_TIME_ENABLED | PERF_FORMAT_TOTAL_TIME_RUNNING
+    attr.flags = PERF_ATTR_FLAG_DISABLED | PERF_ATTR_FLAG_INHERIT | PERF_ATTR_FLAG_ENABLE_ON_EXEC
+    if exclude_kernel:
+        attr.flags |= PERF_ATTR_FLAG_EXCLUDE_KERNEL | PERF_ATTR_FLAG_EXCLUDE_HV
+
+    # pid 0 and cpu -1: the calling thread (and the processes it starts), on any CPU
+    fd = _libc.syscall(syscall_number, ctypes.byref(attr), 0, -1, -1, PERF_FLAG_FD_CLOEXEC)
+    if fd < 0:
+        error_number = ctypes.get_errno()
+        raise OSError(error_number, os.strerror(error_number))
+    return fd
+
+def read_perf_event_paranoid():
+    try:
+        with open(PERF_EVENT_PARANOID_PATH) as paranoid_file:
+            return int(paranoid_file.read())
+    except (OSError, ValueError):
+        return None
+
+# Value of a counter scaled to the time it was enabled, NaN if it was enabled but never got to count
+def read_scaled_counter(fd):
+    value, time_enabled, time_running = struct.unpack("QQQ", os.read(fd, 24))
+    if time_running == 0:
+        return math.nan if time_enabled > 0 else 0
+    if time_running < time_enabled:
+        return int(round(value * time_enabled / time_running))
+    return value
+
+
+# Counters of the command the calling thread starts next. Open them right before starting the
+# command, read them once it was reaped, then close them.
+class PerfCounters():
+    def __init__(self):
+        self._fds = {}
+        self.hardware = False
+        # Kernel-side work is left out when the kernel doesn't let us count it
+        self.exclude_kernel = False
+
+    def open(self):
+        try:
+            self._open_events(PERF_TYPE_SOFTWARE, SOFTWARE_EVENTS)
+        except OSError as e:
+            if e.errno not in [errno.EACCES, errno.EPERM]:
+                raise PerfCounterError("perf_event_open failed: %s" % e.strerror)
+            paranoid = read_perf_event_paranoid()
+            if paranoid is not None and paranoid > 2:
+                raise PerfCounterError("perf_event_paranoid is %s, it should be at most 2" % paranoid)
+            self.exclude_kernel = True
+            try:
+                self._open_events(PERF_TYPE_SOFTWARE, SOFTWARE_EVENTS)
+            except OSError as e:
+                raise PerfCounterError("perf_event_open failed: %s" % e.strerror)
+
+        try:
+            self._open_events(PERF_TYPE_HARDWARE, HARDWARE_EVENTS)
+            self.hardware = True
+        except OSError as e:
+            if e.errno not in NO_PMU_ERRNOS:
+                self.close()
+                raise PerfCounterError("perf_event_open failed: %s" % e.strerror)
+
+    # Opens all the events or none of them
+    def _open_events(self, event_type, events):
+        fds = {}
+        try:
+            for key, config in events.items():
+                fds[key] = perf_event_open(event_type, config, self.exclude_kernel)
+        except OSError:
+            for fd in fds.values():
+                os.close(fd)
+            raise
+        self._fds.update(fds)
+
+    # The "counters" section, the task clock in seconds. Events that were not opened (hardware ones without
+    # a PMU, all of them when opening failed) are NaN.
+    def read(self):
+        counters = {key: math.nan for key in list(HARDWARE_EVENTS) + list(SOFTWARE_EVENTS)}
+        for key, fd in self._fds.items():
+            counters[key] = read_scaled_counter(fd)
+        counters["task_clock"] = counters["task_clock"] / 1e9
+        counters["events"] = "hardware" if self.hardware else ("software" if len(self._fds) > 0 else "none")
+        counters["scope"] = "user" if self.exclude_kernel else "user+kernel"
+        return counters
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
@@ -0,0 +1,43 @@
+# Bookkeeping for the processes of a monitored tree, keyed by pid.
+#
+# A pid alone does not identify a process: once a process exits its pid can be handed to a new
+# one. Entries therefore also keep the process' creation time, and a process only matches an
+# entry if both agree. Entries of processes that left the tree are moved to an exited list,
+# keeping the last values read for them (their final values, as far as we could observe).
+
+class ProcessTableEntry():
+    def __init__(self, process, create_time):
+        self.process = process
+        self.pid = process.pid
+        self.create_time = create_time
+        # Last CPU times read for the process
+        self.cpu_times = None
+
+
+class ProcessTable():
+    def __init__(self):
+        self.entries = {}
+        self.exited_entries = []
+
+    # Returns the process' entry, adding one if the process is new to the table
+    def get_entry(self, process):
+        create_time = process.create_time()
+        entry = self.entries.get(process.pid)
+        if entry is not None and entry.create_time == create_time:
+            return entry
+
+        if entry is not None:
+            # The pid was reused: the process we knew under it has exited
+            self.exited_entries.append(entry)
+        entry = ProcessTableEntry(process, create_time)
+        self.entries[process.pid] = entry
+        return entry
+
+    # Moves the entries of processes that are no longer in the tree to the exited entries
+    def prune(self, alive_pids):
+        exited_pids = [pid for pid in self.entries if pid not in alive_pids]
+        for pid in exited_pids:
+            self.exited_entries.append(self.entries.pop(pid))
+
+    def all_entries(self):
+        return list(self.entries.values()) + self.exited_entries
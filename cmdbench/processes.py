@@ -0,0 +1,117 @@
+from .utils import *
+import numpy as np
+import psutil
+
+# Per-process records of a command's process tree, collected with per_process.
+#
+# The time series only has the CPU and memory usage of the whole tree, summed. With per_process, the
+# time series collector also records every process it sees in the tree, and its own usage at every sample:
+#   - one row per process: pid, ppid, cmdline, and when it started and exited (seconds after the command
+#     started; the exit time is the first sample the process was gone at, or the end of the run)
+#   - samples: one row per sample and process, process_index being the process' row, with its CPU
+#     percentage, its CPU time so far (user + system, in seconds) and its resident memory
+# Processes living shorter than a sampling interval might not be seen at all.
+
+# Columns of the per-process samples
+process_sample_columns = {
+    "sample_nanoseconds": np.int64,
+    "process_index": np.int64,
+    "cpu_percentages": np.float64,
+    "cpu_times": np.float64,
+    "memory_bytes": np.int64
+}
+
+# What get_top_processes can rank the processes by: their peak resident memory or their CPU time
+PROCESS_SORT_KEYS = ["memory_max", "cpu_time"]
+
+# Fields of a process in get_top_processes
+process_keys = ["pid", "ppid", "cmdline", "start_time", "exit_time", "cpu_time", "memory_max"]
+
+
+# Processes the collector has seen. A process is identified by its pid and creation time, pids can be reused.
+class ProcessRecords():
+    # Start times are measured from the target's creation time. Creation times are derived from the boot
+    # time, which is only known to the second, but their differences are exact to a clock tick.
+    def __init__(self, target_create_time):
+        self.target_create_time = target_create_time
+        self._indices = {}
+        self._alive_indices = set()
+        # [pid, ppid, cmdline, start nanoseconds, exit nanoseconds]
+        self.records = []
+
+    # Row of the process, added the first time the process is seen
+    def get_index(self, process, create_time):
+        key = (process.pid, create_time)
+        index = self._indices.get(key)
+        if index is None:
+            try:
+                ppid = process.ppid()
+                cmdline = " ".join(process.cmdline())
+            except psutil.Error:
+                ppid, cmdline = -1, ""
+            start_nanoseconds = max((create_time - self.target_create_time) * 1e9, 0)
+            index = len(self.records)
+            self._indices[key] = index
+            self.records.append([process.pid, ppid, cmdline, start_nanoseconds, None])
+        return index
+
+    # Processes of the previous sample missing from this one exited in between
+    def update_alive(self, alive_indices, sample_nanoseconds):
+        for index in self._alive_indices - alive_indices:
+            self.records[index][4] = sample_nanoseconds
+        self._alive_indices = alive_indices
+
+    # Processes that did not exit before the last sample exited with the run
+    def finish(self, end_nanoseconds):
+        for record in self.records:
+            if record[4] is None:
+                record[4] = end_nanoseconds
+        return [tuple(record) for record in self.records]
+
+
+# The raw "processes" section: the collector's records and the per-process samples, column-wise
+def new_raw_processes(records, sample_arrays):
+    return {
+        "pid": np.array([record[0] for record in records], dtype = np.int64),
+        "ppid": np.array([record[1] for record in records], dtype = np.int64),
+        "cmdline": np.array([record[2] for record in records], dtype = str),
+        "start_nanoseconds": np.array([record[3] for record in records], dtype = np.int64),
+        "exit_nanoseconds": np.array([record[4] for record in records], dtype = np.int64),
+        "samples": sample_arrays
+    }
+
+# The final "processes" section, with the peak memory and CPU time of every process
+def raw_to_final_processes(raw_processes, time_resolution = "ms"):
+    samples = raw_processes["samples"]
+    process_index = samples["process_index"]
+    memory_max = np.zeros(len(raw_processes["pid"]), dtype = np.int64)
+    np.maximum.at(memory_max, process_index, samples["memory_bytes"])
+    # CPU times only grow: the highest is the last one seen
+    cpu_time = np.zeros(len(raw_processes["pid"]), dtype = np.float64)
+    np.maximum.at(cpu_time, process_index, samples["cpu_times"])
+
+    time_key, _ = TIME_RESOLUTIONS[time_resolution]
+    return {
+        "pid": raw_processes["pid"],
+        "ppid": raw_processes["ppid"],
+        "cmdline": raw_processes["cmdline"],
+        "start_time": raw_processes["start_nanoseconds"] / 1e9,
+        "exit_time": raw_processes["exit_nanoseconds"] / 1e9,
+        "cpu_time": cpu_time,
+        "memory_max": memory_max,
+        "samples":
+        {
+            time_key: convert_sample_nanoseconds(samples["sample_nanoseconds"], time_resolution),
+            "process_index": process_index,
+            "cpu_percentages": samples["cpu_percentages"],
+            "cpu_times": samples["cpu_times"],
+            "memory_bytes": samples["memory_bytes"]
+        }
+    }
+
+# The count processes of a final "processes" section with the highest sort_by, highest first
+def get_top_processes(processes, count = 5, sort_by = "memory_max"):
+    if sort_by not in PROCESS_SORT_KEYS:
+        raise Exception("Unknown process sort key %s, expected one of: %s" % (sort_by, ", ".join(PROCESS_SORT_KEYS)))
+    order = np.argsort(-np.asarray(processes[sort_by]), kind = "stable")[:count]
+    return [BenchmarkDict.from_dict({key: processes[key][index].item() for key in process_keys}) for index in order]
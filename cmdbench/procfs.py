@@ -0,0 +1,348 @@
+from collections import namedtuple
+from contextlib import contextmanager
+import errno
+import time
+import os
+import psutil
+
+# Linux-only process reader working directly on /proc.
+#
+# ProcfsProcess implements the subset of psutil.Process used by the collectors (is_running, ppid,
+# cmdline, cpu_times, cpu_percent, memory_info, io_counters, children and oneshot) and raises psutil's
+# exceptions, so the collectors work the same with either backend. It is cheaper because:
+#   - /proc/<pid>/stat, statm and io are opened once per process and re-read with os.pread
+#   - the process tree is found through /proc/<pid>/task/<tid>/children instead of scanning
+#     every process of the system for its parent pid
+# Unlike psutil, a zombie process is not considered running: it has stopped using resources.
+
+procfs_available = os.path.isdir("/proc/self/task")
+
+# Kernels built without CONFIG_PROC_CHILDREN don't provide the children files,
+# then children are found by scanning the parent pids of all processes instead.
+procfs_children_available = os.path.exists("/proc/self/task/%s/children" % os.getpid())
+
+clock_ticks = os.sysconf("SC_CLK_TCK") if procfs_available else 100
+page_size = os.sysconf("SC_PAGE_SIZE") if procfs_available else 4096
+
+def _read_boot_time():
+    with open("/proc/stat", "rb") as stat_file:
+        for line in stat_file:
+            if line.startswith(b"btime"):
+                return int(line.split()[1])
+    return 0
+
+boot_time = _read_boot_time() if procfs_available else 0
+
+# /proc/<pid>/smaps_rollup (linux >= 4.14) has the totals of /proc/<pid>/smaps, summed by the kernel
+smaps_rollup_available = os.path.exists("/proc/self/smaps_rollup")
+
+# Same fields as psutil's namedtuples on linux
+pcputimes = namedtuple("pcputimes", ["user", "system", "children_user", "children_system"])
+pmem = namedtuple("pmem", ["rss", "vms"])
+pio = namedtuple("pio", ["read_count", "write_count", "read_bytes", "write_bytes", "read_chars", "write_chars"])
+pactivity = namedtuple("pactivity", ["voluntary_context_switches", "involuntary_context_switches", "minor_faults", "major_faults", "num_threads", "num_fds"])
+
+# Indices of /proc/<pid>/stat fields after the ")" closing the command name (proc(5) numbering - 3)
+STAT_STATE = 0
+STAT_PPID = 1
+STAT_MINFLT = 7
+STAT_CMINFLT = 8
+STAT_MAJFLT = 9
+STAT_CMAJFLT = 10
+STAT_UTIME = 11
+STAT_STIME = 12
+STAT_CUTIME = 13
+STAT_CSTIME = 14
+STAT_NUM_THREADS = 17
+STAT_STARTTIME = 19
+
+# Maximum size of the /proc files we read
+READ_SIZE = 4096
+
+
+# Opens /proc files of processes once and keeps them open while the processes live.
+# Shared by all ProcfsProcess objects of one monitored tree.
+class ProcfsTree():
+    def __init__(self):
+        self.processes = {}
+
+    def get_process(self, pid):
+        process = self.processes.get(pid)
+        if process is not None and process.is_running():
+            return process
+        if process is not None:
+            process.close()
+        process = ProcfsProcess(pid, self)
+        self.processes[pid] = process
+        return process
+
+    # Closes the files of processes that are not part of the tree anymore
+    def prune(self, alive_pids):
+        for pid in list(self.processes.keys()):
+            if pid not in alive_pids:
+                self.processes.pop(pid).close()
+
+    # Pids of the direct children of the process.
+    # ppid_map is only used (and has to be given) when the children files are not available.
+    def child_pids(self, pid, ppid_map = None):
+        if not procfs_children_available:
+            return [child_pid for child_pid, ppid in ppid_map.items() if ppid == pid]
+
+        child_pids = []
+        try:
+            thread_ids = os.listdir("/proc/%s/task" % pid)
+        except OSError:
+            return child_pids
+        # Children are attached to the thread that created them
+        for thread_id in thread_ids:
+            try:
+                with open("/proc/%s/task/%s/children" % (pid, thread_id), "rb") as children_file:
+                    child_pids.extend(int(child_pid) for child_pid in children_file.read().split())
+            except OSError:
+                # The thread might end while we are reading it
+                pass
+        return child_pids
+
+    def close(self):
+        for process in self.processes.values():
+            process.close()
+        self.processes = {}
+
+
+def _ppid_map():
+    ppids = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % entry, "rb") as stat_file:
+                ppids[int(entry)] = int(_split_stat(stat_file.read())[STAT_PPID])
+        except (OSError, IndexError, ValueError):
+            pass
+    return ppids
+
+# The command name can contain spaces and parentheses, fields start after its last ")"
+def _split_stat(stat_data):
+    return stat_data[stat_data.rindex(b")") + 2:].split()
+
+
+class ProcfsProcess():
+    def __init__(self, pid, tree = None):
+        self.pid = pid
+        self._tree = tree if tree is not None else ProcfsTree()
+        self._fds = {}
+        self._last_cpu_time = None
+        self._last_timer = None
+        # Start time (in clock ticks after boot) identifies the process in case its pid gets reused
+        self._start_time = self._stat()[STAT_STARTTIME]
+
+    def _fd(self, name):
+        fd = self._fds.get(name)
+        if fd is None:
+            try:
+                fd = os.open("/proc/%s/%s" % (self.pid, name), os.O_RDONLY)
+            except OSError as error:
+                raise self._translate_error(error)
+            self._fds[name] = fd
+        return fd
+
+    def _read(self, name):
+        try:
+            data = os.pread(self._fd(name), READ_SIZE, 0)
+        except OSError as error:
+            raise self._translate_error(error)
+        if len(data) == 0:
+            raise psutil.NoSuchProcess(self.pid)
+        return data
+
+    def _translate_error(self, error):
+        if error.errno in (errno.EACCES, errno.EPERM):
+            return psutil.AccessDenied(self.pid)
+        return psutil.NoSuchProcess(self.pid)
+
+    def _stat(self):
+        return _split_stat(self._read("stat"))
+
+    def is_running(self):
+        try:
+            stat = self._stat()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+        return stat[STAT_STARTTIME] == self._start_time and stat[STAT_STATE] != b"Z"
+
+    @contextmanager
+    def oneshot(self):
+        yield
+
+    def ppid(self):
+        return int(self._stat()[STAT_PPID])
+
+    # Read once: unlike the other files, it is not sampled
+    def cmdline(self):
+        try:
+            with open("/proc/%s/cmdline" % self.pid, "rb") as cmdline_file:
+                cmdline_data = cmdline_file.read()
+        except OSError as error:
+            raise self._translate_error(error)
+        return [argument.decode(errors = "replace") for argument in cmdline_data.split(b"\0")[:-1]]
+
+    # Seconds since the epoch, like psutil
+    def create_time(self):
+        return boot_time + int(self._start_time) / clock_ticks
+
+    def cpu_times(self):
+        stat = self._stat()
+        return pcputimes(
+            int(stat[STAT_UTIME]) / clock_ticks,
+            int(stat[STAT_STIME]) / clock_ticks,
+            int(stat[STAT_CUTIME]) / clock_ticks,
+            int(stat[STAT_CSTIME]) / clock_ticks
+        )
+
+    # Same semantics as psutil.Process.cpu_percent(): usage since the previous call,
+    # 0.0 on the first call, and may be above 100 for processes using several cores.
+    def cpu_percent(self):
+        stat = self._stat()
+        cpu_time = (int(stat[STAT_UTIME]) + int(stat[STAT_STIME])) / clock_ticks
+        timer = time.monotonic()
+
+        last_cpu_time, last_timer = self._last_cpu_time, self._last_timer
+        self._last_cpu_time, self._last_timer = cpu_time, timer
+        if last_timer is None or timer == last_timer:
+            return 0.0
+        return (cpu_time - last_cpu_time) / (timer - last_timer) * 100
+
+    def memory_info(self):
+        statm = self._read("statm").split()
+        return pmem(int(statm[1]) * page_size, int(statm[0]) * page_size)
+
+    def io_counters(self):
+        io_values = {}
+        for line in self._read("io").splitlines():
+            key, _, value = line.partition(b":")
+            io_values[key] = int(value)
+        return pio(
+            io_values[b"syscr"], io_values[b"syscw"],
+            io_values[b"read_bytes"], io_values[b"write_bytes"],
+            io_values[b"rchar"], io_values[b"wchar"]
+        )
+
+    def children(self, recursive = False):
+        children = []
+        parent_pids = [self.pid]
+        ppid_map = None if procfs_children_available else _ppid_map()
+        while len(parent_pids) > 0:
+            child_pids = []
+            for parent_pid in parent_pids:
+                child_pids.extend(self._tree.child_pids(parent_pid, ppid_map))
+            for child_pid in child_pids:
+                try:
+                    children.append(self._tree.get_process(child_pid))
+                except psutil.NoSuchProcess:
+                    # The child might end before we get to it
+                    pass
+            parent_pids = child_pids if recursive else []
+
+        # A recursive walk sees the whole tree: files of exited descendants can be closed
+        if recursive:
+            self._tree.prune(set(child.pid for child in children))
+        return children
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+
+    # Closes the files of this process and of all the descendants read through it
+    def close_tree(self):
+        self._tree.close()
+        self.close()
+
+    def __eq__(self, other):
+        return isinstance(other, ProcfsProcess) and (self.pid, self._start_time) == (other.pid, other._start_time)
+
+    def __hash__(self):
+        return hash((self.pid, self._start_time))
+
+    def __repr__(self):
+        return "ProcfsProcess(pid=%s)" % self.pid
+
+
+# Time (in seconds) the given cores spent running anything since boot, from /proc/stat.
+# Idle and iowait time are left out; guest time is already part of user time.
+def read_cores_busy_time(cores):
+    core_names = set(b"cpu%d" % core for core in cores)
+    busy_ticks = 0
+    with open("/proc/stat", "rb") as stat_file:
+        for line in stat_file:
+            fields = line.split()
+            if fields[0] in core_names:
+                # user nice system idle iowait irq softirq steal ...
+                busy_ticks += sum(int(value) for value in fields[1:4] + fields[6:9])
+    return busy_ticks / clock_ticks
+
+
+def _read_proc_file(pid, name):
+    try:
+        with open("/proc/%s/%s" % (pid, name), "rb") as proc_file:
+            return proc_file.read()
+    except OSError as error:
+        if error.errno in (errno.EACCES, errno.EPERM):
+            raise psutil.AccessDenied(pid)
+        raise psutil.NoSuchProcess(pid)
+
+# PSS (the process' resident memory, pages shared with n processes counting for 1/n) and USS
+# (the memory only the process uses) of the process, in bytes.
+# Read from smaps_rollup, much cheaper than parsing every mapping of smaps like psutil's memory_full_info
+# can. Still, the kernel walks the process' page tables for it: large processes take a while to read.
+def read_proportional_memory(pid):
+    if not smaps_rollup_available:
+        memory_full_info = psutil.Process(pid).memory_full_info()
+        return memory_full_info.pss, memory_full_info.uss
+    smaps_data = _read_proc_file(pid, "smaps_rollup")
+    pss, uss = 0, 0
+    for line in smaps_data.splitlines():
+        # e.g. "Pss:                1234 kB"
+        if line.startswith(b"Pss:"):
+            pss = int(line.split()[1]) * 1024
+        elif line.startswith(b"Private_Clean:") or line.startswith(b"Private_Dirty:"):
+            uss += int(line.split()[1]) * 1024
+    return pss, uss
+
+
+# Context switches, page faults, threads and open file descriptors of the process.
+# Page faults include the ones of the children the process reaped. Context switches are counted per thread:
+# they are summed over the process' threads, and the ones of exited threads and reaped children are not included.
+# The file descriptors of processes of other users can't be listed, they are 0.
+def read_activity(pid):
+    stat = _split_stat(_read_proc_file(pid, "stat"))
+    voluntary_context_switches, involuntary_context_switches = 0, 0
+    try:
+        thread_ids = os.listdir("/proc/%s/task" % pid)
+    except OSError:
+        raise psutil.NoSuchProcess(pid)
+    for thread_id in thread_ids:
+        try:
+            thread_status = _read_proc_file(pid, "task/%s/status" % thread_id)
+        except psutil.NoSuchProcess:
+            # The thread might exit while we are reading the others
+            continue
+        for line in thread_status.splitlines():
+            if line.startswith(b"voluntary_ctxt_switches:"):
+                voluntary_context_switches += int(line.split()[1])
+            elif line.startswith(b"nonvoluntary_ctxt_switches:"):
+                involuntary_context_switches += int(line.split()[1])
+    try:
+        num_fds = len(os.listdir("/proc/%s/fd" % pid))
+    except PermissionError:
+        num_fds = 0
+    except OSError:
+        raise psutil.NoSuchProcess(pid)
+    return pactivity(
+        voluntary_context_switches,
+        involuntary_context_switches,
+        int(stat[STAT_MINFLT]) + int(stat[STAT_CMINFLT]),
+        int(stat[STAT_MAJFLT]) + int(stat[STAT_CMAJFLT]),
+        int(stat[STAT_NUM_THREADS]),
+        num_fds
+    )
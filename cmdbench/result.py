@@ -1,4 +1,5 @@
 from .utils import *
+from .processes import get_top_processes
 from inspect import isfunction
 from scipy.interpolate import interp1d
 import math
@@ -10,9 +11,9 @@ except ImportError:
     matplotlib_available = False
 
 class BenchmarkResults():
-    iterations = []
-    def __init__(self, iterations = []):
-        self.iterations = iterations
+    def __init__(self, iterations = None):
+        # A fresh list per object: add_benchmark_result extends it in place
+        self.iterations = iterations if iterations is not None else []
 
     def _has_one_iteration(self):
         return len(self.iterations) == 1
@@ -49,38 +50,56 @@ class BenchmarkResults():
             return values_list
 
     def get_statistics(self):
+        processes_dict_key = "processes"
 
         def stats_replace_func(list_of_objects, key_path):
             sample_data = list_of_objects[0]
-            if isinstance(sample_data, str):
+            # Strings, and outputs that were not kept (None)
+            if isinstance(sample_data, str) or sample_data is None:
+                return None
+            # Processes differ from one iteration to the next
+            elif key_path[0] == processes_dict_key:
                 return None
             else:
                 return BenchmarkStats(list_of_objects)
         
         value_per_attribute_stats_dict = self._get_values_per_attribute(self.iterations, stats_replace_func)
+        value_per_attribute_stats_dict.pop(processes_dict_key, None)
         return BenchmarkDict.from_dict(value_per_attribute_stats_dict)
 
     def get_averages(self):
         time_series_dict_key = "time_series"
+        processes_dict_key = "processes"
 
         def avg_replace_func(list_of_objects, key_path):
             sample_data = list_of_objects[0]
-            if isinstance(sample_data, str):
+            # Strings, and outputs that were not kept (None)
+            if isinstance(sample_data, str) or sample_data is None:
+                return None
+            elif key_path[0] == processes_dict_key:
                 return None
             elif key_path[0] == time_series_dict_key:
                 return list_of_objects
             else:
-                return np.mean(np.array(list_of_objects).flatten())
+                values = np.array(list_of_objects).flatten()
+                # Values that are not available in every iteration (NaN) are left out, like in get_statistics
+                if values.dtype.kind == "f":
+                    values = values[~np.isnan(values)]
+                    if len(values) == 0:
+                        return np.nan
+                return np.mean(values)
         
         value_per_attribute_avgs_dict = self._get_values_per_attribute(self.iterations, avg_replace_func)
+        value_per_attribute_avgs_dict.pop(processes_dict_key, None)
         
         # Break down time series data to time_series_x_values and time_series_y_values
         averaged_time_series = {}
-        time_series_x_values = value_per_attribute_avgs_dict["time_series"]["sample_milliseconds"]
+        time_key, _ = get_time_series_time_key(value_per_attribute_avgs_dict["time_series"])
+        time_series_x_values = value_per_attribute_avgs_dict["time_series"][time_key]
         time_series_y_values = {}
 
         for key, value in value_per_attribute_avgs_dict["time_series"].items():
-            if key != "sample_milliseconds":
+            if key != time_key:
                 time_series_y_values[key] = value
 
         if len(time_series_x_values) == 0 or len(time_series_x_values[0]) == 0:
@@ -90,8 +109,8 @@ class BenchmarkResults():
         min_time = max([min(ts) for ts in time_series_x_values])
         max_time = min([max(ts) for ts in time_series_x_values])
         
-        # Define a common time grid (uniform x values)
-        uniform_time_grid = np.linspace(min_time, max_time, num=max_time - min_time + 1)
+        # Define a common time grid (uniform x values), as dense as the most sampled iteration
+        uniform_time_grid = np.linspace(min_time, max_time, num=max([len(ts) for ts in time_series_x_values]))
         
         time_series_y_values_out = {key: np.zeros_like(uniform_time_grid) for key in time_series_y_values}
 
@@ -110,7 +129,7 @@ class BenchmarkResults():
             time_series_y_values_out[key] /= len(time_series_x_values)
 
         # Pack data into averaged_time_series
-        averaged_time_series["sample_milliseconds"] = uniform_time_grid
+        averaged_time_series[time_key] = uniform_time_grid
         for key, value in time_series_y_values_out.items():
             averaged_time_series[key] = value
 
@@ -118,6 +137,14 @@ class BenchmarkResults():
 
         return BenchmarkDict.from_dict(value_per_attribute_avgs_dict)
 
+    # The processes of an iteration benchmarked with per_process using the most memory (sort_by = "memory_max",
+    # their peak resident memory) or CPU time (sort_by = "cpu_time"), highest first
+    def get_top_processes(self, count = 5, sort_by = "memory_max", iteration_index = 0):
+        iteration = self.iterations[iteration_index]
+        if "processes" not in iteration:
+            raise Exception("The iteration has no per-process records, it has to be benchmarked with per_process")
+        return get_top_processes(iteration["processes"], count, sort_by)
+
 
     def get_resources_plot(self, width = 15, height = 3):
         if not matplotlib_available:
@@ -131,7 +158,8 @@ class BenchmarkResults():
         
         time_series_obj = time_series_obj["time_series"]
 
-        results_sample_milliseconds = time_series_obj["sample_milliseconds"]
+        time_key, unit_nanoseconds = get_time_series_time_key(time_series_obj)
+        results_sample_milliseconds = np.array(time_series_obj[time_key]) * unit_nanoseconds / 10 ** 6
 
         results_memory_values = time_series_obj["memory_bytes"]
         results_cpu_percentages = time_series_obj["cpu_percentages"]
@@ -164,15 +192,36 @@ class BenchmarkResults():
 
         # END:  Rescale memory_y data to proper file size.
 
+        # Disk rates get their own plot, below, when the command did any I/O
+        disk_rates = {}
+        for disk_series_key in DISK_SERIES_KEYS:
+            disk_rate_key = get_rate_key(disk_series_key)
+            if disk_rate_key in time_series_obj:
+                disk_rates[disk_series_key] = np.array(time_series_obj[disk_rate_key], dtype = float)
+        has_disk_plot = any(np.any(disk_rate > 0) for disk_rate in disk_rates.values())
+        # And so do the page faults and context switches, when they were sampled
+        has_activity_plot = get_rate_key("minor_faults") in time_series_obj
 
         color = "tab:blue"
-        fig, ax_memory = plt.subplots()
+        plots_num = 1 + has_disk_plot + has_activity_plot
+        if plots_num > 1:
+            fig, axes = plt.subplots(plots_num, 1, sharex = True, figsize = (width, height * plots_num))
+            ax_memory = axes[0]
+            ax_disk = axes[1] if has_disk_plot else None
+            ax_activity = axes[-1] if has_activity_plot else None
+        else:
+            fig, ax_memory = plt.subplots()
+            axes = [ax_memory]
+        axes[-1].set_xlabel("Milliseconds")
         ax_memory.grid()
-        ax_memory.set_xlabel("Milliseconds")
         ax_memory.set_ylabel("Memory (%s)" % scales[bit_logs], color=color)
         ax_memory.plot(x, memory_y, color=color, alpha=0.8)
         ax_memory.tick_params(axis="y", labelcolor=color)
-        plt.fill_between(x, memory_y, alpha=0.2, color=color)
+        ax_memory.fill_between(x, memory_y, alpha=0.2, color=color)
+        # With PSS accounting, the PSS of the tree is drawn over its RSS, on the same scale
+        if "pss_bytes" in time_series_obj:
+            ax_memory.plot(x, np.array(time_series_obj["pss_bytes"], dtype = float) / 1024 ** bit_logs, color=color, linestyle="--", alpha=0.8, label="PSS")
+            ax_memory.legend(loc="upper left")
 
         color = "tab:green"
         ax_cpu = ax_memory.twinx()
@@ -181,6 +230,45 @@ class BenchmarkResults():
         ax_cpu.tick_params(axis="y", labelcolor=color)
         #plt.fill_between(x, cpu_y, alpha=0.2, color=color)
 
+        ## DISK
+
+        if has_disk_plot:
+            # Rescaled like the memory, to the power of 1024 of the highest rate
+            max_rate = max(np.max(disk_rate) for disk_rate in disk_rates.values())
+            rate_bit_logs = math.floor(math.log(max_rate, 1024))
+            ax_disk.grid()
+            ax_disk.set_ylabel("Disk (%s/s)" % scales[rate_bit_logs])
+            # Bytes are the storage layer's I/O, chars all the reads and writes (page cache hits, pipes...)
+            disk_plot_styles = {
+                "read_bytes": ("tab:orange", "-"),
+                "write_bytes": ("tab:red", "-"),
+                "read_chars": ("tab:orange", "--"),
+                "write_chars": ("tab:red", "--")
+            }
+            for disk_series_key, disk_rate in disk_rates.items():
+                color, linestyle = disk_plot_styles[disk_series_key]
+                ax_disk.plot(x, disk_rate / 1024 ** rate_bit_logs, color=color, linestyle=linestyle, alpha=0.8, linewidth=1, label=disk_series_key.replace("_", " "))
+            ax_disk.legend(loc="upper right")
+
+        ## PAGE FAULTS + CONTEXT SWITCHES
+
+        if has_activity_plot:
+            color = "tab:purple"
+            ax_activity.grid()
+            ax_activity.set_ylabel("Page faults (/s)", color=color)
+            ax_activity.plot(x, time_series_obj[get_rate_key("minor_faults")], color=color, alpha=0.8, linewidth=1, label="minor faults")
+            ax_activity.plot(x, time_series_obj[get_rate_key("major_faults")], color=color, linestyle="--", alpha=0.8, linewidth=1, label="major faults")
+            ax_activity.tick_params(axis="y", labelcolor=color)
+            ax_activity.legend(loc="upper left")
+
+            color = "tab:brown"
+            ax_context_switches = ax_activity.twinx()
+            ax_context_switches.set_ylabel("Context switches (/s)", color=color)
+            ax_context_switches.plot(x, time_series_obj[get_rate_key("voluntary_context_switches")], color=color, alpha=0.8, linewidth=1, label="voluntary")
+            ax_context_switches.plot(x, time_series_obj[get_rate_key("involuntary_context_switches")], color=color, linestyle="--", alpha=0.8, linewidth=1, label="involuntary")
+            ax_context_switches.tick_params(axis="y", labelcolor=color)
+            ax_context_switches.legend(loc="upper right")
+
         #plt.tight_layout()
 
         # https://stackoverflow.com/a/31845332
@@ -0,0 +1,226 @@
+import secrets
+import numpy as np
+
+shared_memory_available = True
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8: collectors fall back to threads sharing plain numpy arrays
+    shared_memory_available = False
+
+# Samples a time series ring can hold before it grows for the first time
+DEFAULT_RING_CAPACITY = 4096
+
+# Names are kept short: macOS limits POSIX shared memory names to 31 characters
+def new_segment_prefix():
+    return "cb" + secrets.token_hex(6)
+
+
+# A block of memory either backed by a named shared memory segment (readable and writable
+# from other processes) or by a private buffer (for collectors running as threads).
+class _MemoryBlock():
+    def __init__(self, name, size, create, shared):
+        self.name = name
+        self.shared = shared
+        self._segment = None
+        if shared:
+            self._segment = shared_memory.SharedMemory(name = name, create = create, size = size if create else 0)
+            self.buffer = self._segment.buf
+        else:
+            self.buffer = bytearray(size)
+
+    def close(self):
+        if self._segment is not None:
+            self.buffer = None
+            self._segment.close()
+
+    def unlink(self):
+        if self._segment is not None:
+            self._segment.unlink()
+
+
+# Lays out named numpy arrays back to back inside a memory block.
+# All column types are 8 bytes wide so every array stays aligned.
+def _block_arrays(block, dtypes, length):
+    arrays = []
+    offset = 0
+    for dtype in dtypes:
+        arrays.append(np.ndarray((length, ), dtype = dtype, buffer = block.buffer, offset = offset))
+        offset += length * np.dtype(dtype).itemsize
+    return arrays
+
+def _block_size(dtypes, length):
+    return max(sum(np.dtype(dtype).itemsize for dtype in dtypes) * length, 1)
+
+
+# Fixed set of scalar fields shared between the benchmarking process and its collectors.
+# Replaces a multiprocessing.Manager dict: reads and writes are plain memory accesses instead
+# of proxy round trips to a server process, so they are cheap enough for the sampling loops.
+#
+# Fields are declared with their initial values, which also fix their types (bool, int or float).
+# Access works like a dict: state["target_process_pid"] = pid
+class SharedBenchmarkState():
+    def __init__(self, fields, shared = True, name = None):
+        self.shared = shared and shared_memory_available
+        self._initial_values = dict(fields)
+        self._types = {key: type(value) for key, value in fields.items()}
+        self._int_keys = [key for key, value_type in self._types.items() if value_type is not float]
+        self._float_keys = [key for key, value_type in self._types.items() if value_type is float]
+
+        create = name is None
+        self._block = _MemoryBlock(name or new_segment_prefix(), _block_size([np.int64, np.float64], len(fields)), create, self.shared)
+        self._attach_arrays()
+        if create:
+            self.reset()
+
+    def _attach_arrays(self):
+        int_values, float_values = _block_arrays(self._block, [np.int64, np.float64], len(self._types))
+        self._slots = {}
+        for index, key in enumerate(self._int_keys):
+            self._slots[key] = (int_values, index)
+        for index, key in enumerate(self._float_keys):
+            self._slots[key] = (float_values, index)
+
+    # Puts every field back to its initial value
+    def reset(self):
+        for key, value in self._initial_values.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        values, index = self._slots[key]
+        return self._types[key](values[index])
+
+    def __setitem__(self, key, value):
+        values, index = self._slots[key]
+        values[index] = value
+
+    # Pickling (spawn start method) re-attaches to the same segment by name
+    def __getstate__(self):
+        if not self.shared:
+            raise Exception("A non-shared benchmark state can not be sent to another process")
+        return {"name": self._block.name, "fields": self._initial_values}
+
+    def __setstate__(self, state):
+        self.__init__(state["fields"], True, state["name"])
+
+    def close(self):
+        self._slots = {}
+        self._block.close()
+
+    def unlink(self):
+        self._block.unlink()
+
+
+# Append-only table of samples (one numpy array per column) written by a single collector
+# and read back by the benchmarking process once the collector is done.
+#
+# Storage starts as one preallocated chunk and grows by adding chunks of doubling size, so
+# appending never copies earlier samples. Chunk i is a segment named <prefix>_<i>; the number
+# of rows and of created chunks is kept in a small header segment, which is all a reader needs
+# to find the chunks.
+class SampleRing():
+    def __init__(self, columns, capacity = DEFAULT_RING_CAPACITY, shared = True, prefix = None):
+        self.shared = shared and shared_memory_available
+        self.columns = dict(columns)
+        self.capacity = capacity
+        self._dtypes = list(self.columns.values())
+
+        create = prefix is None
+        self.prefix = prefix or new_segment_prefix()
+        self._header_block = _MemoryBlock(self.prefix + "_h", _block_size([np.int64], 2), create, self.shared)
+        # [number of rows, number of chunks]
+        self._header = _block_arrays(self._header_block, [np.int64], 2)[0]
+        self._chunk_blocks = []
+        self._chunks = []
+        if create:
+            self._header[:] = 0
+            self._get_chunk(0)
+
+    def __len__(self):
+        return int(self._header[0])
+
+    def _chunk_capacity(self, chunk_index):
+        return self.capacity * 2 ** chunk_index
+
+    # Chunk i holds rows [capacity * (2^i - 1), capacity * (2^(i+1) - 1))
+    def _locate(self, row_index):
+        chunk_index = (row_index // self.capacity + 1).bit_length() - 1
+        return chunk_index, row_index - self.capacity * (2 ** chunk_index - 1)
+
+    def _get_chunk(self, chunk_index):
+        while len(self._chunks) <= chunk_index:
+            next_index = len(self._chunks)
+            length = self._chunk_capacity(next_index)
+            name = "%s_%s" % (self.prefix, next_index)
+            size = _block_size(self._dtypes, length)
+            # The writer creates chunks as it needs them; a reader attaches to the ones that exist
+            if next_index < self._header[1]:
+                block = _MemoryBlock(name, size, False, self.shared)
+            else:
+                block = _MemoryBlock(name, size, True, self.shared)
+                self._header[1] = next_index + 1
+            self._chunk_blocks.append(block)
+            self._chunks.append(_block_arrays(block, self._dtypes, length))
+        return self._chunks[chunk_index]
+
+    def append(self, row):
+        row_index = int(self._header[0])
+        chunk_index, offset = self._locate(row_index)
+        for column, value in zip(self._get_chunk(chunk_index), row):
+            column[offset] = value
+        # Publish the row only once all of its columns are written
+        self._header[0] = row_index + 1
+
+    def reset(self):
+        self._header[0] = 0
+
+    # Value of a column in the last row, None while the ring is empty.
+    # Can be read while the writer appends: rows are only published once written.
+    def get_last(self, key):
+        rows_count = len(self)
+        if rows_count == 0:
+            return None
+        chunk_index, offset = self._locate(rows_count - 1)
+        return self._get_chunk(chunk_index)[list(self.columns.keys()).index(key)][offset].item()
+
+    # Copies the samples out of the ring as a dict of contiguous numpy arrays
+    def to_arrays(self):
+        rows_count = len(self)
+        parts = [[] for _ in self._dtypes]
+        row_index = 0
+        chunk_index = 0
+        while row_index < rows_count:
+            chunk = self._get_chunk(chunk_index)
+            rows_in_chunk = min(self._chunk_capacity(chunk_index), rows_count - row_index)
+            for column_index, column in enumerate(chunk):
+                parts[column_index].append(column[:rows_in_chunk])
+            row_index += rows_in_chunk
+            chunk_index += 1
+
+        arrays = {}
+        for column_index, (key, dtype) in enumerate(self.columns.items()):
+            arrays[key] = np.concatenate(parts[column_index]) if len(parts[column_index]) > 0 else np.array([], dtype = dtype)
+        return arrays
+
+    def __getstate__(self):
+        if not self.shared:
+            raise Exception("A non-shared sample ring can not be sent to another process")
+        return {"columns": self.columns, "capacity": self.capacity, "prefix": self.prefix}
+
+    def __setstate__(self, state):
+        self.__init__(state["columns"], state["capacity"], True, state["prefix"])
+
+    def close(self):
+        # numpy views have to be released before their segments can be closed
+        self._chunks = []
+        self._header = None
+        for block in self._chunk_blocks + [self._header_block]:
+            block.close()
+        self._chunk_blocks = []
+
+    # Removes the ring's segments, including the chunks that were created by the writer.
+    # Only called by the owner, after the writer is done.
+    def unlink(self):
+        self._get_chunk(int(self._header[1]) - 1)
+        for block in self._chunk_blocks + [self._header_block]:
+            block.unlink()
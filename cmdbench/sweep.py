@@ -0,0 +1,151 @@
+from .utils import *
+from .result import BenchmarkResults, matplotlib_available
+import math
+
+if matplotlib_available:
+    import matplotlib.pyplot as plt
+
+# Parameter sweeps: one command template benchmarked for every value of a parameter.
+# "{<name>}" in the command is replaced by the value, e.g. "sort -S {buffer} data.txt" with buffer = 1M,10M,100M.
+
+# Multipliers of the suffixes parameter values can have to be read as numbers (1k = 1000)
+PARAMETER_SUFFIXES = {"k": 10 ** 3, "m": 10 ** 6, "g": 10 ** 9, "t": 10 ** 12}
+
+# The x axis of the scaling plots is logarithmic when the values span at least this factor
+LOG_SCALE_MIN_RATIO = 100
+
+# Results shown in the sweep table and plots: name and path in the final benchmark results
+SWEEP_METRICS = {
+    "execution_time": ["process", "execution_time"],
+    "cpu_time": ["cpu", "total_time"],
+    "memory": ["memory", "max"],
+    "disk_read_bytes": ["disk", "read_bytes"],
+    "disk_write_bytes": ["disk", "write_bytes"]
+}
+
+# Values of a --parameter-scan: from start to end (included) in steps of step
+def get_scan_values(start, end, step = 1):
+    if step <= 0:
+        raise Exception("The step of a parameter scan should be > 0")
+    direction = 1 if end >= start else -1
+    values_num = int(math.floor(abs(end - start) / step + 1e-9)) + 1
+    values = [start + direction * step * value_index for value_index in range(values_num)]
+    if all(float(value).is_integer() for value in [start, end, step]):
+        return [int(value) for value in values]
+    # Avoids 0.30000000000000004 in the commands
+    return [float("%.12g" % value) for value in values]
+
+# Reads a parameter value as a number ("10k" = 10000), None when it isn't one
+def parse_parameter_number(value):
+    if isinstance(value, (int, float)):
+        return value
+    value = str(value).strip()
+    multiplier = PARAMETER_SUFFIXES.get(value[-1:].lower())
+    if multiplier is not None:
+        value = value[:-1]
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number * (multiplier or 1)
+
+def format_parameter_value(value):
+    if isinstance(value, float):
+        return "%.12g" % value
+    return str(value)
+
+# The command of every value, the template's "{<name>}" replaced by the value (in every argument of an argv list)
+def get_sweep_commands(command, parameter_name, parameter_values):
+    placeholder = "{%s}" % parameter_name
+    is_argv = isinstance(command, (list, tuple))
+    if not any(placeholder in argument for argument in (command if is_argv else [command])):
+        raise Exception("The command does not use the parameter, %s should be in it" % placeholder)
+    if len(parameter_values) == 0:
+        raise Exception("The parameter has no values")
+    if is_argv:
+        return [[argument.replace(placeholder, format_parameter_value(value)) for argument in command] for value in parameter_values]
+    return [command.replace(placeholder, format_parameter_value(value)) for value in parameter_values]
+
+
+# Results of sweep_command: the BenchmarkResults of every value of the parameter (a point of the sweep)
+class SweepResults():
+    def __init__(self, command, parameter_name, parameter_values, benchmark_results = None):
+        self.command = command
+        self.parameter_name = parameter_name
+        self.parameter_values = parameter_values
+        self.commands = get_sweep_commands(command, parameter_name, parameter_values)
+        self.benchmark_results = benchmark_results if benchmark_results is not None else [BenchmarkResults() for _ in parameter_values]
+
+    def get_benchmark_results(self, point_index):
+        return self.benchmark_results[point_index]
+
+    # One row per value: the value, the number of runs and statistics (BenchmarkStats) of the
+    # runtime, CPU time, peak memory and disk bytes (None when not available, e.g. disk on macos)
+    def get_table(self):
+        table = []
+        for value, command, benchmark_results in zip(self.parameter_values, self.commands, self.benchmark_results):
+            row = {"value": value, "command": command, "runs": len(benchmark_results.iterations)}
+            for metric, key_path in SWEEP_METRICS.items():
+                values = []
+                for iteration in benchmark_results.iterations:
+                    for key in key_path:
+                        iteration = iteration.get(key) if iteration is not None else None
+                    if iteration is not None:
+                        values.append(iteration)
+                row[metric] = BenchmarkStats(values) if len(values) > 0 else None
+            table.append(BenchmarkDict.from_dict(row))
+        return table
+
+    # Runtime, peak memory and disk usage (means, with the standard deviations as error bars) against the parameter
+    def get_scaling_plot(self, width = 15, height = 4):
+        if not matplotlib_available:
+            raise Exception("You need to install matplotlib before using this method")
+
+        table = [row for row in self.get_table() if row.runs > 0]
+        if len(table) == 0:
+            return None
+
+        # Numeric values are placed on a numeric axis, others are spread evenly
+        numbers = [parse_parameter_number(row.value) for row in table]
+        is_numeric = all(number is not None for number in numbers)
+        x = numbers if is_numeric else list(range(len(table)))
+
+        has_disk = any(row.disk_read_bytes is not None for row in table)
+        plt.rcParams["figure.figsize"] = (width, height)
+        fig, axes = plt.subplots(1, 3 if has_disk else 2)
+
+        def plot_metric(ax, metric, label, color, divisor = 1, fmt = "-o"):
+            means = [row[metric].mean / divisor if row[metric] is not None else np.nan for row in table]
+            stdevs = [row[metric].stdev / divisor if row[metric] is not None else np.nan for row in table]
+            ax.errorbar(x, means, yerr = stdevs, fmt = fmt, color = color, label = label, capsize = 3)
+
+        plot_metric(axes[0], "execution_time", "Runtime", "tab:red")
+        axes[0].set_ylabel("Runtime (seconds)")
+
+        # Memory is shown in the largest power of 1024 below its highest value
+        memory_max = max([row.memory.max for row in table if row.memory is not None] + [1])
+        scales = ["Bytes", "KB", "MB", "GB", "TB", "PB"]
+        memory_scale = min(int(math.floor(math.log(max(memory_max, 1), 1024))), len(scales) - 1)
+        plot_metric(axes[1], "memory", "Peak memory", "tab:blue", 1024 ** memory_scale, "-s")
+        axes[1].set_ylabel("Peak memory (%s)" % scales[memory_scale])
+
+        if has_disk:
+            plot_metric(axes[2], "disk_read_bytes", "Read", "tab:green", fmt = "-o")
+            plot_metric(axes[2], "disk_write_bytes", "Write", "tab:olive", fmt = "-^")
+            axes[2].set_ylabel("Disk (bytes)")
+            axes[2].legend()
+
+        positive = is_numeric and min(x) > 0
+        for ax in axes:
+            ax.grid()
+            ax.set_xlabel(self.parameter_name)
+            if positive and max(x) / min(x) >= LOG_SCALE_MIN_RATIO:
+                ax.set_xscale("log")
+            if not is_numeric:
+                ax.set_xticks(x)
+                ax.set_xticklabels([format_parameter_value(row.value) for row in table])
+
+        fig.tight_layout()
+        plt.close(fig)
+
+        return fig
@@ -1,4 +1,8 @@
 import time
+import os
+import select
+import threading
+import multiprocessing
 from collections import defaultdict
 import numpy as np
 from beeprint import pp
@@ -66,6 +70,9 @@ class BenchmarkStats:
 
         # Convert to numpy array and flatten
         data = self.__flatten_to_array(data)
+        # Values that are not available in every iteration (NaN, like counters that could not be opened) are left out
+        if data.dtype.kind == "f":
+            data = data[~np.isnan(data)]
 
         if type(data) is np.ndarray:
             if len(data) > 0:
@@ -94,8 +101,150 @@ class BenchmarkStats:
             "min": self.min, "max": self.max
         }
 
-# https://stackoverflow.com/a/5998359
-current_milli_time = lambda: int(round(time.time() * 1000))
+# Standard error of the mean of the values, relative to the mean (infinite when it can't be known yet)
+def relative_standard_error(values):
+    values = np.array(values, dtype = np.float64)
+    if len(values) < 2:
+        return float("inf")
+    standard_error = np.std(values, ddof = 1) / np.sqrt(len(values))
+    mean = abs(np.mean(values))
+    if mean == 0:
+        return 0.0 if standard_error == 0 else float("inf")
+    return float(standard_error / mean)
+
+
+# Exit code from an os.wait*() status, negative signal number if the process was killed
+def exit_code_from_wait_status(wait_status):
+    if os.WIFSIGNALED(wait_status):
+        return -os.WTERMSIG(wait_status)
+    return os.WEXITSTATUS(wait_status)
+
+
+# Monotonic clock in nanoseconds, shared by all processes of the system (CLOCK_MONOTONIC on linux).
+# Unlike time.time(), it is not rounded to milliseconds and does not jump when the system clock is adjusted.
+if hasattr(time, "perf_counter_ns"):
+    current_nano_time = time.perf_counter_ns
+else:
+    # Python 3.6
+    current_nano_time = lambda: int(time.perf_counter() * 1e9)
+
+# Units time series timestamps can be reported in: the timestamps' key and nanoseconds per unit.
+# Timestamps are recorded in nanoseconds and converted to the requested unit in the final results.
+TIME_RESOLUTIONS = {
+    "s": ("sample_seconds", 10 ** 9),
+    "ms": ("sample_milliseconds", 10 ** 6),
+    "us": ("sample_microseconds", 10 ** 3),
+    "ns": ("sample_nanoseconds", 1)
+}
+
+# Nanoseconds timestamps as an int64 array for "ns", or float64 in the given unit
+def convert_sample_nanoseconds(sample_nanoseconds, time_resolution):
+    _, unit_nanoseconds = TIME_RESOLUTIONS[time_resolution]
+    if unit_nanoseconds == 1:
+        return np.array(sample_nanoseconds, dtype = np.int64)
+    return np.array(sample_nanoseconds, dtype = np.float64) / unit_nanoseconds
+
+# Key of a time series' timestamps and nanoseconds per unit of them
+def get_time_series_time_key(time_series):
+    for time_key, unit_nanoseconds in TIME_RESOLUTIONS.values():
+        if time_key in time_series:
+            return time_key, unit_nanoseconds
+    raise Exception("The time series has no timestamps")
+
+# Counters of the whole process tree sampled with the time series, cumulative. The time series has their rates:
+# "<counter>_per_second" is the counter's increase over the interval ending at each sample, per second.
+def get_rate_key(counter_key):
+    return counter_key + "_per_second"
+
+# Rates of the counters sampled at sample_nanoseconds, the counters being at counters_start (zeros by default) at 0.
+# The counters of an exited process move to its parent once the parent reaps it: their sum can dip in between,
+# so the rates follow the highest sum seen so far.
+def get_counter_rates(sample_nanoseconds, counters, counter_keys, counters_start = None):
+    sample_nanoseconds = np.asarray(sample_nanoseconds, dtype = np.int64)
+    intervals = np.diff(sample_nanoseconds, prepend = 0) / 1e9
+    rates = {}
+    for key in counter_keys:
+        counter_start = counters_start[key] if counters_start is not None else 0
+        key_counters = np.maximum.accumulate(np.maximum(np.asarray(counters[key], dtype = np.int64), counter_start)) if len(sample_nanoseconds) > 0 else np.array([], dtype = np.int64)
+        increases = np.diff(key_counters, prepend = counter_start)
+        rates[get_rate_key(key)] = np.divide(increases, intervals, out = np.zeros(len(intervals)), where = intervals > 0)
+    return rates
+
+# Disk counters of the tree (the time series has them unless on macos)
+DISK_SERIES_KEYS = ["read_bytes", "write_bytes", "read_chars", "write_chars"]
+
+def get_disk_rates(sample_nanoseconds, disk_counters, disk_counters_start = None):
+    return get_counter_rates(sample_nanoseconds, disk_counters, DISK_SERIES_KEYS, disk_counters_start)
+
+# Scheduling and memory activity of the tree, with sample_activity: counters the time series has the rates of,
+# and the tree's number of threads and open file descriptors (handles on windows) at every sample
+ACTIVITY_COUNTER_KEYS = ["voluntary_context_switches", "involuntary_context_switches", "minor_faults", "major_faults"]
+ACTIVITY_COUNT_KEYS = ["num_threads", "num_fds"]
+
+
+# Fixed-rate clock for the collectors' sampling loops.
+# Deadlines are laid on a grid from the first tick (start + n * interval) instead of being
+# "interval after the previous sample finished", so the cost of taking a sample does not
+# accumulate as drift. Deadlines that were overrun by a slow sample are skipped rather than
+# fired back to back. An interval of 0 disables sleeping (sample as fast as possible).
+class SampleScheduler():
+    def __init__(self, interval_ms, wake_fd = None):
+        self.interval = interval_ms / 1000
+        # Waiting ends early once this file descriptor (e.g. the target's pidfd) becomes readable
+        self.wake_fd = wake_fd
+        self.start_time = None
+        self.ticks = 0
+        self.skipped_ticks = 0
+
+    # Blocks until the next sample is due. The first call starts the clock and returns immediately.
+    # Returns True when the wait was cut short by the wake file descriptor.
+    def wait(self):
+        now = time.perf_counter()
+        if self.start_time is None:
+            self.start_time = now
+            return False
+
+        self.ticks += 1
+        if self.interval == 0:
+            return wait_readable(self.wake_fd, 0)
+
+        deadline = self.start_time + self.ticks * self.interval
+        if deadline <= now:
+            missed_ticks = int((now - deadline) / self.interval) + 1
+            self.ticks += missed_ticks
+            self.skipped_ticks += missed_ticks
+            deadline += missed_ticks * self.interval
+
+        return wait_readable(self.wake_fd, deadline - now)
+
+
+# A file descriptor that becomes readable when the process exits (linux >= 5.3, python >= 3.9).
+# None when pidfds are not available or the process is already gone.
+def open_pidfd(pid):
+    if not hasattr(os, "pidfd_open"):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except OSError:
+        return None
+
+# Waits up to timeout seconds for fd to become readable, returns whether it did.
+# Without a file descriptor, simply sleeps.
+def wait_readable(fd, timeout):
+    if fd is None:
+        if timeout > 0:
+            time.sleep(timeout)
+        return False
+    readable_fds, _, _ = select.select([fd], [], [], timeout)
+    return len(readable_fds) > 0
+
+
+# CPU time consumed by the calling collector. Collectors run as their own process on unix,
+# but as threads of the benchmarking process on windows, where only the thread's time is theirs.
+def monitor_cpu_time():
+    if multiprocessing.current_process().name == "MainProcess" and hasattr(time, "thread_time"):
+        return time.thread_time()
+    return time.process_time()
 
 
 def iterable(obj):
@@ -0,0 +1,51 @@
+import os
+import sys
+import threading
+import numpy as np
+import pytest
+import cmdbench
+
+THREADS_NUM = 4
+# Runs threads sleeping together, then opens a few files
+COMMAND = ["python3", "-c", "import threading, time\nthreads = [threading.Thread(target = time.sleep, args = (0.3, )) for _ in range(%s)]\n[thread.start() for thread in threads]\n[thread.join() for thread in threads]\nfiles = [open('/dev/null') for _ in range(10)]\ntime.sleep(0.2)" % THREADS_NUM]
+
+@pytest.fixture(scope = "module")
+def iteration():
+    return cmdbench.benchmark_command(COMMAND, sample_activity = True).iterations[0]
+
+def test_time_series_has_the_activity(iteration):
+    time_series = iteration["time_series"]
+    samples_num = len(time_series["sample_milliseconds"])
+    for key in ["voluntary_context_switches_per_second", "involuntary_context_switches_per_second", "minor_faults_per_second", "major_faults_per_second", "num_threads", "num_fds"]:
+        assert len(time_series[key]) == samples_num
+        assert np.all(time_series[key] >= 0)
+    assert time_series["num_threads"].max() == THREADS_NUM + 1
+    assert time_series["num_fds"].max() >= time_series["num_fds"][0] + 10
+    assert time_series["minor_faults_per_second"].max() > 0
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason = "the totals come from the rusage on linux")
+def test_totals_of_the_run(iteration):
+    assert iteration["context_switches"]["voluntary"] >= THREADS_NUM
+    assert iteration["page_faults"]["minor"] > 0
+    # Totals are there whatever the option
+    assert "page_faults" in cmdbench.benchmark_command("true").iterations[0]
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason = "procfs is linux only")
+def test_read_activity():
+    from cmdbench.procfs import read_activity
+    stop = threading.Event()
+    thread = threading.Thread(target = stop.wait)
+    thread.start()
+    try:
+        activity = read_activity(os.getpid())
+        assert activity.num_threads == threading.active_count()
+        assert activity.num_fds == len(os.listdir("/proc/%s/fd" % os.getpid()))
+        assert activity.minor_faults > 0
+        assert activity.voluntary_context_switches > 0
+    finally:
+        stop.set()
+        thread.join()
+
+def test_series_are_left_out_without_the_option():
+    time_series = cmdbench.benchmark_command("true").iterations[0]["time_series"]
+    assert "num_threads" not in time_series
@@ -0,0 +1,14 @@
+import asyncio
+import cmdbench
+
+SLEEP_SECONDS = 0.2
+CONCURRENT_RUNS = 50
+
+# Concurrent runs share the event loop: the runtime of each one should still cover its whole run
+def test_concurrent_runtimes_cover_the_command():
+    async def run_concurrently():
+        return await asyncio.gather(*[cmdbench.benchmark_command_async(["sleep", str(SLEEP_SECONDS)]) for _ in range(CONCURRENT_RUNS)])
+
+    benchmark_results = asyncio.run(run_concurrently())
+    execution_times = [benchmark_result.iterations[0]["process"]["execution_time"] for benchmark_result in benchmark_results]
+    assert min(execution_times) >= SLEEP_SECONDS
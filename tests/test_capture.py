@@ -0,0 +1,51 @@
+import pytest
+import cmdbench
+from cmdbench.capture import parse_capture_mode
+
+# 3 lines of 100000 bytes each, on stdout
+COMMAND = "python3 -c \"import sys; [sys.stdout.write('x' * 99999 + '\\n') for _ in range(3)]\""
+OUTPUT_BYTES = 300000
+
+def run_process_section(**options):
+    return cmdbench.benchmark_command(COMMAND, **options).iterations[0]["process"]
+
+def test_parse_capture_mode():
+    assert parse_capture_mode("keep") == ("keep", None)
+    assert parse_capture_mode("tail:2") == ("tail", 2048)
+    assert parse_capture_mode("tail:0.5") == ("tail", 512)
+    assert parse_capture_mode("file:out.txt") == ("file", "out.txt")
+    for mode in ["tail:", "tail:0", "tail:abc", "file:", "keeps", None]:
+        with pytest.raises(Exception):
+            parse_capture_mode(mode)
+
+def test_keep():
+    process = run_process_section()
+    assert process["stdout_data"] == ("x" * 99999 + "\n") * 3
+    assert process["stdout_bytes"] == OUTPUT_BYTES
+    assert process["stdout_lines"] == 3
+    assert process["stderr_bytes"] == 0
+
+def test_discard_still_counts_the_output():
+    process = run_process_section(stdout_capture = "discard")
+    assert process["stdout_data"] is None
+    assert process["stdout_bytes"] == OUTPUT_BYTES
+    assert process["stdout_lines"] == 3
+
+# The output is larger than the tail, which keeps only the last kilobytes of it
+def test_tail_keeps_only_the_end_of_the_output():
+    process = run_process_section(stdout_capture = "tail:1")
+    assert process["stdout_data"] == "x" * 1023 + "\n"
+    assert process["stdout_bytes"] == OUTPUT_BYTES
+
+def test_file_writes_the_output_to_disk(tmp_path):
+    output_path = tmp_path / "stdout.txt"
+    process = run_process_section(stdout_capture = "file:%s" % output_path)
+    assert process["stdout_data"] is None
+    assert output_path.read_bytes() == (b"x" * 99999 + b"\n") * 3
+    assert process["stdout_bytes"] == OUTPUT_BYTES
+
+def test_callable_gets_every_chunk():
+    chunks = []
+    process = run_process_section(stdout_capture = chunks.append)
+    assert process["stdout_data"] is None
+    assert b"".join(chunks) == (b"x" * 99999 + b"\n") * 3
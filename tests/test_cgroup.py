@@ -0,0 +1,33 @@
+import os
+import sys
+import pytest
+import cmdbench
+from cmdbench.core import check_cgroup_support
+from cmdbench.cgroup import find_cgroup2_mount, get_own_cgroup
+
+# Commands join their cgroup between fork and exec, which isn't done with the jobs' threads around
+def test_cgroup_can_not_be_used_with_jobs():
+    with pytest.raises(Exception, match = "concurrent jobs"):
+        cmdbench.benchmark_command("true", iterations_num = 2, jobs = 2, cgroup = True)
+    with pytest.raises(Exception, match = "concurrent jobs"):
+        cmdbench.sweep_command("sleep {seconds}", "seconds", [0, 0], jobs = 2, cgroup = True)
+
+def get_cgroup_state():
+    cgroup_mount = find_cgroup2_mount()
+    own_cgroup = get_own_cgroup()
+    if cgroup_mount is None or own_cgroup is None:
+        return None
+    own_path = os.path.join(cgroup_mount, own_cgroup.lstrip("/"))
+    with open(os.path.join(own_path, "cgroup.subtree_control")) as subtree_control_file:
+        return own_cgroup, sorted(os.listdir(own_path)), subtree_control_file.read()
+
+# Only use_supervisor_cgroup moves cmdbench, checking for support and benchmarking leave its cgroup as it is
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason = "cgroups are linux only")
+def test_cgroup_support_check_changes_nothing():
+    cgroup_state = get_cgroup_state()
+    check_cgroup_support()
+    assert get_cgroup_state() == cgroup_state
+    cmdbench.benchmark_command("true", cgroup = True)
+    if cgroup_state is not None:
+        # Benchmarking may enable controllers for the benchmark cgroups, but doesn't move cmdbench
+        assert get_cgroup_state()[:2] == cgroup_state[:2]
@@ -0,0 +1,12 @@
+from click.testing import CliRunner
+from cmdbench.cli import cli
+
+def test_compare_takes_commands_after_double_dash():
+    result = CliRunner().invoke(cli, ["compare", "-i", "2", "--", "true", "sleep 0.01"])
+    assert result.exit_code == 0, result.output
+
+# After a leading "--", a command named like a subcommand is benchmarked
+def test_leading_double_dash_forces_the_default_command():
+    result = CliRunner().invoke(cli, ["--", "compare", "true", "true"])
+    assert isinstance(result.exception, FileNotFoundError)
+    assert result.exception.filename == "compare"
@@ -0,0 +1,36 @@
+import sys
+import numpy as np
+import pytest
+import cmdbench
+from cmdbench.utils import get_disk_rates
+
+WRITTEN_BYTES = 20 * 1024 * 1024
+
+def test_rates_over_the_sampling_intervals():
+    sample_nanoseconds = [500000000, 1000000000, 2000000000]
+    disk_counters = {"read_bytes": [100, 300, 300], "write_bytes": [0, 0, 50], "read_chars": [0, 0, 0], "write_chars": [10, 20, 30]}
+    disk_rates = get_disk_rates(sample_nanoseconds, disk_counters)
+    assert disk_rates["read_bytes_per_second"].tolist() == [200, 400, 0]
+    assert disk_rates["write_bytes_per_second"].tolist() == [0, 0, 50]
+    assert disk_rates["write_chars_per_second"].tolist() == [20, 20, 10]
+
+# A child's counters leave the sum when it exits and come back once its parent reaped it: they are not counted twice
+def test_rates_follow_the_highest_sum():
+    disk_counters = {key: [100, 40, 100, 150] for key in ["read_bytes", "write_bytes", "read_chars", "write_chars"]}
+    disk_rates = get_disk_rates([1000000000, 2000000000, 3000000000, 4000000000], disk_counters)
+    assert disk_rates["read_bytes_per_second"].tolist() == [100, 0, 0, 50]
+
+def test_rates_start_from_the_given_counters():
+    disk_counters = {key: [1500] for key in ["read_bytes", "write_bytes", "read_chars", "write_chars"]}
+    disk_counters_start = {key: 1000 for key in ["read_bytes", "write_bytes", "read_chars", "write_chars"]}
+    assert get_disk_rates([1000000000], disk_counters, disk_counters_start)["read_chars_per_second"].tolist() == [500]
+    assert get_disk_rates([], {key: [] for key in disk_counters})["read_chars_per_second"].tolist() == []
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason = "write_chars is only counted on linux")
+def test_written_chars_add_up_to_the_bytes_written(tmp_path):
+    # The command sleeps after writing so it is sampled again once the write is done
+    command = ["python3", "-c", "import time; open(%r, 'wb').write(bytes(%s)); time.sleep(0.3)" % (str(tmp_path / "output.bin"), WRITTEN_BYTES)]
+    time_series = cmdbench.benchmark_command(command).iterations[0]["time_series"]
+    intervals = np.diff(time_series["sample_milliseconds"], prepend = 0) / 1000
+    written_chars = np.sum(time_series["write_chars_per_second"] * intervals)
+    assert WRITTEN_BYTES - 1 <= written_chars < WRITTEN_BYTES + 1024 * 1024
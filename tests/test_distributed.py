@@ -0,0 +1,97 @@
+import subprocess
+import sys
+import time
+import pytest
+import cmdbench
+from cmdbench.distributed import run_distributed, get_authkey, parse_worker_address, format_worker_address, get_worker_options
+
+AUTHKEY = "test-key"
+
+# Starts a worker listening on a unix socket in a process of its own
+def start_worker(socket_path):
+    worker_process = subprocess.Popen([sys.executable, "-c", "from cmdbench.distributed import run_worker; run_worker(%r, %r)" % ("unix:%s" % socket_path, AUTHKEY)], stdout = subprocess.DEVNULL)
+    for _ in range(500):
+        if socket_path.exists():
+            return worker_process
+        time.sleep(0.02)
+    worker_process.kill()
+    raise Exception("The worker did not start listening")
+
+# Two workers, as their addresses and processes
+def start_workers(directory):
+    socket_paths = [directory / ("worker%s.sock" % worker_index) for worker_index in range(2)]
+    worker_processes = [start_worker(socket_path) for socket_path in socket_paths]
+    return ["unix:%s" % socket_path for socket_path in socket_paths], worker_processes
+
+def stop_workers(worker_processes):
+    for worker_process in worker_processes:
+        worker_process.kill()
+        worker_process.wait()
+
+# Workers serve one coordinator after the other, so the tests share them
+@pytest.fixture(scope = "module")
+def workers(tmp_path_factory):
+    worker_addresses, worker_processes = start_workers(tmp_path_factory.mktemp("workers"))
+    yield worker_addresses
+    stop_workers(worker_processes)
+
+def test_worker_addresses():
+    assert parse_worker_address("example.com:4000") == ("example.com", 4000)
+    assert parse_worker_address(":4000") == ("127.0.0.1", 4000)
+    assert parse_worker_address("unix:/tmp/worker.sock") == "/tmp/worker.sock"
+    assert parse_worker_address("./worker.sock") == "./worker.sock"
+    assert format_worker_address(("example.com", 4000)) == "example.com:4000"
+    assert format_worker_address("/tmp/worker.sock") == "unix:/tmp/worker.sock"
+    with pytest.raises(Exception):
+        parse_worker_address("example.com")
+
+def test_authkey(monkeypatch):
+    monkeypatch.delenv("CMDBENCH_AUTHKEY", raising = False)
+    with pytest.raises(Exception):
+        get_authkey()
+    monkeypatch.setenv("CMDBENCH_AUTHKEY", "from-env")
+    assert get_authkey() == b"from-env"
+    assert get_authkey("given") == b"given"
+
+def test_options_workers_can_not_run_with():
+    with pytest.raises(Exception, match = "jobs option can not be used"):
+        get_worker_options(1, "ms", 0, {"jobs": 2})
+
+def test_iterations_are_spread_over_the_workers(workers):
+    worker_addresses = workers
+    benchmark_results = cmdbench.benchmark_command_distributed("sleep 0.1", worker_addresses, iterations_num = 6, authkey = AUTHKEY)
+
+    assert len(benchmark_results.iterations) == 6
+    assert all(iteration["process"]["exit_code"] == 0 for iteration in benchmark_results.iterations)
+    assert set(iteration["host"]["worker"] for iteration in benchmark_results.iterations) == set(worker_addresses)
+
+def test_sweep_over_the_workers(workers):
+    worker_addresses = workers
+    sweep_results = cmdbench.sweep_command_distributed("echo {value}", "value", ["a", "b", "c"], worker_addresses, iterations_num = 2, authkey = AUTHKEY)
+    for value, benchmark_results in zip(["a", "b", "c"], sweep_results.benchmark_results):
+        assert [iteration["process"]["stdout_data"] for iteration in benchmark_results.iterations] == [value + "\n"] * 2
+
+def test_errors_on_the_worker_are_raised(workers):
+    worker_addresses = workers
+    with pytest.raises(Exception, match = "prepare command failed"):
+        cmdbench.benchmark_command_distributed("true", worker_addresses, authkey = AUTHKEY, prepare = "exit 1")
+
+def test_wrong_authkey_is_refused(workers):
+    worker_addresses = workers
+    with pytest.raises(Exception, match = "Can not connect to the worker"):
+        cmdbench.benchmark_command_distributed("true", worker_addresses, authkey = "wrong-key")
+
+# The runs of a worker that goes away are done by the other one
+def test_runs_of_a_lost_worker_are_requeued(tmp_path):
+    worker_addresses, worker_processes = start_workers(tmp_path)
+    runs = [("sleep 0.2", iteration_index) for iteration_index in range(6)]
+    options = get_worker_options(len(runs), "ms", 0, {})
+    run_indices = []
+    try:
+        for run_index, raw_benchmark_result in run_distributed(runs, worker_addresses, AUTHKEY, options, 0):
+            if len(run_indices) == 0:
+                worker_processes[0].kill()
+            run_indices.append(run_index)
+    finally:
+        stop_workers(worker_processes)
+    assert sorted(run_indices) == list(range(6))
@@ -0,0 +1,55 @@
+import os
+import pytest
+import cmdbench
+from cmdbench.hooks import IterationHooks, find_cache_inputs, split_by_cache_state, fadvise_available
+
+def test_prepare_and_cleanup_run_around_every_iteration(tmp_path):
+    calls = []
+    # The prepare hook creates the file the command reads, the cleanup hook removes it
+    input_path = tmp_path / "input.txt"
+    def prepare():
+        calls.append("prepare")
+        input_path.write_text("data")
+    def cleanup():
+        calls.append("cleanup")
+        input_path.unlink()
+
+    benchmark_results = cmdbench.benchmark_command("cat %s" % input_path, iterations_num = 3, prepare = prepare, cleanup = cleanup)
+    assert calls == ["prepare", "cleanup"] * 3
+    assert [iteration["process"]["exit_code"] for iteration in benchmark_results.iterations] == [0, 0, 0]
+    assert all(iteration["process"]["stdout_data"] == "data" for iteration in benchmark_results.iterations)
+    assert "cache" not in benchmark_results.iterations[0]
+
+def test_failing_prepare_command_fails_the_benchmark():
+    with pytest.raises(Exception, match = "prepare command failed with exit code 3: oops"):
+        cmdbench.benchmark_command("true", prepare = "echo oops; exit 3")
+
+def test_unknown_cache_state():
+    with pytest.raises(Exception):
+        IterationHooks(cache = "hot")
+
+def test_find_cache_inputs(tmp_path):
+    (tmp_path / "data").mkdir()
+    for name in ["data/b.txt", "data/a.txt", "c.bin"]:
+        (tmp_path / name).write_text(name)
+    paths = find_cache_inputs([str(tmp_path / "data"), str(tmp_path / "**" / "*.txt"), str(tmp_path / "*.bin")])
+    # Directories include their files, files matched twice are listed once
+    assert paths == [str(tmp_path / name) for name in ["data/a.txt", "data/b.txt", "c.bin"]]
+
+@pytest.mark.skipif(not fadvise_available, reason = "posix_fadvise is not available")
+def test_both_alternates_cold_and_warm_iterations(tmp_path):
+    input_path = tmp_path / "input.bin"
+    input_path.write_bytes(os.urandom(1024 * 1024))
+    benchmark_results = cmdbench.benchmark_command("cat %s" % input_path, iterations_num = 4, stdout_capture = "discard", cache = "both", cache_inputs = [str(input_path)])
+
+    assert [iteration["cache"] for iteration in benchmark_results.iterations] == [{"state": "cold", "files": 1}, {"state": "warm", "files": 1}] * 2
+    results_per_state = split_by_cache_state(benchmark_results)
+    assert sorted(results_per_state.keys()) == ["cold", "warm"]
+    assert len(results_per_state["cold"].iterations) == 2
+    assert len(results_per_state["warm"].iterations) == 2
+
+# Missing inputs are an error, the whole page cache is only dropped when no inputs were given
+@pytest.mark.skipif(not fadvise_available, reason = "posix_fadvise is not available")
+def test_cold_cache_inputs_matching_no_files_fail(tmp_path):
+    with pytest.raises(Exception, match = "No files match the cache inputs to evict"):
+        cmdbench.benchmark_command("true", cache = "cold", cache_inputs = [str(tmp_path / "missing*")])
@@ -0,0 +1,50 @@
+import pytest
+import cmdbench
+from cmdbench.limits import ResourceLimits, parse_memory_size
+
+# Allocates 1 MB per millisecond and keeps it, up to 1 GB
+ALLOCATING_COMMAND = "python3 -c \"import time; chunks = [(bytearray(1024 * 1024), time.sleep(0.001)) for _ in range(1024)]; time.sleep(10)\""
+SPINNING_COMMAND = "python3 -c \"while True: pass\""
+
+def get_limits_section(benchmark_results):
+    return benchmark_results.iterations[0]["limits"]
+
+def test_parse_memory_size():
+    assert parse_memory_size(1048576) == 1048576
+    assert parse_memory_size("512K") == 512 * 1024
+    assert parse_memory_size("1.5m") == 1.5 * 1024 ** 2
+    assert parse_memory_size("2G") == 2 * 1024 ** 3
+    with pytest.raises(Exception):
+        parse_memory_size("lots")
+
+def test_invalid_limits():
+    for limits_options in [{"timeout": 0}, {"memory_limit": -1}, {"cpu_limit": 0}, {"limit_signal": "SIGINT"}, {"limit_grace_period": -1}]:
+        with pytest.raises(Exception):
+            ResourceLimits(**limits_options)
+
+def test_timeout_keeps_the_partial_results():
+    benchmark_results = cmdbench.benchmark_command("sh -c \"echo started; sleep 10\"", timeout = 0.5)
+    assert get_limits_section(benchmark_results) == {"terminated_by_limit": True, "limit_reason": "timeout"}
+    process = benchmark_results.iterations[0]["process"]
+    assert 0.5 <= process["execution_time"] < 5
+    assert process["stdout_data"] == "started\n"
+
+def test_command_ignoring_sigterm_is_killed_after_the_grace_period():
+    benchmark_results = cmdbench.benchmark_command("sh -c \"trap '' TERM; sleep 10\"", timeout = 0.2, limit_grace_period = 0.5)
+    assert get_limits_section(benchmark_results)["limit_reason"] == "timeout"
+    assert 0.7 <= benchmark_results.iterations[0]["process"]["execution_time"] < 5
+
+def test_memory_limit():
+    benchmark_results = cmdbench.benchmark_command(ALLOCATING_COMMAND, memory_limit = 100 * 1024 ** 2, limit_signal = "SIGKILL")
+    assert get_limits_section(benchmark_results) == {"terminated_by_limit": True, "limit_reason": "memory"}
+    assert benchmark_results.iterations[0]["memory"]["max"] >= 100 * 1024 ** 2
+
+def test_cpu_limit():
+    benchmark_results = cmdbench.benchmark_command(SPINNING_COMMAND, cpu_limit = 0.3, timeout = 10)
+    assert get_limits_section(benchmark_results) == {"terminated_by_limit": True, "limit_reason": "cpu"}
+    assert benchmark_results.iterations[0]["cpu"]["total_time"] >= 0.3
+
+def test_command_within_its_limits():
+    benchmark_results = cmdbench.benchmark_command("true", timeout = 10, memory_limit = 1024 ** 3, cpu_limit = 10)
+    assert get_limits_section(benchmark_results) == {"terminated_by_limit": False, "limit_reason": None}
+    assert benchmark_results.iterations[0]["process"]["exit_code"] == 0
@@ -0,0 +1,21 @@
+import cmdbench
+
+# Exits before the collectors get to take a sample
+SHORT_COMMAND = ["true"]
+
+def test_short_commands_are_monitored(capsys):
+    with cmdbench.BenchmarkMonitor() as monitor:
+        iterations = [cmdbench.benchmark_command(SHORT_COMMAND, monitor = monitor).iterations[0] for _ in range(20)]
+    assert "ended before" not in capsys.readouterr().out
+    for iteration in iterations:
+        assert iteration["memory"]["max"] > 0
+        assert iteration["memory"]["max_perprocess"] > 0
+    # A single run can take less than the CPU time's resolution
+    assert sum(iteration["cpu"]["total_time"] for iteration in iterations) > 0
+
+def test_monitor_is_reused_after_a_short_command():
+    with cmdbench.BenchmarkMonitor() as monitor:
+        cmdbench.benchmark_command(SHORT_COMMAND, monitor = monitor)
+        iteration = cmdbench.benchmark_command(["python3", "-c", "sum(range(10 ** 7))"], monitor = monitor).iterations[0]
+    assert iteration["cpu"]["total_time"] > 0
+    assert len(iteration["time_series"]["sample_milliseconds"]) > 0
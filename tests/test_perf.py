@@ -0,0 +1,63 @@
+import errno
+import math
+import pytest
+import cmdbench
+from cmdbench import perf
+from cmdbench.perf import PerfCounters, PerfCounterError
+
+COMMAND = ["python3", "-c", "sum(range(10 ** 6))"]
+
+@pytest.fixture(autouse = True)
+def require_perf_counters():
+    perf_counters = PerfCounters()
+    try:
+        perf_counters.open()
+    except PerfCounterError as error:
+        pytest.skip("perf_event_open is not available: %s" % error)
+    finally:
+        perf_counters.close()
+
+# Hardware events fail as they do without a PMU
+def fail_hardware_events(monkeypatch):
+    perf_event_open = perf.perf_event_open
+    def perf_event_open_without_pmu(event_type, config, exclude_kernel):
+        if event_type == perf.PERF_TYPE_HARDWARE:
+            raise OSError(errno.ENOENT, "No such file or directory")
+        return perf_event_open(event_type, config, exclude_kernel)
+    monkeypatch.setattr(perf, "perf_event_open", perf_event_open_without_pmu)
+
+def test_counters_that_can_not_be_opened_are_nan(monkeypatch):
+    fail_hardware_events(monkeypatch)
+    benchmark_results = cmdbench.benchmark_command(COMMAND, iterations_num = 2, counters = True)
+    for iteration in benchmark_results.iterations:
+        counters = iteration["counters"]
+        assert counters["events"] == "software"
+        for key in ["instructions", "cycles", "cache_misses", "branch_misses", "instructions_per_cycle"]:
+            assert math.isnan(counters[key])
+        assert counters["task_clock"] > 0
+
+    statistics = benchmark_results.get_statistics()
+    assert statistics["counters"]["task_clock"].mean > 0
+    assert statistics["counters"]["instructions"].mean is None
+    assert math.isnan(benchmark_results.get_averages()["counters"]["instructions"])
+
+# An iteration whose counters could not be opened at all has the same keys as the others
+def test_counters_failing_in_one_iteration(monkeypatch):
+    opened_counters = []
+    open_counters = PerfCounters.open
+    def open_all_but_the_second(self):
+        opened_counters.append(self)
+        if len(opened_counters) == 2:
+            raise PerfCounterError("perf_event_open failed: Permission denied")
+        open_counters(self)
+    monkeypatch.setattr(PerfCounters, "open", open_all_but_the_second)
+
+    benchmark_results = cmdbench.benchmark_command(COMMAND, iterations_num = 3, counters = True)
+    events = [iteration["counters"]["events"] for iteration in benchmark_results.iterations]
+    assert events[1] == "none" and events[0] == events[2] != "none"
+    assert math.isnan(benchmark_results.iterations[1]["counters"]["task_clock"])
+
+    task_clock_statistics = benchmark_results.get_statistics()["counters"]["task_clock"]
+    assert len(task_clock_statistics.data) == 2
+    assert task_clock_statistics.mean > 0
+    assert benchmark_results.get_averages()["counters"]["task_clock"] > 0
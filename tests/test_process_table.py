@@ -0,0 +1,39 @@
+from cmdbench.process_table import ProcessTable
+
+# Stands in for a psutil.Process
+class FakeProcess():
+    def __init__(self, pid, create_time):
+        self.pid = pid
+        self._create_time = create_time
+
+    def create_time(self):
+        return self._create_time
+
+def test_same_process_keeps_its_entry():
+    process_table = ProcessTable()
+    entry = process_table.get_entry(FakeProcess(10, 1.0))
+    entry.cpu_times = (0.5, 0.1)
+    assert process_table.get_entry(FakeProcess(10, 1.0)) is entry
+    assert process_table.all_entries() == [entry]
+
+def test_reused_pid_gets_a_new_entry():
+    process_table = ProcessTable()
+    old_entry = process_table.get_entry(FakeProcess(10, 1.0))
+    old_entry.cpu_times = (0.5, 0.1)
+    new_entry = process_table.get_entry(FakeProcess(10, 2.0))
+
+    assert new_entry is not old_entry
+    assert new_entry.cpu_times is None
+    assert process_table.entries == {10: new_entry}
+    # The exited process keeps the last values read for it
+    assert process_table.exited_entries == [old_entry]
+    assert old_entry.cpu_times == (0.5, 0.1)
+
+def test_prune_moves_processes_that_left_the_tree():
+    process_table = ProcessTable()
+    entries = [process_table.get_entry(FakeProcess(pid, 1.0)) for pid in [10, 11, 12]]
+    process_table.prune({11})
+
+    assert list(process_table.entries.values()) == [entries[1]]
+    assert process_table.exited_entries == [entries[0], entries[2]]
+    assert sorted(entry.pid for entry in process_table.all_entries()) == [10, 11, 12]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import cmdbench
+
+ALLOCATION_BYTES = 50 * 1024 * 1024
+# A shell starting a process allocating memory and a shorter one next to it
+COMMAND = "sh -c \"python3 -c 'x = bytearray(%s); import time; time.sleep(0.5)' & sleep 0.2; wait\"" % ALLOCATION_BYTES
+
+@pytest.fixture(scope = "module")
+def benchmark_results():
+    return cmdbench.benchmark_command(COMMAND, per_process = True)
+
+def test_every_process_of_the_tree_is_recorded(benchmark_results):
+    processes = benchmark_results.iterations[0]["processes"]
+    assert len(processes["pid"]) == 3
+    # The shell is the only process whose parent is not in the tree, both others are its children
+    shell_pid = processes["pid"][~np.isin(processes["ppid"], processes["pid"])]
+    assert len(shell_pid) == 1
+    children_cmdlines = sorted(processes["cmdline"][processes["ppid"] == shell_pid[0]].tolist())
+    assert len(children_cmdlines) == 2
+    assert children_cmdlines[0].startswith("python3 -c") and children_cmdlines[1] == "sleep 0.2"
+    for key in ["pid", "ppid", "cmdline", "start_time", "exit_time", "cpu_time", "memory_max"]:
+        assert len(processes[key]) == 3
+    assert np.all(processes["exit_time"] >= processes["start_time"])
+
+def test_samples_of_every_process(benchmark_results):
+    processes = benchmark_results.iterations[0]["processes"]
+    samples = processes["samples"]
+    assert len(samples["sample_milliseconds"]) > 0
+    assert set(samples["process_index"].tolist()) == {0, 1, 2}
+    # The peak memory of each process is the highest of its samples
+    for process_index in range(3):
+        assert samples["memory_bytes"][samples["process_index"] == process_index].max() == processes["memory_max"][process_index]
+
+def test_top_processes(benchmark_results):
+    top_process = benchmark_results.get_top_processes(1)[0]
+    assert top_process.cmdline.startswith("python3 -c")
+    assert top_process.memory_max >= ALLOCATION_BYTES
+    top_processes = benchmark_results.get_top_processes(count = 3, sort_by = "cpu_time")
+    assert [process.cpu_time for process in top_processes] == sorted([process.cpu_time for process in top_processes], reverse = True)
+
+def test_statistics_leave_the_processes_out(benchmark_results):
+    assert "processes" not in benchmark_results.get_statistics()
+
+def test_iterations_without_records():
+    with pytest.raises(Exception, match = "per_process"):
+        cmdbench.benchmark_command("true").get_top_processes()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import time
+import subprocess
+import sys
+import pytest
+import psutil
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason = "procfs is linux only")
+
+if sys.platform.startswith("linux"):
+    from cmdbench.procfs import ProcfsProcess, _split_stat, STAT_STATE, STAT_PPID, STAT_STARTTIME
+
+def test_split_stat_with_parentheses_in_the_command_name():
+    stat_data = b"1234 (a) b (c)) S 1 1234 1234 0 -1 4194304 95 0 0 0 0 0 0 0 20 0 1 0 5678 2 3\n"
+    stat = _split_stat(stat_data)
+    assert stat[STAT_STATE] == b"S"
+    assert stat[STAT_PPID] == b"1"
+    assert stat[STAT_STARTTIME] == b"5678"
+
+@pytest.fixture
+def sleeping_process(tmp_path):
+    # The kernel keeps the executable's name as the command name in /proc/<pid>/stat
+    executable = tmp_path / "sl) ee (p"
+    shutil.copy(shutil.which("sleep"), executable)
+    process = subprocess.Popen([str(executable), "10"])
+    yield process
+    process.kill()
+    process.wait()
+
+def test_process_matches_psutil(sleeping_process):
+    procfs_process = ProcfsProcess(sleeping_process.pid)
+    psutil_process = psutil.Process(sleeping_process.pid)
+    try:
+        assert procfs_process.is_running()
+        assert procfs_process.memory_info().rss == psutil_process.memory_info().rss
+        assert procfs_process.cpu_times().user == pytest.approx(psutil_process.cpu_times().user, abs = 0.02)
+        assert procfs_process.cpu_percent() == 0.0
+    finally:
+        procfs_process.close()
+
+def test_process_is_not_running_once_it_exited(sleeping_process):
+    procfs_process = ProcfsProcess(sleeping_process.pid)
+    try:
+        sleeping_process.kill()
+        os.waitid(os.P_PID, sleeping_process.pid, os.WEXITED | os.WNOWAIT)
+        # A zombie still has its /proc files but doesn't run anymore
+        assert not procfs_process.is_running()
+        sleeping_process.wait()
+        assert not procfs_process.is_running()
+        with pytest.raises(psutil.NoSuchProcess):
+            procfs_process.cpu_times()
+    finally:
+        procfs_process.close()
+
+def test_recursive_children():
+    process = subprocess.Popen(["sh", "-c", "sleep 10 & sleep 10 & wait"])
+    procfs_process = ProcfsProcess(process.pid)
+    try:
+        psutil_process = psutil.Process(process.pid)
+        while len(psutil_process.children(recursive = True)) < 2:
+            time.sleep(0.01)
+        expected_pids = sorted(child.pid for child in psutil_process.children(recursive = True))
+        assert sorted(child.pid for child in procfs_process.children(recursive = True)) == expected_pids
+    finally:
+        for child in psutil.Process(process.pid).children(recursive = True):
+            child.kill()
+        process.kill()
+        process.wait()
+        procfs_process.close_tree()
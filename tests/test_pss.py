@@ -0,0 +1,41 @@
+import os
+import sys
+import pytest
+import psutil
+import cmdbench
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason = "PSS accounting is linux only")
+
+if sys.platform.startswith("linux"):
+    from cmdbench.procfs import read_proportional_memory
+
+SHARED_BYTES = 64 * 1024 * 1024
+WORKERS_NUM = 3
+# Touches a buffer, then forks workers sharing its pages (copy on write) with it
+SHARING_COMMAND = ["python3", "-c", "import os, time\nbuffer = bytearray(b'x' * %s)\nfor _ in range(%s):\n    if os.fork() == 0:\n        time.sleep(0.5)\n        os._exit(0)\nfor _ in range(%s):\n    os.wait()" % (SHARED_BYTES, WORKERS_NUM, WORKERS_NUM)]
+
+def test_read_proportional_memory():
+    pss, uss = read_proportional_memory(os.getpid())
+    memory_full_info = psutil.Process().memory_full_info()
+    assert 0 < uss <= pss <= memory_full_info.rss
+    with pytest.raises(psutil.NoSuchProcess):
+        read_proportional_memory(2 ** 22 + 1)
+
+# Shared pages count once per process in the RSS sum but once in total in the PSS sum
+def test_shared_pages_are_counted_once():
+    memory = cmdbench.benchmark_command(SHARING_COMMAND, memory_accounting = "pss", sample_interval_ms = 20).iterations[0]["memory"]
+    assert memory["max_rss"] >= (WORKERS_NUM + 1) * SHARED_BYTES
+    assert SHARED_BYTES <= memory["max"] < 2 * SHARED_BYTES
+    assert memory["max_pss"] == memory["max"]
+    assert memory["max_uss"] < memory["max"]
+
+def test_time_series_has_the_pss():
+    time_series = cmdbench.benchmark_command(SHARING_COMMAND, memory_accounting = "pss", pss_sample_every = 1).iterations[0]["time_series"]
+    assert len(time_series["pss_bytes"]) == len(time_series["memory_bytes"]) == len(time_series["uss_bytes"])
+    assert time_series["pss_bytes"].max() < time_series["memory_bytes"].max()
+
+def test_invalid_accounting():
+    with pytest.raises(Exception):
+        cmdbench.benchmark_command("true", memory_accounting = "vss")
+    with pytest.raises(Exception):
+        cmdbench.benchmark_command("true", memory_accounting = "pss", pss_sample_every = 0)
@@ -0,0 +1,75 @@
+import pickle
+import numpy as np
+import pytest
+from cmdbench.shared import SampleRing, SharedBenchmarkState, shared_memory_available
+
+COLUMNS = {"time": np.float64, "value": np.int64}
+
+@pytest.fixture(params = [True, False], ids = ["shared", "private"])
+def ring(request):
+    sample_ring = SampleRing(COLUMNS, capacity = 4, shared = request.param)
+    yield sample_ring
+    sample_ring.unlink()
+    sample_ring.close()
+
+def test_empty_ring(ring):
+    assert len(ring) == 0
+    arrays = ring.to_arrays()
+    assert len(arrays["time"]) == 0 and arrays["value"].dtype == np.int64
+
+# 4 + 8 + 16 rows fill three chunks, the last row starts a fourth
+def test_ring_grows_past_its_first_chunk(ring):
+    rows_count = 4 + 8 + 16 + 1
+    for row_index in range(rows_count):
+        ring.append((row_index / 10, row_index))
+        assert len(ring) == row_index + 1
+
+    assert len(ring) == rows_count
+    arrays = ring.to_arrays()
+    assert arrays["value"].tolist() == list(range(rows_count))
+    assert np.allclose(arrays["time"], np.arange(rows_count) / 10)
+
+def test_reset_empties_the_ring(ring):
+    for row_index in range(6):
+        ring.append((0.0, row_index))
+    ring.reset()
+    assert len(ring) == 0
+    ring.append((0.0, 42))
+    assert ring.to_arrays()["value"].tolist() == [42]
+
+# A reader attached by name sees the chunks the writer created after the reader attached
+@pytest.mark.skipif(not shared_memory_available, reason = "shared memory needs python >= 3.8")
+def test_attached_reader_sees_the_grown_chunks():
+    writer = SampleRing(COLUMNS, capacity = 2)
+    reader = pickle.loads(pickle.dumps(writer))
+    try:
+        for row_index in range(11):
+            writer.append((0.0, row_index))
+        assert len(reader) == 11
+        assert reader.to_arrays()["value"].tolist() == list(range(11))
+    finally:
+        reader.close()
+        writer.unlink()
+        writer.close()
+
+def test_state_fields_keep_their_types():
+    state = SharedBenchmarkState({"pid": -1, "done": False, "start": 0.0})
+    try:
+        assert state["pid"] == -1 and state["done"] is False and state["start"] == 0.0
+        state["pid"] = 1234
+        state["done"] = True
+        state["start"] = 1.5
+        assert state["pid"] == 1234 and state["done"] is True and state["start"] == 1.5
+
+        if shared_memory_available:
+            attached_state = pickle.loads(pickle.dumps(state))
+            assert attached_state["pid"] == 1234 and attached_state["done"] is True
+            attached_state["pid"] = 5678
+            assert state["pid"] == 5678
+            attached_state.close()
+
+        state.reset()
+        assert state["pid"] == -1 and state["done"] is False
+    finally:
+        state.unlink()
+        state.close()
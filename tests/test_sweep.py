@@ -0,0 +1,37 @@
+import pytest
+import cmdbench
+from cmdbench.sweep import get_scan_values, parse_parameter_number, format_parameter_value, get_sweep_commands
+
+def test_scan_values():
+    assert get_scan_values(1, 4) == [1, 2, 3, 4]
+    assert get_scan_values(4, 1) == [4, 3, 2, 1]
+    assert get_scan_values(0, 10, 4) == [0, 4, 8]
+    # Floating point steps give the values they would be written as
+    assert get_scan_values(0.1, 0.3, 0.1) == [0.1, 0.2, 0.3]
+    with pytest.raises(Exception):
+        get_scan_values(1, 4, 0)
+
+def test_parse_parameter_number():
+    assert parse_parameter_number("10") == 10
+    assert parse_parameter_number("10k") == 10000
+    assert parse_parameter_number(" 1.5M ") == 1.5e6
+    assert parse_parameter_number("2g") == 2e9
+    assert parse_parameter_number(3) == 3
+    assert parse_parameter_number("fast") is None
+    assert parse_parameter_number("k") is None
+
+def test_sweep_commands():
+    assert format_parameter_value(0.30000000000000004) == "0.3"
+    assert get_sweep_commands("sort -S {buffer} data.txt", "buffer", ["1M", 0.5]) == ["sort -S 1M data.txt", "sort -S 0.5 data.txt"]
+    with pytest.raises(Exception):
+        get_sweep_commands("sort data.txt", "buffer", ["1M"])
+    with pytest.raises(Exception):
+        get_sweep_commands("sort -S {buffer} data.txt", "buffer", [])
+
+def test_sweep_table():
+    sweep_results = cmdbench.sweep_command("sleep {seconds}", "seconds", [0.01, 0.05], iterations_num = 2)
+    table = sweep_results.get_table()
+    assert [row.value for row in table] == [0.01, 0.05]
+    assert [row.command for row in table] == ["sleep 0.01", "sleep 0.05"]
+    assert [row.runs for row in table] == [2, 2]
+    assert table[1].execution_time.mean > table[0].execution_time.mean